@@ -1,9 +1,18 @@
 import json
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+import logging
 import os
 from datetime import datetime
+import lazy
+import metrics
+
+pd = lazy.module("pandas")
+np = lazy.module("numpy")
+price_store = lazy.module("price_store")
+indicators = lazy.module("indicators")
+charts = lazy.module("charts")
+manifest = lazy.module("manifest")
+risk = lazy.module("risk")
+analytics = lazy.module("analytics")
 
 DATA_DIR = "data_hub"
 HISTORY_FILE = os.path.join(DATA_DIR, "stock_history.json")
@@ -11,74 +20,120 @@ PORTFOLIO_FILE = os.path.join(DATA_DIR, "portfolio.json")
 REPORT_FILE = "ANALYSIS_REPORT.md"
 PREDICTION_CHART = os.path.join(DATA_DIR, "predictions.png")
 
-def get_reversion_details(df, ticker):
-    current_price = df[ticker].iloc[-1]
-    avg_price = df[ticker].mean()
-    std_dev = df[ticker].std()
-    z_score = (current_price - avg_price) / std_dev if std_dev > 0 else 0
-    
-    if z_score > 1.5:
-        return "🔴 **מתיחת יתר למעלה**: המחיר גבוה משמעותית מהממוצע ההיסטורי שלך. סיכון מוגבר לתיקון."
-    elif z_score < -1.5:
-        return "🟢 **הזדמנות ערך**: המחיר נמוך משמעותית מהממוצע. ייתכן שמדובר בנקודת כניסה נוחה."
-    return "⚪ **מחיר הוגן**: המניה נסחרת סביב הממוצע ההיסטורי שלה."
+REVERSION_TEXT = {
+    "overextended": "🔴 **מתיחת יתר למעלה**: המחיר גבוה משמעותית מהממוצע ההיסטורי שלך. סיכון מוגבר לתיקון.",
+    "value_opportunity": "🟢 **הזדמנות ערך**: המחיר נמוך משמעותית מהממוצע. ייתכן שמדובר בנקודת כניסה נוחה.",
+    "fair": "⚪ **מחיר הוגן**: המניה נסחרת סביב הממוצע ההיסטורי שלה.",
+}
+MOMENTUM_TEXT = {
+    "accumulating": "⏳ צבירת נתונים...",
+    "uptrend": "🚀 **מגמה עולה**: הממוצע לטווח קצר מעל הארוך - המומנטום חיובי.",
+    "downtrend": "⚠️ **מגמה יורדת**: המומנטום נחלש, המחיר מתקשה לפרוץ למעלה.",
+}
+RSI_TEXT = {
+    "overbought": "🔥 **קניית יתר**: המניה 'חמה' מדי. ייתכן שיידרש אוורור בקרוב.",
+    "oversold": "🧊 **מכירת יתר**: פאניקה של מוכרים. לעיתים קרובות מקדים זינוק למעלה.",
+    "neutral": "⚖️ **ניטרלי**: עוצמת הקונים והמוכרים מאוזנת.",
+}
 
-def get_momentum_details(df, ticker):
-    prices = df[ticker].dropna()
-    if len(prices) < 20: return "⏳ צבירת נתונים..."
-    ma_short = prices.rolling(window=20).mean().iloc[-1]
-    ma_long = prices.rolling(window=min(len(prices), 50)).mean().iloc[-1]
-    
-    if ma_short > ma_long:
-        return "🚀 **מגמה עולה**: הממוצע לטווח קצר מעל הארוך - המומנטום חיובי."
-    return "⚠️ **מגמה יורדת**: המומנטום נחלש, המחיר מתקשה לפרוץ למעלה."
+def risk_section(result):
+    if result is None:
+        return "⏳ אין מספיק היסטוריה בארכיון להערכת סיכון."
+    lines = [f"סימולציית מונטה קרלו של {result['paths']:,} תרחישים ל-{result['horizon_days']} ימי מסחר קדימה "
+             f"(שווי נוכחי ₪{result['value_ils']:,.0f}, {result['observations']} תשואות יומיות):\n",
+             "| רמת ביטחון | VaR (הפסד מקסימלי צפוי) | CVaR (הפסד ממוצע מעבר ל-VaR) |",
+             "| :--- | :--- | :--- |"]
+    for c in result["var"]:
+        lines.append(f"| {c} | ₪{result['var'][c]:,.0f} | ₪{result['cvar'][c]:,.0f} |")
+    dd = result["drawdown_pct"]
+    lines.append(f"\n**ירידה מקסימלית מהשיא בתקופה:** חציון {dd['p50']:.1f}%, "
+                 f"95% מהתרחישים עד {dd['p95']:.1f}%, 99% עד {dd['p99']:.1f}%")
+    return "\n".join(lines)
 
-def get_rsi_details(rsi):
-    if rsi > 70:
-        return "🔥 **קניית יתר**: המניה 'חמה' מדי. ייתכן שיידרש אוורור בקרוב."
-    elif rsi < 30:
-        return "🧊 **מכירת יתר**: פאניקה של מוכרים. לעיתים קרובות מקדים זינוק למעלה."
-    return "⚖️ **ניטרלי**: עוצמת הקונים והמוכרים מאוזנת."
+def correlation_section(state, holdings):
+    corr = analytics.correlation(state)
+    if len(state["moments"]) < 2 or corr.empty:
+        return "⏳ צבירת נתונים..."
+    table = analytics.table(state, holdings)
+    names = list(corr.columns)
+    lines = [f"מתאם בין התשואות ב-{len(state['moments'])} הדגימות האחרונות (1 = תנועה זהה, 0 = ללא קשר):\n",
+             "| | " + " | ".join(names) + " |",
+             "| :--- |" + " :---: |" * len(names)]
+    for t in names:
+        lines.append(f"| **{t}** | " + " | ".join(f"{corr.at[t, u]:.2f}" for u in names) + " |")
+    held = [t for t in names if t in holdings]
+    pairs = [(corr.at[a, b], a, b) for i, a in enumerate(held) for b in held[i + 1:]]
+    if pairs:
+        top, a, b = max(pairs)
+        lines.append(f"\n🔗 **הזוג המתואם ביותר:** {a} ו-{b} ({top:.2f}) - החזקה בשניהם מוסיפה מעט פיזור.")
+    lines.append("\n| מניה | בטא מול SPY | ירידה מהשיא | ירידה מקסימלית |")
+    lines.append("| :--- | :--- | :--- | :--- |")
+    for t in held:
+        r = table.loc[t]
+        lines.append(f"| {t} | {r['beta']:.2f} | {r['drawdown']:.1f}% | {r['max_drawdown']:.1f}% |")
+    port = analytics.portfolio_summary(state, holdings)
+    lines.append(f"\n**בטא התיק:** {port['beta']:.2f} | **ירידה מקסימלית של התיק:** {port['max_drawdown']:.1f}%")
+    return "\n".join(lines)
 
-def main():
-    if not os.path.exists(HISTORY_FILE) or not os.path.exists(PORTFOLIO_FILE):
+def main(df=None):
+    if not os.path.exists(PORTFOLIO_FILE):
         return
     with open(PORTFOLIO_FILE, 'r') as f: holdings = json.load(f)
-    with open(HISTORY_FILE, 'r') as f: history = json.load(f)
-    
-    df = pd.DataFrame([{"ts": e['timestamp'], **e['prices']} for e in history])
-    df['ts'] = pd.to_datetime(df['ts'])
-    df = df.sort_values('ts')
+    df = price_store.load_frame() if df is None else df.copy()
+    if df.empty: return
     
     tickers = list(holdings.keys())
+    # Monte Carlo VaR/CVaR over the archive (cached until the returns or holdings change)
+    try:
+        risk_result = risk.run(holdings)
+    except Exception as e:
+        logging.error(f"Risk simulation failed: {e}")
+        risk_result = None
+    inputs = {"portfolio": manifest.file_digest(PORTFOLIO_FILE),
+              "prices": manifest.price_digests(df, tickers + [analytics.BENCHMARK]),
+              "risk": manifest.digest(risk_result)}
+    if manifest.fresh(REPORT_FILE, inputs) and os.path.exists(PREDICTION_CHART):
+        return
     sections = []
     
-    plt.figure(figsize=(12, 6))
-    plt.style.use('dark_background')
+    series = []
+
+    # כל האינדיקטורים לכל המניות במעבר אחד על מטריצת המחירים, וסיווג וקטורי של הטבלה
+    table = indicators.classify(indicators.compute_table(df[[t for t in tickers if t in df.columns]]))
 
     for t in tickers:
-        if t not in df.columns: continue
-        
-        rev = get_reversion_details(df, t)
-        mom = get_momentum_details(df, t)
+        if t not in df.columns or t not in table.index: continue
+        row = table.loc[t]
         
-        # RSI חישוב
-        delta = df[t].diff()
-        gain = delta.where(delta > 0, 0).rolling(14).mean()
-        loss = -delta.where(delta < 0, 0).rolling(14).mean()
-        rs = gain / loss
-        rsi_val = 100 - (100 / (1 + rs.iloc[-1])) if not pd.isna(rs.iloc[-1]) else 50
-        rsi_desc = get_rsi_details(rsi_val)
+        rev = REVERSION_TEXT[row['reversion']]
+        mom = MOMENTUM_TEXT[row['momentum']]
+        rsi_val = row['rsi']
+        rsi_desc = RSI_TEXT[row['rsi_zone']]
         
         sections.append(f"### 📈 {t}\n"
                         f"- **מצב מחיר:** {rev}\n"
                         f"- **מגמת מומנטום:** {mom}\n"
                         f"- **מדד עוצמה (RSI):** {rsi_val:.1f} - {rsi_desc}\n")
         
-        plt.plot(df['ts'], (df[t]/df[t].iloc[0])*100, label=t, alpha=0.8, linewidth=2)
+        ts, vals = charts.downsample(df['ts'].to_numpy(), ((df[t]/df[t].iloc[0])*100).to_numpy())
+        series.append((t, ts, vals))
+
+    def draw_predictions(fig):
+        ax = fig.add_subplot()
+        for t, ts, vals in series:
+            ax.plot(ts, vals, label=t, alpha=0.8, linewidth=2)
+        ax.set_title("Portfolio Performance Comparison (Normalized)")
+        ax.legend()
+
+    # Rolling correlation / beta / drawdown state, fed only the samples added since the last run
+    try:
+        correlation = correlation_section(analytics.sync(df, holdings), holdings)
+    except Exception as e:
+        logging.error(f"Analytics update failed: {e}")
+        correlation = "⏳ צבירת נתונים..."
 
-    plt.title("Portfolio Performance Comparison (Normalized)")
-    plt.legend(); plt.savefig(PREDICTION_CHART, bbox_inches='tight'); plt.close()
+    digest = charts.fingerprint(*[part for t, ts, vals in series for part in (t, ts, vals)])
+    charts.render(PREDICTION_CHART, digest, draw_predictions, size=(12, 6), style='dark_background', dpi=100)
     
     report = [
         "# 🧠 דוח ניתוח מפורט ותחזיות",
@@ -87,14 +142,24 @@ def main():
         "\n".join(sections),
         "## 📊 השוואת צמיחה יחסית",
         f"![Predictions](./{PREDICTION_CHART})",
+        "## 🔗 מתאם, בטא וירידות מהשיא",
+        correlation,
+        "## ⚠️ הערכת סיכון (Monte Carlo)",
+        risk_section(risk_result),
         "\n---",
         "### 📔 מילון מונחים למשקיע:",
         "- **Mean Reversion (חזרה לממוצע):** הנחה שמחיר המניה תמיד יחזור לממוצע שלו. סטייה חריגה היא הזדמנות או נורת אזהרה.",
         "- **RSI (מדד עוצמה יחסית):** כלי שמודד את מהירות שינויי המחיר. עוזר לזהות מתי הציבור רץ לקנות/למכור בטירוף.",
-        "- **Momentum (מומנטום):** בודק אם 'הרוח בגב' של המניה. מניה במומנטום חיובי נוטה להמשיך לעלות."
+        "- **Momentum (מומנטום):** בודק אם 'הרוח בגב' של המניה. מניה במומנטום חיובי נוטה להמשיך לעלות.",
+        "- **Beta (בטא):** רגישות המניה לתנועת השוק (SPY). בטא 1.5 - בממוצע זזה פי 1.5 מהשוק.",
+        "- **Max Drawdown (ירידה מקסימלית):** הירידה הגדולה ביותר מהשיא לשפל בהיסטוריה הנמדדת.",
+        "- **VaR / CVaR:** ההפסד שלא צפוי להיחצות ברמת הביטחון הנתונה, והממוצע של ההפסדים בתרחישים הגרועים שמעבר לו."
     ]
     
-    with open(REPORT_FILE, 'w', encoding='utf-8') as f:
-        f.write("\n".join(report))
+    with metrics.span("report.write", file=REPORT_FILE) as s:
+        if manifest.write(REPORT_FILE, "\n".join(report), inputs):
+            s.add(bytes_written=metrics.file_size(REPORT_FILE))
 
-if __name__ == "__main__": main()
+if __name__ == "__main__":
+    metrics.start_run()
+    main()
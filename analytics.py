@@ -0,0 +1,214 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import manifest
+import metrics
+
+# --- Rolling correlation, beta and drawdown ---
+# Streaming state over the price samples, persisted between runs like the indicator state:
+#   window of the last WINDOW sample-to-sample returns (all tickers + the SPY benchmark) with
+#   running sums  s = sum(r)  and  S = sum(r r^T)
+#     push:  s += r_new - r_old,  S += outer(r_new) - outer(r_old)      O(tickers^2) per sample
+#     cov  = (S - outer(s) / n) / (n - 1)   -> correlation matrix, beta_i = cov[i, SPY] / var(SPY)
+#   running peak / max drawdown per ticker and for the portfolio value (holdings . prices)
+# The sums are recomputed exactly from the window every RESYNC_EVERY pushes so rounding can't
+# accumulate. A changed ticker list starts a new state; changed holdings only reset the
+# portfolio drawdown, which is then rebuilt from the frame in one vectorized pass.
+DATA_DIR = "data_hub"
+STATE_FILE = os.path.join(DATA_DIR, "analytics_state.json")
+BENCHMARK = "SPY"
+WINDOW = 60                 # returns in the rolling window
+RESYNC_EVERY = 10 * WINDOW
+STATE_VERSION = 1
+
+
+class RollingMoments:
+    """Sums of the last `window` return vectors and of their outer products."""
+
+    def __init__(self, n, window=WINDOW, rows=None, head=0, pushes=0):
+        self.n, self.window = n, window
+        self.rows = [np.asarray(r, dtype=float) for r in rows] if rows else []
+        self.head = head
+        self.pushes = pushes
+        self.resync()
+
+    def resync(self):
+        m = np.array(self.rows).reshape(-1, self.n)
+        self.s = m.sum(axis=0)
+        self.S = m.T @ m
+
+    def push(self, r):
+        if len(self.rows) < self.window:
+            self.rows.append(r)
+        else:
+            old = self.rows[self.head]
+            self.rows[self.head] = r
+            self.head = (self.head + 1) % self.window
+            self.s -= old
+            self.S -= np.outer(old, old)
+        self.s += r
+        self.S += np.outer(r, r)
+        self.pushes += 1
+        if self.pushes % RESYNC_EVERY == 0:
+            self.resync()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def cov(self):
+        k = len(self.rows)
+        if k < 2:
+            return np.full((self.n, self.n), np.nan)
+        return (self.S - np.outer(self.s, self.s) / k) / (k - 1)
+
+    def to_dict(self):
+        return {"window": self.window, "rows": [r.tolist() for r in self.rows], "head": self.head,
+                "pushes": self.pushes}
+
+    @classmethod
+    def from_dict(cls, n, d):
+        return cls(n, d["window"], d["rows"], d["head"], d["pushes"])
+
+
+def new_state(tickers, window=WINDOW):
+    return {"version": STATE_VERSION, "tickers": list(tickers), "last_ts": None, "rows": 0,
+            "last_prices": [None] * len(tickers), "moments": RollingMoments(len(tickers), window),
+            "peak": [None] * len(tickers), "max_drawdown": [0.0] * len(tickers),
+            "portfolio": None}
+
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if raw.get("version") != STATE_VERSION:
+        return None
+    raw["moments"] = RollingMoments.from_dict(len(raw["tickers"]), raw["moments"])
+    return raw
+
+
+def save_state(state, path=STATE_FILE):
+    out = dict(state, moments=state["moments"].to_dict())
+    manifest.write(path, json.dumps(out, separators=(',', ':')))
+
+
+def _tracked(df, holdings):
+    tickers = [t for t in holdings if t in df.columns and t != BENCHMARK]
+    return tickers + [BENCHMARK] if BENCHMARK in df.columns else tickers
+
+
+def update(state, ts, prices, amounts):
+    """Feed rows of prices (rows x tickers, NaN = missing) in the state's ticker order.
+
+    amounts: shares held per ticker (0 for the benchmark), for the portfolio drawdown."""
+    moments = state["moments"]
+    portfolio = state["portfolio"]
+    last = np.array([np.nan if p is None else p for p in state["last_prices"]], dtype=float)
+    peak = np.array([np.nan if p is None else p for p in state["peak"]], dtype=float)
+    max_dd = np.array(state["max_drawdown"], dtype=float)
+    for row in prices:
+        current = np.where(np.isnan(row), last, row)
+        # A return only when every ticker has a price on both sides, so the window stays aligned
+        if not np.isnan(last).any() and not np.isnan(row).any():
+            moments.push(current / last - 1.0)
+        peak = np.fmax(peak, current)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            max_dd = np.fmax(max_dd, 1.0 - current / peak)
+        value = float(np.nan_to_num(current) @ amounts)
+        portfolio["peak"] = max(portfolio["peak"], value)
+        if portfolio["peak"] > 0:
+            portfolio["max_drawdown"] = max(portfolio["max_drawdown"], 1.0 - value / portfolio["peak"])
+        portfolio["value"] = value
+        last = current
+    state["last_prices"] = [None if np.isnan(v) else float(v) for v in last]
+    state["peak"] = [None if np.isnan(v) else float(v) for v in peak]
+    state["max_drawdown"] = max_dd.tolist()
+    state["rows"] += len(prices)
+    state["last_ts"] = str(ts[-1])
+    return state
+
+
+def _portfolio_drawdown(prices, amounts):
+    """Value, peak and max drawdown of amounts . prices over the rows of a price matrix."""
+    values = np.nan_to_num(pd.DataFrame(prices).ffill().to_numpy()) @ amounts
+    if not len(values):
+        return {"value": 0.0, "peak": 0.0, "max_drawdown": 0.0}
+    peaks = np.maximum.accumulate(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dd = np.where(peaks > 0, 1.0 - values / peaks, 0.0)
+    return {"value": float(values[-1]), "peak": float(peaks[-1]), "max_drawdown": float(dd.max())}
+
+
+def sync(df, holdings, path=STATE_FILE, save=True):
+    """Bring the persisted state up to date with a full history frame, feeding only the new rows."""
+    tickers = _tracked(df, holdings)
+    state = load_state(path)
+    if state is None or state["tickers"] != tickers:
+        state = new_state(tickers)
+    start = 0
+    if state["last_ts"] is not None and not df.empty:
+        last_seen = np.datetime64(pd.Timestamp(state["last_ts"]))
+        if last_seen > df['ts'].to_numpy()[-1]:
+            state = new_state(tickers)
+        else:
+            start = int(np.searchsorted(df['ts'].to_numpy(), last_seen, side='right'))
+
+    prices = df[tickers].to_numpy(dtype=float)
+    amounts = np.array([holdings[t]['amount'] if t in holdings else 0.0 for t in tickers], dtype=float)
+    holdings_key = manifest.digest(tickers, amounts)
+    if state["portfolio"] is None or state["portfolio"]["holdings"] != holdings_key:
+        # New holdings: the portfolio drawdown is rebuilt over the rows the state has already seen
+        state["portfolio"] = dict(_portfolio_drawdown(prices[:start], amounts), holdings=holdings_key)
+
+    if start < len(df):
+        with metrics.span("analytics.update") as s:
+            update(state, df['ts'].to_numpy()[start:], prices[start:], amounts)
+            s.add(rows=len(df) - start)
+    if save:
+        save_state(state, path)
+    return state
+
+
+def correlation(state):
+    """Rolling correlation matrix of the tracked tickers' returns."""
+    cov = state["moments"].cov()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(np.diag(cov))
+        corr = cov / np.outer(std, std)
+    return pd.DataFrame(corr, index=state["tickers"], columns=state["tickers"])
+
+
+def table(state, holdings):
+    """Per ticker: beta and correlation vs the benchmark, current and max drawdown (in %)."""
+    tickers = state["tickers"]
+    cov = state["moments"].cov()
+    corr = correlation(state)
+    bench = tickers.index(BENCHMARK) if BENCHMARK in tickers else None
+    rows = {}
+    for i, t in enumerate(tickers):
+        last, peak = state["last_prices"][i], state["peak"][i]
+        beta = cov[i, bench] / cov[bench, bench] if bench is not None and cov[bench, bench] > 0 else np.nan
+        rows[t] = {"beta": beta, "corr": corr.iat[i, bench] if bench is not None else np.nan,
+                   "drawdown": (1 - last / peak) * 100 if last and peak else np.nan,
+                   "max_drawdown": state["max_drawdown"][i] * 100}
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def portfolio_summary(state, holdings):
+    """Portfolio beta (value-weighted betas), current and max drawdown in %."""
+    t = table(state, holdings)
+    held = [x for x in t.index if x in holdings]
+    prices = dict(zip(state["tickers"], state["last_prices"]))
+    values = np.array([holdings[x]['amount'] * (prices[x] or 0.0) for x in held])
+    weights = values / values.sum() if values.sum() > 0 else values
+    beta = float(np.nansum(weights * t.loc[held, 'beta'].to_numpy())) if held else np.nan
+    p = state["portfolio"] or {}
+    drawdown = (1 - p["value"] / p["peak"]) * 100 if p.get("peak") else np.nan
+    return {"beta": beta, "drawdown": drawdown, "max_drawdown": p.get("max_drawdown", np.nan) * 100,
+            "window": len(state["moments"])}
+
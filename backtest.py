@@ -0,0 +1,293 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import indicators
+import manifest
+import metrics
+import price_query
+
+# --- Signal backtester ---
+# Replays analysis_pro's rules over the daily archive (individual_stocks/<T>_history.csv):
+#   reversion  long once z < -z_threshold, flat once z > z_threshold   (z over z_window days, 0 = expanding)
+#   momentum   long while the short moving average is above the long one
+#   rsi        long once RSI < oversold, flat once RSI > overbought
+# Between the two thresholds a position is held (the ffill of the last entry/exit signal).
+# A position decided at the close of day t earns day t+1's total return (the change of Yahoo's
+# dividend-adjusted close, which already includes the dividends); the portfolio is equal weight
+# over the tickers trading that day, cash when flat.
+# Indicators come from indicators.rolling_indicators, computed once per distinct window; every
+# parameter set of a rule is then one slice of a (params x days x tickers) array, evaluated
+# PARAM_CHUNK sets at a time (optionally across a process pool).
+DATA_DIR = "data_hub"
+PORTFOLIO_FILE = os.path.join(DATA_DIR, "portfolio.json")
+RESULTS_FILE = os.path.join(DATA_DIR, "backtest_results.csv")
+EQUITY_FILE = os.path.join(DATA_DIR, "backtest_equity.csv")
+EQUITY_CHART = os.path.join(DATA_DIR, "backtest_equity.png")
+TRADING_DAYS = 252
+PARAM_CHUNK = 128
+DEFAULT_COST_BPS = 5.0      # per unit of position change
+TOP_CURVES = 5
+
+GRIDS = {
+    "default": {
+        "reversion": {"z_window": [0, 50, 100, 200], "z_threshold": [1.0, 1.5, 2.0]},
+        "momentum": {"short": [10, 20, 30], "long": [50, 100, 200]},
+        "rsi": {"rsi_window": [7, 14, 21], "oversold": [25, 30, 35], "overbought": [65, 70, 75]},
+    },
+    "dense": {
+        "reversion": {"z_window": [0] + list(range(10, 260, 10)),
+                      "z_threshold": [round(x, 1) for x in np.arange(0.5, 3.05, 0.1)]},
+        "momentum": {"short": list(range(5, 65, 5)), "long": list(range(20, 310, 10))},
+        "rsi": {"rsi_window": list(range(5, 31)), "oversold": list(range(15, 45, 5)),
+                "overbought": list(range(60, 90, 5))},
+    },
+}
+RESULT_COLUMNS = ["rule", "params", "total_return", "cagr", "volatility", "sharpe", "max_drawdown",
+                  "exposure", "trades"]
+
+
+def load_daily(tickers, archive_dir=price_query.ARCHIVE_DIR):
+    """Daily adjusted close prices from the archive, one row per trading day."""
+    df = price_query.get_prices(tickers, source="archive", archive_dir=archive_dir)
+    if df.empty:
+        return pd.DataFrame()
+    # The hourly archive update adds intraday rows; each day keeps its last row
+    daily = df.groupby(df['ts'].dt.normalize()).last()
+    return daily[[t for t in tickers if t in daily.columns]]
+
+
+def expand_grid(grid):
+    """[(rule, {param: value})] for every combination in a {rule: {param: [values]}} grid."""
+    out = []
+    for rule, params in grid.items():
+        names = list(params)
+        for values in itertools.product(*(params[n] for n in names)):
+            p = dict(zip(names, values))
+            if rule == "momentum" and p["short"] >= p["long"]:
+                continue
+            if rule == "rsi" and p["oversold"] >= p["overbought"]:
+                continue
+            out.append((rule, p))
+    return out
+
+
+def _ffill(state):
+    """Forward-fill NaNs along the days axis (-2) of a (..., days, tickers) array; leading NaNs become 0."""
+    days = state.shape[-2]
+    idx = np.where(np.isnan(state), 0, np.arange(days)[:, None])
+    np.maximum.accumulate(idx, axis=-2, out=idx)
+    filled = np.take_along_axis(state, idx, axis=-2)
+    return np.nan_to_num(filled)
+
+
+def _hold(enter, leave):
+    return _ffill(np.where(enter, 1.0, np.where(leave, 0.0, np.nan)))
+
+
+class Indicators:
+    """Indicator arrays (days x tickers) per window, computed on first use."""
+
+    def __init__(self, prices):
+        self.prices = prices
+        self._cache = {}
+
+    def _rolling(self, window):
+        if window not in self._cache:
+            w = max(window, 2)
+            self._cache[window] = indicators.rolling_indicators(self.prices, short=w, long=w, rsi_window=w)
+        return self._cache[window]
+
+    def z(self, window):
+        if window == 0:
+            return self._rolling(indicators.SHORT_WINDOW)["z_score"].to_numpy()
+        key = ("z", window)
+        if key not in self._cache:
+            rolling = self.prices.rolling(window, min_periods=2)
+            std = rolling.std()
+            self._cache[key] = ((self.prices - rolling.mean()) / std).where(std > 0, 0.0).to_numpy()
+        return self._cache[key]
+
+    def ma_short(self, window):
+        return self._rolling(window)["ma_short"].to_numpy()
+
+    def ma_long(self, window):
+        return self._rolling(window)["ma_long"].to_numpy()
+
+    def rsi(self, window):
+        return self._rolling(window)["rsi"].to_numpy()
+
+
+def positions(ind, rule, params):
+    """(params x days x tickers) positions (0 or 1) for parameter sets of one rule."""
+    if rule == "reversion":
+        z = np.stack([ind.z(p["z_window"]) for p in params])
+        thr = np.array([p["z_threshold"] for p in params])[:, None, None]
+        return _hold(z < -thr, z > thr)
+    if rule == "momentum":
+        diff = np.stack([ind.ma_short(p["short"]) - ind.ma_long(p["long"]) for p in params])
+        return np.nan_to_num((diff > 0).astype(float))
+    if rule == "rsi":
+        rsi = np.stack([ind.rsi(p["rsi_window"]) for p in params])
+        low = np.array([p["oversold"] for p in params])[:, None, None]
+        high = np.array([p["overbought"] for p in params])[:, None, None]
+        return _hold(rsi < low, rsi > high)
+    if rule == "buy_hold":
+        return np.ones((len(params),) + ind.prices.shape)
+    raise ValueError(f"Unknown rule: {rule}")
+
+
+def daily_returns(prices):
+    """Total return per day and ticker (NaN before a ticker's first price)."""
+    p = prices.ffill().to_numpy()
+    prev = np.vstack([np.full((1, p.shape[1]), np.nan), p[:-1]])
+    return p / prev - 1.0
+
+
+def evaluate(pos, returns, cost_bps=DEFAULT_COST_BPS):
+    """Daily portfolio returns (params x days) of equal-weight positions held from the previous close."""
+    held = np.concatenate([np.zeros_like(pos[:, :1]), pos[:, :-1]], axis=1)
+    trading = ~np.isnan(returns)
+    weight = trading / np.maximum(trading.sum(axis=1, keepdims=True), 1)
+    gross = (held * np.nan_to_num(returns) * weight).sum(axis=2)
+    turnover = (np.abs(np.diff(held, axis=1, prepend=0.0)) * weight).sum(axis=2)
+    return gross - turnover * cost_bps / 10000.0
+
+
+def summarize(daily):
+    """Performance statistics for each row of a (params x days) daily return array."""
+    equity = np.cumprod(1.0 + daily, axis=1)
+    years = daily.shape[1] / TRADING_DAYS
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vol = daily.std(axis=1) * np.sqrt(TRADING_DAYS)
+        sharpe = np.where(vol > 0, daily.mean(axis=1) * TRADING_DAYS / vol, 0.0)
+        cagr = equity[:, -1] ** (1.0 / years) - 1.0 if years > 0 else np.zeros(len(daily))
+    drawdown = (1.0 - equity / np.maximum.accumulate(equity, axis=1)).max(axis=1)
+    return equity, {"total_return": equity[:, -1] - 1.0, "cagr": cagr, "volatility": vol,
+                    "sharpe": sharpe, "max_drawdown": drawdown}
+
+
+def _run_chunk(task):
+    prices, rule, params, cost_bps, keep_curves = task
+    ind = Indicators(prices)
+    pos = positions(ind, rule, params)
+    daily = evaluate(pos, daily_returns(prices), cost_bps)
+    equity, stats = summarize(daily)
+    stats["exposure"] = pos.mean(axis=(1, 2))
+    stats["trades"] = (np.diff(pos, axis=1) > 0).sum(axis=(1, 2))
+    return rule, params, stats, equity if keep_curves else None
+
+
+def _label(rule, params):
+    return " ".join([rule] + [f"{k}={v}" for k, v in params.items()])
+
+
+def _chunks(combos, size):
+    by_rule = {}
+    for rule, p in combos:
+        by_rule.setdefault(rule, []).append(p)
+    for rule, params in by_rule.items():
+        for i in range(0, len(params), size):
+            yield rule, params[i:i + size]
+
+
+def run(tickers, grid, cost_bps=DEFAULT_COST_BPS, workers=None, top=TOP_CURVES, archive_dir=price_query.ARCHIVE_DIR):
+    """Sweep `grid` (a {rule: {param: [values]}} dict). Returns (ranked results, equity curves of the best `top`)."""
+    prices = load_daily(tickers, archive_dir)
+    if prices.empty or len(prices) < 2:
+        return pd.DataFrame(columns=RESULT_COLUMNS), pd.DataFrame()
+    combos = expand_grid(grid) + [("buy_hold", {})]
+    tasks = [(prices, rule, params, cost_bps, True)
+             for rule, params in _chunks(combos, PARAM_CHUNK)]
+
+    with metrics.span("backtest.sweep", combinations=len(combos), workers=workers or 1):
+        if workers and workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_run_chunk, tasks))
+        else:
+            results = [_run_chunk(t) for t in tasks]
+
+    rows, curves = [], []
+    for rule, params, stats, equity in results:
+        for i, p in enumerate(params):
+            rows.append({"rule": rule, "params": json.dumps(p, sort_keys=True),
+                         **{k: float(v[i]) for k, v in stats.items()}})
+            curves.append((_label(rule, p), equity[i]))
+    table = pd.DataFrame(rows, columns=RESULT_COLUMNS).sort_values(
+        ["sharpe", "total_return"], ascending=False, kind='stable')
+    order = [i for i in table.index if table.at[i, 'rule'] != "buy_hold"][:top]
+    order += list(table.index[table['rule'] == "buy_hold"])
+    equity = pd.DataFrame(dict(curves[i] for i in order), index=prices.index.rename('date'))
+    table = table.reset_index(drop=True)
+    table['trades'] = table['trades'].astype(int)
+    return table, equity
+
+
+def write_outputs(table, equity):
+    manifest.write(RESULTS_FILE, table.to_csv(index=False, float_format='%.6g'))
+    manifest.write(EQUITY_FILE, equity.to_csv(float_format='%.6g'))
+    if equity.empty:
+        return
+
+    import charts
+
+    def draw(fig):
+        ax = fig.add_subplot()
+        for label in equity.columns:
+            style = dict(color='black', linestyle='--', linewidth=2) if label == "buy_hold" else dict(linewidth=1.5)
+            ax.plot(equity.index.to_numpy(), equity[label].to_numpy(), label=label, **style)
+        ax.set_title("Backtest: best parameter sets vs buy & hold (growth of 1)", fontsize=13, fontweight='bold')
+        ax.grid(True, linestyle=':', alpha=0.6)
+        ax.legend(fontsize=8)
+
+    digest = charts.fingerprint(list(equity.columns), equity.to_numpy())
+    charts.render(EQUITY_CHART, digest, draw, size=(12, 6), dpi=100)
+
+
+def print_table(table, limit=20):
+    shown = table.head(limit)
+    print(f"{'rule':<10} {'params':<52} {'total':>8} {'cagr':>7} {'vol':>6} {'sharpe':>6} {'maxdd':>6} {'expo':>5} {'trades':>6}")
+    for _, r in shown.iterrows():
+        print(f"{r['rule']:<10} {r['params']:<52} {r['total_return']:>+8.1%} {r['cagr']:>+7.1%} {r['volatility']:>6.1%} "
+              f"{r['sharpe']:>6.2f} {r['max_drawdown']:>6.1%} {r['exposure']:>5.0%} {r['trades']:>6}")
+
+
+def _parse_overrides(grid, overrides):
+    grid = {rule: dict(params) for rule, params in grid.items()}
+    for item in overrides:
+        name, _, values = item.partition("=")
+        rules = [r for r, params in grid.items() if name in params]
+        if not rules or not values:
+            raise SystemExit(f"Unknown parameter or missing values: {item}")
+        for r in rules:
+            grid[r][name] = [float(v) if "." in v else int(v) for v in values.split(",")]
+    return grid
+
+
+if __name__ == "__main__":
+    metrics.start_run()
+    parser = argparse.ArgumentParser(description="Backtest analysis_pro's signals over the price archive")
+    parser.add_argument("tickers", nargs="*", help="tickers (default: the portfolio)")
+    parser.add_argument("--grid", choices=sorted(GRIDS), default="default")
+    parser.add_argument("--rules", help="comma-separated subset of rules (reversion, momentum, rsi)")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2",
+                        help="override one parameter's values, e.g. --param z_threshold=1,2")
+    parser.add_argument("--cost-bps", type=float, default=DEFAULT_COST_BPS)
+    parser.add_argument("--workers", type=int, help="evaluate parameter chunks in a process pool")
+    parser.add_argument("--top", type=int, default=20, help="rows of the ranked table to print")
+    args = parser.parse_args()
+
+    tickers = args.tickers
+    if not tickers:
+        with open(PORTFOLIO_FILE, 'r') as f:
+            tickers = list(json.load(f))
+    grid = _parse_overrides(GRIDS[args.grid], args.param)
+    if args.rules:
+        grid = {r: grid[r] for r in args.rules.split(",")}
+    table, equity = run(tickers, grid, cost_bps=args.cost_bps, workers=args.workers)
+    write_outputs(table, equity)
+    print_table(table, args.top)
+    print(f"\n{len(table)} parameter sets -> {RESULTS_FILE}, equity curves -> {EQUITY_FILE}, {EQUITY_CHART}")
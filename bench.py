@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+# --- Benchmark harness ---
+# python bench.py [--sizes 10x1000,100x10000] [--compare old.json]
+# Each case builds a synthetic tree in a temp directory (portfolio.json, stock_history.json and
+# per-ticker archive CSVs with <timestamps> rows for <tickers> tickers) and runs the pipeline
+# stages in order, each in a fresh interpreter so peak RSS is per stage. Market data comes from
+# the synthetic archive through market_data.LocalBackend; yfinance is blocked from importing.
+# Per stage: wall time, peak RSS of the process, and the tracemalloc peak of the stage itself
+# (tracing slows the stage down; use --no-trace for clean wall times).
+#
+# python bench.py --startup checks the startup budget instead: no-op runs (no portfolio) and
+# cache-hit report runs (charts unchanged) in a fresh interpreter under `python -X importtime`,
+# failing when they exceed their wall-time budget or import a module they shouldn't need.
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join("data_hub", "benchmarks")
+DEFAULT_SIZES = "10x1000,100x1000,10x10000"
+FULL_SIZES = ",".join(f"{t}x{n}" for t in (10, 100, 1000) for n in (1000, 10000, 100000))
+STAGES = ("tracker", "report", "analysis", "archive")
+SAMPLE_SPACING = timedelta(minutes=15)    # stock_history.json rows
+ARCHIVE_SPACING = timedelta(hours=6)      # archive CSV rows
+REGRESSION_RATIO = 1.25
+RESULT_FILE = "_bench_result.json"
+HEAVY_MODULES = ("pandas", "numpy", "matplotlib", "yfinance")
+STARTUP_CASES = [
+    # name, needs a data tree, code, wall budget (s), modules that must stay unloaded
+    ("noop", False, "import generate_report, analysis_pro; generate_report.main(); analysis_pro.main()",
+     0.3, HEAVY_MODULES),
+    ("report-cached", True, "import generate_report; generate_report.main()", 1.0, ("matplotlib", "yfinance")),
+    ("analysis-cached", True, "import analysis_pro; analysis_pro.main()", 1.0, ("matplotlib", "yfinance")),
+]
+
+
+def _tickers(n):
+    return [f"T{i:04d}" for i in range(n)]
+
+
+def generate(root, n_tickers, n_timestamps, seed=0):
+    """Write a synthetic data_hub under `root`."""
+    rng = np.random.default_rng(seed)
+    tickers = _tickers(n_tickers)
+    data_dir = os.path.join(root, "data_hub")
+    archive_dir = os.path.join(data_dir, "price_history_archive", "individual_stocks")
+    os.makedirs(archive_dir, exist_ok=True)
+
+    start_prices = rng.uniform(20, 500, n_tickers)
+    portfolio = {t: {"amount": int(rng.integers(1, 100)), "avg_price": round(float(p * rng.uniform(0.7, 1.3)), 2)}
+                 for t, p in zip(tickers, start_prices)}
+    with open(os.path.join(data_dir, "portfolio.json"), 'w') as f:
+        json.dump(portfolio, f, indent=2)
+
+    # Random walks, one column per ticker; the newest row is an hour before now
+    end = pd.Timestamp(datetime.now()).floor('min') - pd.Timedelta(hours=1)
+
+    def walk(n):
+        steps = rng.normal(0, 0.01, (n, n_tickers))
+        return np.round(start_prices * np.exp(np.cumsum(steps, axis=0)), 2)
+
+    ts = pd.date_range(end=end, periods=n_timestamps, freq=SAMPLE_SPACING)
+    prices = walk(n_timestamps)
+    history = [{"timestamp": t, "prices": dict(zip(tickers, row))}
+               for t, row in zip(ts.strftime("%Y-%m-%d %H:%M:%S"), prices.tolist())]
+    with open(os.path.join(data_dir, "stock_history.json"), 'w') as f:
+        json.dump(history, f)
+
+    archive_ts = pd.date_range(end=end, periods=n_timestamps, freq=ARCHIVE_SPACING).strftime("%Y-%m-%d %H:%M:%S")
+    archive = walk(n_timestamps)
+    usd_ils = np.round(3.6 * np.exp(np.cumsum(rng.normal(0, 0.002, n_timestamps))), 4)
+    payout = (np.arange(n_timestamps) % 250) == 249
+    for i, t in enumerate(tickers):
+        pd.DataFrame({
+            "timestamp": archive_ts, "ticker": t, "price": archive[:, i],
+            "dividend": np.where(payout, np.round(archive[:, i] * 0.004, 2), 0.0),
+            "pe_ratio": np.nan, "usd_ils": usd_ils,
+        }).to_csv(os.path.join(archive_dir, f"{t}_history.csv"), index=False)
+    # Existing merged archive, so the archive stage takes the daily-update path
+    with open(os.path.join(data_dir, "price_history_archive", "full_stocks_extended_history.csv"), 'w') as f:
+        f.write("timestamp,ticker,price,dividend,pe_ratio,usd_ils\n")
+    return tickers
+
+
+def _stage_main(root, stage, trace):
+    """Child process: run one stage against the synthetic tree in `root`."""
+    os.chdir(root)
+    sys.path.insert(0, REPO_DIR)
+    sys.modules['yfinance'] = None     # any network fetch fails loudly instead of hitting Yahoo
+    import market_data
+    market_data.set_backend(market_data.LocalBackend(
+        os.path.join("data_hub", "price_history_archive", "individual_stocks")))
+    import sapa
+    run = {s.name: s.run for s in sapa.STAGES}[stage]
+
+    if trace:
+        tracemalloc.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    error = None
+    try:
+        run({})
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - start
+    result = {"wall_s": wall, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+              "rss_before_mb": rss_before / 1024, "error": error}
+    if trace:
+        result["alloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    with open(RESULT_FILE, 'w') as f:
+        json.dump(result, f)
+
+
+def run_case(n_tickers, n_timestamps, trace=True, keep=False):
+    root = tempfile.mkdtemp(prefix=f"sapa_bench_{n_tickers}x{n_timestamps}_")
+    try:
+        start = time.perf_counter()
+        generate(root, n_tickers, n_timestamps)
+        case = {"tickers": n_tickers, "timestamps": n_timestamps,
+                "generate_s": time.perf_counter() - start, "stages": {}}
+        for stage in STAGES:
+            env = dict(os.environ, PYTHONPATH=REPO_DIR)
+            args = [sys.executable, os.path.abspath(__file__), "_stage", root, stage] + ([] if trace else ["--no-trace"])
+            proc = subprocess.run(args, env=env, capture_output=True, text=True)
+            result_path = os.path.join(root, RESULT_FILE)
+            if proc.returncode != 0 or not os.path.exists(result_path):
+                case["stages"][stage] = {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+                continue
+            with open(result_path) as f:
+                case["stages"][stage] = json.load(f)
+            os.remove(result_path)
+        return case
+    finally:
+        if keep:
+            print(f"  kept {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+_STARTUP_PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+{code}
+wall = time.perf_counter() - t0
+loaded = [m for m in {modules!r} if type(sys.modules.get(m)).__name__ == 'module']
+print("@@" + json.dumps({{"wall_s": wall, "loaded": loaded}}))
+"""
+
+
+def _importtime_top(stderr, n=5):
+    """Slowest top-level imports (cumulative microseconds) from `-X importtime` output."""
+    top = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not name.startswith("  ") and cumulative.strip().isdigit():
+            top.append((int(cumulative), name.strip()))
+    return [f"{name} {us / 1000:.0f}ms" for us, name in sorted(top, reverse=True)[:n]]
+
+
+def check_startup():
+    """Run the startup cases. Returns (results, failures)."""
+    tree = tempfile.mkdtemp(prefix="sapa_startup_")
+    empty = tempfile.mkdtemp(prefix="sapa_startup_empty_")
+    results, failures = [], []
+    try:
+        generate(tree, 10, 1000)
+        env = dict(os.environ, PYTHONPATH=REPO_DIR, SAPA_METRICS="0",
+                   SAPA_MARKET_BACKEND="local:" + os.path.join("data_hub", "price_history_archive", "individual_stocks"))
+        # Warm-up: populate the stores, caches and charts the cached cases rely on
+        subprocess.run([sys.executable, "-m", "sapa", "run", "tracker", "report", "analysis"],
+                       cwd=tree, env=env, capture_output=True)
+        for name, needs_tree, code, budget, forbidden in STARTUP_CASES:
+            proc = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                                   _STARTUP_PROBE.format(code=code, modules=tuple(forbidden))],
+                                  cwd=tree if needs_tree else empty, env=env, capture_output=True, text=True)
+            probe = [l for l in proc.stdout.splitlines() if l.startswith("@@")]
+            if proc.returncode != 0 or not probe:
+                failures.append(f"{name}: failed ({proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else '?'})")
+                continue
+            r = json.loads(probe[-1][2:])
+            r.update(name=name, budget_s=budget, top_imports=_importtime_top(proc.stderr))
+            results.append(r)
+            if r["wall_s"] > budget:
+                failures.append(f"{name}: {r['wall_s']:.2f}s > {budget:.2f}s budget")
+            if r["loaded"]:
+                failures.append(f"{name}: imported {', '.join(r['loaded'])}")
+    finally:
+        shutil.rmtree(tree, ignore_errors=True)
+        shutil.rmtree(empty, ignore_errors=True)
+    return results, failures
+
+
+def compare(results, baseline, ratio=REGRESSION_RATIO):
+    """Stage timings that got slower (or bigger) than `ratio` x the baseline run."""
+    old = {(c["tickers"], c["timestamps"]): c for c in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        base = old.get((case["tickers"], case["timestamps"]))
+        if base is None:
+            continue
+        for stage, now in case["stages"].items():
+            then = base["stages"].get(stage, {})
+            for metric in ("wall_s", "peak_rss_mb", "alloc_peak_mb"):
+                if now.get(metric) and then.get(metric) and now[metric] > then[metric] * ratio:
+                    regressions.append(f"{case['tickers']}x{case['timestamps']} {stage} {metric}: "
+                                       f"{then[metric]:.2f} -> {now[metric]:.2f}")
+    return regressions
+
+
+def print_case(case):
+    print(f"{case['tickers']} tickers x {case['timestamps']} timestamps (generated in {case['generate_s']:.1f}s)")
+    for stage, r in case["stages"].items():
+        if r.get("error") and "wall_s" not in r:
+            print(f"  {stage:<9} FAILED: {r['error']}")
+            continue
+        alloc = f", alloc peak {r['alloc_peak_mb']:7.1f} MB" if "alloc_peak_mb" in r else ""
+        note = f"  ({r['error']})" if r.get("error") else ""
+        print(f"  {stage:<9} {r['wall_s']:8.2f}s, peak RSS {r['peak_rss_mb']:7.1f} MB{alloc}{note}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench.py", description="Pipeline benchmarks on synthetic data")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated <tickers>x<timestamps> cases")
+    parser.add_argument("--full", action="store_true", help=f"run the full grid ({FULL_SIZES})")
+    parser.add_argument("--no-trace", action="store_true", help="skip tracemalloc (clean wall times)")
+    parser.add_argument("--out", help="results file (default: data_hub/benchmarks/bench_<time>.json)")
+    parser.add_argument("--compare", help="earlier results file; exit 1 on a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic trees")
+    parser.add_argument("--startup", action="store_true", help="check the startup / import-time budget")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results, failures = check_startup()
+        for r in results:
+            print(f"{r['name']:<16} {r['wall_s']:6.3f}s (budget {r['budget_s']:.1f}s)  slowest imports: "
+                  f"{', '.join(r['top_imports'])}")
+        for f in failures:
+            print(f"OVER BUDGET {f}")
+        return 1 if failures else 0
+
+    sizes = [tuple(int(x) for x in s.split("x")) for s in (FULL_SIZES if args.full else args.sizes).split(",")]
+    results = {"created": datetime.now().isoformat(timespec='seconds'), "python": sys.version.split()[0],
+               "trace": not args.no_trace, "cases": []}
+    for n_tickers, n_timestamps in sizes:
+        case = run_case(n_tickers, n_timestamps, trace=not args.no_trace, keep=args.keep)
+        print_case(case)
+        results["cases"].append(case)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_stage":
+        _stage_main(sys.argv[2], sys.argv[3], trace="--no-trace" not in sys.argv)
+    else:
+        sys.exit(main())
@@ -0,0 +1,133 @@
+import json
+import os
+import numpy as np
+import manifest
+import metrics
+
+# --- Chart rendering ---
+# Every chart is keyed by a hash of the data it plots (plus the render profile). When the hash
+# matches the last render and the PNG still exists, the render is skipped entirely.
+# Figures are drawn with the object API (no pyplot state) and kept for reuse within a process.
+DATA_DIR = "data_hub"
+CACHE_FILE = os.path.join(DATA_DIR, "chart_cache.json")
+PROFILE_ENV = "SAPA_CHART_PROFILE"
+CHART_VERSION = 1   # bump when the drawing code changes so cached PNGs are re-rendered
+
+PROFILES = {
+    "hires": {"dpi": 300, "max_points": 2000, "scale": 1.0},
+    "standard": {"dpi": 150, "max_points": 1200, "scale": 1.0},
+    "fast": {"dpi": 100, "max_points": 600, "scale": 0.75},
+}
+DEFAULT_PROFILE = "hires"
+
+_figures = {}
+stats = {"rendered": 0, "skipped": 0}
+
+
+def profile():
+    name = os.environ.get(PROFILE_ENV, DEFAULT_PROFILE)
+    return name, PROFILES.get(name, PROFILES[DEFAULT_PROFILE])
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling. Returns the indices of the points to keep."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (n_out - 2)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nxt_lo, nxt_hi = hi, min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(ts, values, max_points=None):
+    """Drop NaNs and LTTB-downsample a (timestamps, values) series for plotting."""
+    if max_points is None:
+        max_points = profile()[1]["max_points"]
+    ts = np.asarray(ts)
+    values = np.asarray(values, dtype=float)
+    mask = ~np.isnan(values)
+    ts, values = ts[mask], values[mask]
+    idx = lttb(ts.astype('datetime64[ns]').astype(np.int64), values, max_points)
+    return ts[idx], values[idx]
+
+
+def fingerprint(*parts):
+    """manifest.digest of the parts plus the active render profile."""
+    return manifest.digest([CHART_VERSION, profile()[0]], *parts)
+
+
+def _load_cache():
+    if not os.path.exists(CACHE_FILE):
+        return {}
+    try:
+        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    tmp = CACHE_FILE + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp, CACHE_FILE)
+
+
+def get_figure(name, size):
+    """Reusable Figure per chart name (cleared before each render)."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    scale = profile()[1]["scale"]
+    size = (size[0] * scale, size[1] * scale)
+    fig = _figures.get(name)
+    if fig is None:
+        fig = Figure(figsize=size)
+        FigureCanvasAgg(fig)
+        _figures[name] = fig
+    else:
+        fig.clf()
+        fig.set_size_inches(size)
+    return fig
+
+
+def render(path, digest, draw, size, style=None, dpi=None, force=False):
+    """Render `draw(fig)` to `path` unless the last render of `path` had the same digest.
+
+    `dpi` caps the profile's DPI for charts that never needed print resolution.
+    Returns True when the PNG was (re)written."""
+    cache = _load_cache()
+    if not force and cache.get(path) == digest and os.path.exists(path):
+        stats["skipped"] += 1
+        with metrics.span("chart.render", chart=os.path.basename(path)) as s:
+            s.add(cache_hits=1)
+        return False
+
+    import matplotlib
+    import matplotlib.style
+    with metrics.span("chart.render", chart=os.path.basename(path)) as s:
+        with matplotlib.style.context(style or 'default'):
+            fig = get_figure(path, size)
+            fig.set_facecolor(matplotlib.rcParams['figure.facecolor'])
+            draw(fig)
+            profile_dpi = profile()[1]["dpi"]
+            # Written next to the target and renamed, so an interrupted run never leaves a truncated PNG
+            fig.savefig(path + ".tmp", format='png', dpi=min(dpi, profile_dpi) if dpi else profile_dpi,
+                        bbox_inches='tight')
+            os.replace(path + ".tmp", path)
+        s.add(cache_misses=1, bytes_written=metrics.file_size(path))
+
+    cache[path] = digest
+    _save_cache(cache)
+    stats["rendered"] += 1
+    return True
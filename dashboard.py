@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import os
+import re
+import time
+
+# --- Local dashboard server ---
+# python dashboard.py serve   -> index.html plus /api/<name>.json (data_hub/snapshots, written by
+#                                generate_report) over HTTP/1.1 keep-alive
+# Every response carries a strong ETag (hash of the file) and "Cache-Control: no-cache", so the
+# browser revalidates each piece and gets an empty 304 when it hasn't changed. Bodies are gzipped
+# when the client accepts it; the ETag and compressed bytes are cached per (path, mtime, size),
+# so an unchanged file is never re-read or recompressed.
+# python dashboard.py measure -> serves on a free port and loads the dashboard with a small asyncio
+#                                client: cold (empty cache) and warm (If-None-Match) timings and bytes.
+DATA_DIR = "data_hub"
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots")
+INDEX_FILE = "index.html"
+SNAPSHOTS = ("summary", "holdings", "performance", "allocation")
+DEFAULT_PORT = 8000
+API_PATH = re.compile(r"^/api/([a-z_]+)\.json$")
+CONTENT_TYPES = {".html": "text/html; charset=utf-8", ".json": "application/json"}
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+class DashboardServer:
+    """asyncio HTTP server for index.html and the JSON snapshots."""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, root="."):
+        self.host, self.port, self.root = host, port, root
+        self.requests = 0
+        self._files = {}
+        self._connections = set()
+        self._server = None
+
+    def resolve(self, target):
+        path = target.split("?", 1)[0]
+        if path in ("/", "/" + INDEX_FILE):
+            return os.path.join(self.root, INDEX_FILE)
+        match = API_PATH.match(path)
+        if match and match.group(1) in SNAPSHOTS:
+            return os.path.join(self.root, SNAPSHOT_DIR, f"{match.group(1)}.json")
+        return None
+
+    def load(self, path):
+        """(etag, raw bytes, gzipped bytes) of a file, or None if it doesn't exist."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self._files.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(path, 'rb') as f:
+            raw = f.read()
+        entry = ('"' + hashlib.sha1(raw).hexdigest()[:20] + '"', raw, gzip.compress(raw, 6, mtime=0))
+        self._files[path] = (key, entry)
+        return entry
+
+    def respond(self, method, target, headers):
+        """(status, response headers, body) for one request (the GET body, also for HEAD)."""
+        if method not in ("GET", "HEAD"):
+            return 405, {}, b""
+        path = self.resolve(target)
+        entry = self.load(path) if path else None
+        if entry is None:
+            return 404, {"Content-Type": "text/plain"}, b"not found"
+        etag, raw, gz = entry
+        out = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding",
+               "Content-Type": CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")}
+        if etag in [t.strip() for t in headers.get("if-none-match", "").split(",")]:
+            return 304, out, b""
+        body = raw
+        if "gzip" in headers.get("accept-encoding", "") and len(gz) < len(raw):
+            body = gz
+            out["Content-Encoding"] = "gzip"
+        return 200, out, body
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = h.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                parts = line.decode('latin-1').split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+                self.requests += 1
+                status, out, body = self.respond(method, target, headers)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                out["Content-Length"] = str(len(body)) if status != 304 else "0"
+                out["Connection"] = "keep-alive" if keep_alive else "close"
+                if method == "HEAD":
+                    body = b""
+                head = f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in out.items())
+                writer.write(head.encode('latin-1') + b"\r\n" + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        # Let connections the clients already closed finish instead of cancelling them mid-read
+        if self._connections:
+            await asyncio.wait(set(self._connections), timeout=1.0)
+        await self._server.wait_closed()
+
+    async def serve_forever(self):
+        async with self:
+            print(f"Dashboard on http://{self.host}:{self.port}/")
+            await self._server.serve_forever()
+
+
+# --- Test client ------------------------------------------------------------------------------
+
+async def _request(reader, writer, host, path, etag=None, gzip_ok=True):
+    lines = [f"GET {path} HTTP/1.1", f"Host: {host}"]
+    if gzip_ok:
+        lines.append("Accept-Encoding: gzip")
+    if etag:
+        lines.append(f"If-None-Match: {etag}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b""):
+            break
+        name, _, value = h.decode('latin-1').partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers, body
+
+
+async def measure(host, port, paths=None, gzip_ok=True):
+    """Load `paths` on one keep-alive connection, cold then revalidating with the ETags received."""
+    paths = paths or ["/"] + [f"/api/{n}.json" for n in SNAPSHOTS]
+    reader, writer = await asyncio.open_connection(host, port)
+    etags, out = {}, {}
+    try:
+        for phase in ("cold", "warm"):
+            rows = []
+            start = time.perf_counter()
+            for path in paths:
+                t0 = time.perf_counter()
+                status, headers, body = await _request(reader, writer, host, path,
+                                                       etags.get(path) if phase == "warm" else None, gzip_ok)
+                size = len(gzip.decompress(body)) if headers.get("content-encoding") == "gzip" else len(body)
+                rows.append({"path": path, "status": status, "wire_bytes": len(body), "bytes": size,
+                             "ms": (time.perf_counter() - t0) * 1000})
+                if "etag" in headers:
+                    etags[path] = headers["etag"]
+            out[phase] = {"ms": (time.perf_counter() - start) * 1000, "rows": rows,
+                          "wire_bytes": sum(r["wire_bytes"] for r in rows)}
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return out
+
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def print_measure(result, root="."):
+    for phase in ("cold", "warm"):
+        r = result[phase]
+        print(f"{phase}: {r['ms']:.1f} ms, {r['wire_bytes']:,} bytes on the wire")
+        for row in r["rows"]:
+            print(f"  {row['status']} {row['path']:<24} {row['wire_bytes']:>8,} B (raw {row['bytes']:,} B)  {row['ms']:.2f} ms")
+    md = [os.path.join(root, p) for p in ("README.md", os.path.join(DATA_DIR, "portfolio_performance.png"),
+                                           os.path.join(DATA_DIR, "asset_allocation.png"))]
+    print(f"README + its PNGs for comparison: {sum(_file_size(p) for p in md):,} bytes")
+
+
+async def _measure_local(root, gzip_ok):
+    async with DashboardServer(port=0, root=root) as server:
+        return await measure(server.host, server.port, gzip_ok=gzip_ok)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Portfolio dashboard server")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="serve index.html and the JSON snapshots")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    m = sub.add_parser("measure", help="load the dashboard with a local test client and report timings")
+    m.add_argument("--no-gzip", action="store_true")
+    args = parser.parse_args()
+    if args.command == "serve":
+        try:
+            asyncio.run(DashboardServer(args.host, args.port).serve_forever())
+        except KeyboardInterrupt:
+            pass
+    else:
+        result = asyncio.run(_measure_local(".", not args.no_gzip))
+        print_measure(result)
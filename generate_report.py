@@ -1,11 +1,22 @@
 import json
-import pandas as pd
-import yfinance as yf
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import pytz
 import os
 import logging
+import lazy
+import metrics
+
+# Loaded on first use: a run without a portfolio never imports pandas
+pd = lazy.module("pandas")
+np = lazy.module("numpy")
+price_store = lazy.module("price_store")
+price_query = lazy.module("price_query")
+market_cache = lazy.module("market_cache")
+valuation = lazy.module("valuation")
+charts = lazy.module("charts")
+total_return = lazy.module("total_return")
+manifest = lazy.module("manifest")
+analytics = lazy.module("analytics")
 
 # --- Paths Configuration ---
 DATA_DIR = "data_hub"
@@ -14,6 +25,8 @@ PORTFOLIO_FILE = os.path.join(DATA_DIR, "portfolio.json")
 LOG_FILE = os.path.join(DATA_DIR, "error_log.txt")
 CHART_FILE = os.path.join(DATA_DIR, "portfolio_performance.png")
 PIE_FILE = os.path.join(DATA_DIR, "asset_allocation.png")
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots")
+SNAPSHOTS = ("summary", "holdings", "performance", "allocation")
 README_FILE = "README.md"
 TZ = pytz.timezone('Israel')
 
@@ -24,110 +37,206 @@ logging.basicConfig(filename=LOG_FILE, level=logging.ERROR,
 
 def get_live_usd_ils():
     try:
-        ticker = yf.Ticker("ILS=X")
-        data = ticker.history(period="1d")
-        return data['Close'].iloc[-1] if not data.empty else 3.65
+        return market_cache.latest_close("ILS=X", default=3.65)
     except Exception as e:
         logging.error(f"Exchange rate error: {e}")
         return 3.65
 
+def prices_at(df, tickers, when):
+    """Last price of each ticker at or before `when`, read from the store (only the week before it).
+
+    Tickers with nothing in the store over that window fall back to the frame's row at `when`."""
+    found = pd.Series(price_query.price_at(tickers, when), index=tickers, dtype=float)
+    missing = found.isna()
+    if missing.any():
+        found[missing] = valuation.value_at_or_before(df['ts'], df[tickers], when)[missing]
+    return found
+
+def _series(ts, values):
+    """[[epoch seconds, value], ...] for a JSON snapshot."""
+    epoch = np.asarray(ts, dtype='datetime64[s]').astype(np.int64).tolist()
+    return [[t, round(float(v), 2)] for t, v in zip(epoch, values)]
+
+def write_snapshots(summary, holdings_rows, plotted):
+    """Small precomputed JSON files for the index.html dashboard (data_hub/snapshots/<name>.json).
+
+    Only files whose content changed are rewritten (only the summary carries the update time), so
+    the dashboard's ETags stay valid for the pieces that didn't move."""
+    (port_ts, port_vals), (tr_ts, tr_vals), (spy_ts, spy_vals), (labels, weights) = plotted
+    docs = {
+        "summary": summary,
+        "holdings": {"rows": holdings_rows},
+        "performance": {"series": {
+            "portfolio": _series(port_ts, port_vals),
+            "total_return_ils": _series(tr_ts, tr_vals),
+            "benchmark": _series(spy_ts, spy_vals)}},
+        "allocation": {"weights": [{"ticker": t, "pct": float(w)} for t, w in zip(labels, weights)]},
+    }
+    for name in SNAPSHOTS:
+        data = json.dumps(docs[name], ensure_ascii=False, separators=(',', ':'))
+        manifest.write(os.path.join(SNAPSHOT_DIR, f"{name}.json"), data)
+
 def generate_visuals(df, holdings_data):
-    plt.switch_backend('Agg')
-    plt.rcParams['figure.dpi'] = 300
-    plt.rcParams['savefig.dpi'] = 300
-    
-    # 1. Performance Graph
-    plt.figure(figsize=(12, 6))
+    """Render the performance and allocation charts; returns the plotted (downsampled) data."""
+    # 1. Performance Graph (downsampled; skipped when the plotted data hasn't changed)
     portfolio_norm = (df['total_usd'] / df['total_usd'].iloc[0]) * 100
-    plt.plot(df['ts'], portfolio_norm, label='My Portfolio', color='#007AFF', linewidth=3)
+    port_ts, port_vals = charts.downsample(df['ts'].to_numpy(), portfolio_norm.to_numpy())
+    tr_norm = (df['total_tr_ils'] / df['total_tr_ils'].iloc[0]) * 100
+    tr_ts, tr_vals = charts.downsample(df['ts'].to_numpy(), tr_norm.to_numpy())
     
+    spy_ts, spy_vals = np.array([], dtype='datetime64[ns]'), np.array([])
     try:
-        spy = yf.Ticker("^GSPC").history(start=df['ts'].min(), end=df['ts'].max() + timedelta(days=1))
+        # SPY is sampled with the portfolio; ^GSPC is only fetched for stores without it
+        if analytics.BENCHMARK in df.columns:
+            spy = df.set_index('ts')[analytics.BENCHMARK].dropna()
+        else:
+            spy = market_cache.get_series("^GSPC", start=df['ts'].min(), end=df['ts'].max())
         if not spy.empty:
-            spy.index = spy.index.tz_localize(None) 
-            spy_norm = (spy['Close'] / spy['Close'].iloc[0]) * 100
-            plt.plot(spy.index, spy_norm, label='S&P 500 (Benchmark)', color='#FF9500', linestyle='--', alpha=0.8, linewidth=2)
+            spy_norm = (spy / spy.iloc[0]) * 100
+            spy_ts, spy_vals = charts.downsample(spy.index.to_numpy(), spy_norm.to_numpy())
     except Exception as e:
         logging.error(f"Benchmark error: {e}")
 
-    plt.title('Performance vs Benchmark (Normalized to 100)', fontsize=14, fontweight='bold')
-    plt.grid(True, linestyle=':', alpha=0.6)
-    plt.legend(frameon=True, shadow=True)
-    plt.savefig(CHART_FILE, dpi=300, bbox_inches='tight')
-    plt.close()
+    def draw_performance(fig):
+        ax = fig.add_subplot()
+        ax.plot(port_ts, port_vals, label='My Portfolio', color='#007AFF', linewidth=3)
+        ax.plot(tr_ts, tr_vals, label='Total Return in ILS (dividends reinvested)', color='#34C759', linewidth=1.5, alpha=0.9)
+        if len(spy_vals):
+            ax.plot(spy_ts, spy_vals, label='S&P 500 (SPY, Benchmark)', color='#FF9500', linestyle='--', alpha=0.8, linewidth=2)
+        ax.set_title('Performance vs Benchmark (Normalized to 100)', fontsize=14, fontweight='bold')
+        ax.grid(True, linestyle=':', alpha=0.6)
+        ax.legend(frameon=True, shadow=True)
+
+    charts.render(CHART_FILE, charts.fingerprint(port_ts, port_vals, tr_ts, tr_vals, spy_ts, spy_vals), draw_performance, size=(12, 6))
 
     # 2. Asset Allocation (Donut)
-    plt.figure(figsize=(10, 10))
     last_row = df.iloc[-1]
     tickers = list(holdings_data.keys())
     values = [last_row[t] * holdings_data[t]['amount'] for t in tickers if t in last_row and pd.notnull(last_row[t])]
     labels = [t for t in tickers if t in last_row and pd.notnull(last_row[t])]
+    weights = np.round(np.array(values) / sum(values) * 100, 1) if values else np.array([])
     
     if values:
-        colors = ['#FF595E', '#FFCA3A', '#8AC926', '#1982C4', '#6A4C93', '#4267B2']
-        plt.pie(values, labels=labels, autopct='%1.1f%%', startangle=140, colors=colors[:len(values)], pctdistance=0.85, explode=[0.02]*len(values))
-        centre_circle = plt.Circle((0,0), 0.70, fc='white')
-        plt.gcf().gca().add_artist(centre_circle)
-        plt.title('Asset Allocation (USD Weight)', fontsize=16, fontweight='bold')
-        plt.savefig(PIE_FILE, dpi=300, bbox_inches='tight')
-    plt.close()
-
-def main():
-    if not os.path.exists(HISTORY_FILE) or not os.path.exists(PORTFOLIO_FILE):
+        def draw_allocation(fig):
+            from matplotlib.patches import Circle
+            ax = fig.add_subplot()
+            colors = ['#FF595E', '#FFCA3A', '#8AC926', '#1982C4', '#6A4C93', '#4267B2']
+            ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=140, colors=colors[:len(values)], pctdistance=0.85, explode=[0.02]*len(values))
+            ax.add_artist(Circle((0,0), 0.70, fc='white'))
+            ax.set_title('Asset Allocation (USD Weight)', fontsize=16, fontweight='bold')
+
+        # Weights are rounded to the precision the labels show, so tiny price moves don't force a redraw
+        charts.render(PIE_FILE, charts.fingerprint(labels, weights), draw_allocation, size=(10, 10))
+
+    return (port_ts, port_vals), (tr_ts, tr_vals), (spy_ts, spy_vals), (labels, weights)
+
+def main(df=None):
+    if not os.path.exists(PORTFOLIO_FILE):
         return
 
     try:
         with open(PORTFOLIO_FILE, 'r') as f: holdings = json.load(f)
-        with open(HISTORY_FILE, 'r') as f: history = json.load(f)
+        df = price_store.load_frame() if df is None else df.copy()
     except Exception as e:
-        logging.error(f"JSON Load error: {e}")
+        logging.error(f"History load error: {e}")
         return
 
-    if not history: return
+    if df.empty: return
 
-    usd_to_ils = get_live_usd_ils()
     tickers = list(holdings.keys())
-    
-    df = pd.DataFrame([{"ts": e['timestamp'], **e['prices']} for e in history])
-    df['ts'] = pd.to_datetime(df['ts']).dt.tz_localize(None)
-    df = df.sort_values('ts')
+
+    # Dividends and historical USD/ILS come from the archive (ILS=X is only fetched when a series is
+    # first built over rows without a real rate); the live rate is only a fallback
+    try:
+        tr_series = total_return.load(tickers)
+    except Exception as e:
+        logging.error(f"Total return update failed: {e}")
+        tr_series = {}
     
     # Fill missing prices
     price_cols = [t for t in tickers if t in df.columns]
     df[price_cols] = df[price_cols].ffill()
+
+    # Each point converted at the rate of its own day
+    fx = total_return.fx_rates(df['ts'], tr_series) if tr_series else np.full(len(df), get_live_usd_ils())
+    usd_to_ils = float(fx[-1])
+
+    # Rows up to this point are adjusted closes that already include their dividends
+    adjusted_until = price_store.adjusted_until()
+
+    # Nothing to redo when prices, holdings, FX and dividends are what the current README was built from
+    inputs = {
+        "portfolio": manifest.file_digest(PORTFOLIO_FILE),
+        "prices": manifest.price_digests(df, price_cols + [analytics.BENCHMARK]),
+        "fx": manifest.digest(np.round(fx, 4)),
+        "dividends": {t: manifest.digest(s['reinvest'].to_numpy()) for t, s in tr_series.items()},
+        "adjusted_until": str(adjusted_until),
+    }
+    outputs = [CHART_FILE, PIE_FILE] + [os.path.join(SNAPSHOT_DIR, f"{n}.json") for n in SNAPSHOTS]
+    if manifest.fresh(README_FILE, inputs) and all(os.path.exists(p) for p in outputs):
+        return
     
-    # Calculate Total Value (New structure)
-    df['total_usd'] = df.apply(lambda r: sum(r[t] * holdings[t]['amount'] for t in tickers if t in r and pd.notnull(r[t])), axis=1)
+    # Valuation, cost basis, P&L and daily change - one matrix product over the price history
+    summary, values = valuation.summarize(df, {"main": holdings}, lookback=timedelta(days=1))
+    df['total_usd'] = values["main"]
+    main_summary = summary.loc["main"]
     
-    current_val_usd = df['total_usd'].iloc[-1]
+    df['total_ils'] = df['total_usd'].to_numpy() * fx
+    reinvested = total_return.reinvested_prices(df[['ts'] + price_cols], tr_series, adjusted_until)
+    df['total_tr_ils'] = valuation.portfolio_values(reinvested, {"main": holdings})["main"].to_numpy() * fx
+    current_val_ils = df['total_ils'].iloc[-1]
     
     # 1. Total Invested (Cost Basis)
-    total_invested_usd = sum(h['amount'] * h['avg_price'] for h in holdings.values())
-    total_pnl_usd = current_val_usd - total_invested_usd
-    total_pnl_pct = (total_pnl_usd / total_invested_usd) * 100
+    total_invested_usd = main_summary["invested"]
+    total_pnl_usd = main_summary["pnl"]
+    total_pnl_pct = main_summary["pnl_pct"]
 
-    # 2. Daily Change
-    one_day_ago = df['ts'].max() - timedelta(days=1)
-    past_day_df = df[df['ts'] <= one_day_ago]
-    prev_val_usd = past_day_df['total_usd'].iloc[-1] if not past_day_df.empty else df['total_usd'].iloc[0]
-    daily_change_pct = ((current_val_usd / prev_val_usd) - 1) * 100
-    daily_change_ils = (current_val_usd - prev_val_usd) * usd_to_ils
+    # 2. Daily Change - prices a day ago come from a range query on the store, not a scan of the frame
+    day_ago = df['ts'].iloc[-1] - timedelta(days=1)
+    previous_prices = prices_at(df, price_cols, day_ago).to_frame().T
+    previous_usd = valuation.portfolio_values(previous_prices, {"main": holdings})["main"].iloc[0]
+    daily_change_pct = (main_summary["current_value"] / previous_usd - 1) * 100
+    previous_ils = previous_usd * valuation.value_at_or_before(df['ts'], pd.Series(fx), day_ago)
 
-    generate_visuals(df, holdings)
+    # 3. Beta vs SPY, rolling correlation and drawdowns (streaming state, fed only the new samples)
+    risk_rows = []
+    try:
+        state = analytics.sync(df, holdings)
+        port = analytics.portfolio_summary(state, holdings)
+        for t, r in analytics.table(state, holdings).iterrows():
+            if t in holdings:
+                risk_rows.append(f"| {t} | {r['beta']:.2f} | {r['corr']:.2f} | {r['drawdown']:.2f}% | {r['max_drawdown']:.2f}% |")
+    except Exception as e:
+        logging.error(f"Analytics update failed: {e}")
+        port = None
+    daily_change_ils = df['total_ils'].iloc[-1] - previous_ils
+
+    plotted = generate_visuals(df, holdings)
 
     # --- Build Stock Table ---
     stock_rows = []
-    for t in tickers:
-        if t in df.columns:
-            curr_p = df[t].iloc[-1]
-            avg_p = holdings[t]['avg_price']
-            amt = holdings[t]['amount']
-            gain_pct = ((curr_p / avg_p) - 1) * 100
-            gain_ils = (curr_p - avg_p) * amt * usd_to_ils
-            emoji = "🟢" if gain_pct > 0 else "🔴"
-            stock_rows.append(f"| {t} | {amt} | ${avg_p:,.2f} | ${curr_p:,.2f} | {emoji} {gain_pct:+.2f}% | ₪{gain_ils:,.0f} |")
+    holdings_rows = []
+    pos = valuation.positions(prices_at(df, price_cols, df['ts'].iloc[-1]), holdings)
+    for t, p in pos.iterrows():
+        amt = holdings[t]['amount']
+        gain_ils = p['gain'] * usd_to_ils
+        emoji = "🟢" if p['gain_pct'] > 0 else "🔴"
+        stock_rows.append(f"| {t} | {amt} | ${p['avg_price']:,.2f} | ${p['price']:,.2f} | {emoji} {p['gain_pct']:+.2f}% | ₪{gain_ils:,.0f} |")
+        holdings_rows.append({"ticker": t, "shares": amt, "avg_price": round(float(p['avg_price']), 2),
+                              "price": round(float(p['price']), 2), "gain_pct": round(float(p['gain_pct']), 2),
+                              "gain_ils": round(float(gain_ils), 2)})
 
     update_time = datetime.now(TZ).strftime('%d/%m/%Y %H:%M')
+    write_snapshots({
+        "updated": datetime.now(TZ).isoformat(timespec='seconds'),
+        "usd_ils": round(usd_to_ils, 4),
+        "value_ils": round(float(current_val_ils), 2),
+        "invested_ils": round(float(total_invested_usd * usd_to_ils), 2),
+        "pnl_ils": round(float(total_pnl_usd * usd_to_ils), 2),
+        "pnl_pct": round(float(total_pnl_pct), 2),
+        "daily_change_pct": round(float(daily_change_pct), 2),
+        "daily_change_ils": round(float(daily_change_ils), 2),
+    }, holdings_rows, plotted)
     
     output = [
         f"# 📊 Portfolio Dashboard | מעקב תיק השקעות",
@@ -136,16 +245,28 @@ def main():
         f"## 💰 Portfolio Summary | סיכום התיק",
         f"| Metric | Value | נתון |",
         f"| :--- | :--- | :--- |",
-        f"| **Current Value** | `₪{current_val_usd * usd_to_ils:,.0f}` | **שווי נוכחי** |",
+        f"| **Current Value** | `₪{current_val_ils:,.0f}` | **שווי נוכחי** |",
         f"| **Total Invested** | `₪{total_invested_usd * usd_to_ils:,.0f}` | **סך השקעה** |",
         f"| **Total Profit/Loss** | `{total_pnl_pct:+.2f}%` (₪{total_pnl_usd * usd_to_ils:,.0f}) | **רווח/הפסד כולל** |",
-        f"| **Daily Change** | `{daily_change_pct:+.2f}%` | **שינוי יומי** |",
+        f"| **Daily Change** | `{daily_change_pct:+.2f}%` (₪{daily_change_ils:,.0f}) | **שינוי יומי** |",
         
         f"\n## 📜 Holdings | פירוט החזקות",
         f"| Ticker | Shares | Avg. Cost | Current Price | P&L % | P&L ILS |",
         f"| :--- | :--- | :--- | :--- | :--- | :--- |",
         "\n".join(stock_rows),
         
+        *([
+            f"\n## 📉 Risk Analytics | ניתוח סיכון",
+            f"| Metric | Value | נתון |",
+            f"| :--- | :--- | :--- |",
+            f"| **Portfolio Beta (vs SPY)** | `{port['beta']:.2f}` | **בטא מול SPY** |",
+            f"| **Drawdown from Peak** | `{port['drawdown']:.2f}%` | **ירידה מהשיא** |",
+            f"| **Max Drawdown** | `{port['max_drawdown']:.2f}%` | **ירידה מקסימלית** |",
+            f"\n| Ticker | Beta | Corr. SPY ({port['window']} samples) | Drawdown | Max Drawdown |",
+            f"| :--- | :--- | :--- | :--- | :--- |",
+            "\n".join(risk_rows),
+        ] if port else []),
+
         f"\n## 📈 Charts | גרפים",
         f"![Performance](./{CHART_FILE})",
         f"![Allocation](./{PIE_FILE})",
@@ -153,8 +274,10 @@ def main():
         f"📂 *Created by Almog787*"
     ]
 
-    with open(README_FILE, 'w', encoding='utf-8') as f:
-        f.write("\n".join(output))
+    with metrics.span("report.write", file=README_FILE) as s:
+        if manifest.write(README_FILE, "\n".join(output), inputs):
+            s.add(bytes_written=metrics.file_size(README_FILE))
 
 if __name__ == "__main__":
+    metrics.start_run()
     main()
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 import pytz
 import os
 import logging
+import price_store
 
 # --- Paths Configuration ---
 DATA_DIR = "data_hub"
@@ -78,7 +79,7 @@ def main():
 
     try:
         with open(PORTFOLIO_FILE, 'r') as f: holdings = json.load(f)
-        with open(HISTORY_FILE, 'r') as f: history = json.load(f)
+        history = price_store.read_history(HISTORY_FILE)
     except Exception as e:
         logging.error(f"JSON Load error: {e}")
         return
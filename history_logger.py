@@ -1,9 +1,18 @@
+import argparse
+import heapq
 import json
-import pandas as pd
-import yfinance as yf
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from datetime import datetime
 import pytz
+import lazy
+import metrics
+
+np = lazy.module("numpy")
+pd = lazy.module("pandas")
+market_data = lazy.module("market_data")
+market_cache = lazy.module("market_cache")
 
 # --- הגדרות נתיבים ---
 DATA_DIR = "data_hub"
@@ -11,56 +20,196 @@ HISTORY_DIR = os.path.join(DATA_DIR, "price_history_archive")
 INDIVIDUAL_DIR = os.path.join(HISTORY_DIR, "individual_stocks") # תיקייה לקבצים נפרדים
 PORTFOLIO_FILE = os.path.join(DATA_DIR, "portfolio.json")
 CSV_HISTORY_FILE = os.path.join(HISTORY_DIR, "full_stocks_extended_history.csv")
+TAIL_INDEX_FILE = os.path.join(HISTORY_DIR, "tail_index.json") # חותמת הזמן האחרונה לכל מניה
+CSV_COLUMNS = ["timestamp", "ticker", "price", "dividend", "pe_ratio", "usd_ils"]
 TZ = pytz.timezone('Israel')
+BACKFILL_BATCH = 25     # מניות בכל הורדה מרוכזת
+BACKFILL_WORKERS = 4
 
 # יצירת תיקיות אם לא קיימות
 os.makedirs(HISTORY_DIR, exist_ok=True)
 os.makedirs(INDIVIDUAL_DIR, exist_ok=True)
 
-def fetch_comprehensive_history(tickers):
-    """מושך היסטוריה מלאה של מחירים, דיבידנדים ושערי חליפין (5 שנים)"""
-    all_data = []
-    
-    print("Fetching historical exchange rates (USD/ILS)...")
-    usd_ils_hist = yf.download("ILS=X", period="5y", interval="1d", progress=False)['Close']
+def build_history_table(closes, dividends, usd_ils_hist, pe_ratios, tickers):
+    """בונה את טבלת הארכיון (שורה לכל תאריך ומניה) ביישור אינדקסים - ללא לולאה על שורות"""
+    tickers = [t for t in tickers if t in closes.columns]
+    closes = closes[tickers].sort_index()
+    dates = closes.index
+    divs = dividends.reindex(index=dates, columns=tickers).fillna(0.0)
+    fx = usd_ils_hist.dropna().sort_index().reindex(dates, method='ffill').bfill().fillna(3.65)
 
+    table = pd.DataFrame({
+        "timestamp": np.tile(dates.strftime('%Y-%m-%d %H:%M:%S').to_numpy(), len(tickers)),
+        "ticker": np.repeat(tickers, len(dates)),
+        "price": closes.to_numpy().ravel(order='F'),
+        "dividend": divs.to_numpy().ravel(order='F'),
+        "usd_ils": np.tile(fx.to_numpy(dtype=float), len(tickers)),
+    })
+    table = table[table['price'].notna()].reset_index(drop=True)
+    table['price'] = table['price'].round(2)
+    table['dividend'] = table['dividend'].round(2)
+    table['usd_ils'] = table['usd_ils'].round(4)
+
+    # מכפיל רווח עדכני - רק בשורה האחרונה של כל מניה
+    is_last = ~table['ticker'].duplicated(keep='last')
+    table['pe_ratio'] = table['ticker'].map(pe_ratios).where(is_last)
+    return table[CSV_COLUMNS]
+
+def _read_last_line(path):
+    """קורא רק את השורה האחרונה בקובץ (מהסוף אחורה)"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        chunk = b""
+        while pos > 0 and chunk.rstrip(b"\r\n").count(b"\n") < 1:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + chunk
+    lines = chunk.rstrip(b"\r\n").splitlines()
+    return lines[-1].decode('utf-8') if lines else ""
+
+def load_tail_index(tickers):
+    """טוען את אינדקס הזנב; מניות חסרות משוחזרות מהשורה האחרונה בקובץ הנפרד שלהן"""
+    index = {}
+    if os.path.exists(TAIL_INDEX_FILE):
+        with open(TAIL_INDEX_FILE, 'r', encoding='utf-8') as f:
+            index = json.load(f)
     for ticker in tickers:
-        print(f"Fetching full 5-year history for {ticker}...")
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period="5y")
-        dividends = stock.dividends
-        current_pe = stock.info.get('trailingPE', None)
-
-        for date, row in hist.iterrows():
-            date_str = date.strftime('%Y-%m-%d %H:%M:%S')
-            
-            div_val = 0
-            if date in dividends.index:
-                div_val = float(dividends.loc[date])
-            
-            exchange_rate = 3.65 
-            if date in usd_ils_hist.index:
-                exchange_rate = float(usd_ils_hist.loc[date])
-
-            all_data.append({
-                "timestamp": date_str,
-                "ticker": ticker,
-                "price": round(float(row['Close']), 2),
-                "dividend": round(div_val, 2),
-                "pe_ratio": current_pe if date == hist.index[-1] else None,
-                "usd_ils": round(exchange_rate, 4)
-            })
-            
-    return pd.DataFrame(all_data)
-
-def save_individual_files(df):
-    """מפצל את ה-DataFrame המאוחד לקבצים נפרדים לכל מניה"""
-    tickers = df['ticker'].unique()
-    for ticker in tickers:
-        ticker_df = df[df['ticker'] == ticker]
+        if ticker in index:
+            continue
         file_path = os.path.join(INDIVIDUAL_DIR, f"{ticker}_history.csv")
-        ticker_df.to_csv(file_path, index=False, encoding='utf-8')
-    print(f"Updated {len(tickers)} individual stock files in {INDIVIDUAL_DIR}")
+        if os.path.exists(file_path):
+            last_ts = _read_last_line(file_path).split(",", 1)[0]
+            if last_ts and last_ts != "timestamp":
+                index[ticker] = last_ts
+    return index
+
+def save_tail_index(index):
+    tmp = TAIL_INDEX_FILE + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp, TAIL_INDEX_FILE)
+
+def build_tail_index(df):
+    return df.groupby('ticker')['timestamp'].max().to_dict()
+
+def _append_csv(df, file_path):
+    write_header = not os.path.exists(file_path) or os.path.getsize(file_path) == 0
+    df.to_csv(file_path, mode='a', header=write_header, index=False, encoding='utf-8')
+
+def append_new_rows(new_df):
+    """מוסיף לקבצים רק שורות (timestamp, ticker) חדשות - O(שורות חדשות) ולא O(כל ההיסטוריה)"""
+    if new_df.empty:
+        return 0
+    new_df = new_df.reindex(columns=CSV_COLUMNS)
+    new_df = new_df.drop_duplicates(subset=['timestamp', 'ticker'], keep='last')
+    index = load_tail_index(new_df['ticker'].unique())
+    last_seen = new_df['ticker'].map(index).fillna("")
+    fresh = new_df[new_df['timestamp'] > last_seen].sort_values('timestamp', kind='stable')
+    if fresh.empty:
+        print("No new rows to append.")
+        return 0
+
+    with metrics.span("archive.append") as s:
+        before = metrics.file_size(CSV_HISTORY_FILE)
+        _append_csv(fresh, CSV_HISTORY_FILE)
+        for ticker, ticker_df in fresh.groupby('ticker', sort=False):
+            _append_csv(ticker_df, os.path.join(INDIVIDUAL_DIR, f"{ticker}_history.csv"))
+        s.add(rows=len(fresh), bytes_written=2 * (metrics.file_size(CSV_HISTORY_FILE) - before))
+
+    index.update(build_tail_index(fresh))
+    save_tail_index(index)
+    print(f"Appended {len(fresh)} new rows for {fresh['ticker'].nunique()} tickers")
+    return len(fresh)
+
+def _shard_path(ticker, individual_dir=INDIVIDUAL_DIR):
+    return os.path.join(individual_dir, f"{ticker}_history.csv")
+
+def _write_atomic_csv(df, file_path):
+    tmp = file_path + ".tmp"
+    df.to_csv(tmp, index=False, encoding='utf-8')
+    os.replace(tmp, file_path)
+
+def _backfill_batch(batch, usd_ils_hist, period, individual_dir):
+    """מוריד קבוצת מניות וכותב כל מניה לקובץ הנפרד שלה (אטומית). מחזיר {מניה: מספר שורות}"""
+    closes, dividends = market_data.fetch_prices(batch, period=period)
+    infos = market_data.fetch_infos(batch)
+    pe_ratios = {t: infos.get(t, {}).get('trailingPE', None) for t in batch}
+    table = build_history_table(closes.dropna(how='all'), dividends, usd_ils_hist, pe_ratios, batch)
+    written = {}
+    with metrics.span("archive.shards") as s:
+        for ticker, ticker_df in table.groupby('ticker', sort=False):
+            _write_atomic_csv(ticker_df, _shard_path(ticker, individual_dir))
+            written[ticker] = len(ticker_df)
+            s.add(rows=len(ticker_df), bytes_written=metrics.file_size(_shard_path(ticker, individual_dir)))
+    return written
+
+def backfill(tickers, period="5y", workers=BACKFILL_WORKERS, batch_size=BACKFILL_BATCH, processes=False,
+             restart=False, individual_dir=INDIVIDUAL_DIR, merged_file=CSV_HISTORY_FILE):
+    """בנייה מקבילית של הארכיון: קבוצות מניות במאגר תהליכונים/תהליכים, קובץ נפרד לכל מניה שהושלמה.
+    קבצים קיימים מדולגים (המשך אחרי קריסה), ובסוף מיזוג k-כיווני לפי זמן לקובץ המאוחד."""
+    tickers = list(dict.fromkeys(tickers))
+    os.makedirs(individual_dir, exist_ok=True)
+    pending = [t for t in tickers if restart or not os.path.exists(_shard_path(t, individual_dir))]
+    print(f"Backfill: {len(tickers) - len(pending)} tickers already on disk, {len(pending)} to fetch")
+
+    failed = []
+    if pending:
+        # שער החליפין נמשך פעם אחת ומשותף לכל הקבוצות
+        usd_ils_hist = market_cache.get_daily([market_data.FX_TICKER], period=period)[0][market_data.FX_TICKER]
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        pool_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with pool_cls(max_workers=max(1, min(workers, len(batches)))) as pool:
+            futures = {pool.submit(_backfill_batch, b, usd_ils_hist, period, individual_dir): b for b in batches}
+            for n, future in enumerate(as_completed(futures), 1):
+                batch = futures[future]
+                try:
+                    written = future.result()
+                except Exception as e:
+                    logging.error(f"Backfill failed for {','.join(batch)}: {e}")
+                    written = {}
+                failed.extend(t for t in batch if t not in written)
+                print(f"  batch {n}/{len(batches)}: {len(written)}/{len(batch)} tickers written")
+    if failed:
+        print(f"No data for {len(failed)} tickers (rerun to retry): {', '.join(failed[:20])}")
+
+    done = [t for t in tickers if os.path.exists(_shard_path(t, individual_dir))]
+    rows = merge_shards([_shard_path(t, individual_dir) for t in done], merged_file)
+    index = {}
+    for t in done:
+        last_ts = _read_last_line(_shard_path(t, individual_dir)).split(",", 1)[0]
+        if last_ts and last_ts != "timestamp":
+            index[t] = last_ts
+    save_tail_index(index)
+    print(f"Merged {rows} rows from {len(done)} shards into {merged_file}")
+    return failed
+
+def _merge_shards(paths, merged_file):
+    files = [open(p, 'r', encoding='utf-8') for p in paths]
+    rows = 0
+    tmp = merged_file + ".tmp"
+    try:
+        for f in files:
+            f.readline()    # כותרת
+        streams = [(line for line in f if line.strip()) for f in files]
+        with open(tmp, 'w', encoding='utf-8', newline='') as out:
+            out.write(",".join(CSV_COLUMNS) + "\n")
+            for line in heapq.merge(*streams, key=lambda line: line.split(",", 1)[0]):
+                out.write(line if line.endswith("\n") else line + "\n")
+                rows += 1
+    finally:
+        for f in files:
+            f.close()
+    os.replace(tmp, merged_file)
+    return rows
+
+def merge_shards(paths, merged_file=CSV_HISTORY_FILE):
+    """מיזוג k-כיווני (heapq) של קבצים ממוינים לפי זמן - זיכרון של שורה אחת לכל קובץ"""
+    with metrics.span("archive.merge", shards=len(paths)) as s:
+        rows = _merge_shards(paths, merged_file)
+        s.add(rows=rows, bytes_read=sum(metrics.file_size(p) for p in paths), bytes_written=metrics.file_size(merged_file))
+    return rows
 
 def update_csv_history():
     if not os.path.exists(PORTFOLIO_FILE):
@@ -74,29 +223,34 @@ def update_csv_history():
     if not os.path.exists(CSV_HISTORY_FILE):
         # הרצה ראשונה - בנייה מאפס
         print("Initial run: Building full historical database...")
-        combined_df = fetch_comprehensive_history(tickers)
+        # בנייה מקבילית לקבצים נפרדים, ואז מיזוג לקובץ המאוחד
+        backfill(tickers)
     else:
         # עדכון שוטף - הוספת נתוני היום
         print("Existing history found. Fetching today's update...")
         current_time = datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
         
-        # שער חליפין נוכחי
+        # מחירים, דיבידנדים ושער חליפין - בקריאה מרוכזת אחת לכל התיק
         try:
-            usd_ils = yf.Ticker("ILS=X").history(period="1d")['Close'].iloc[-1]
-        except:
-            usd_ils = 3.65
+            closes, dividends = market_cache.get_daily(list(tickers) + [market_data.FX_TICKER], period="5d")
+        except Exception as e:
+            print(f"Batched price fetch failed: {e}")
+            return
+        fx = closes[market_data.FX_TICKER].dropna()
+        usd_ils = fx.iloc[-1] if not fx.empty else 3.65
+        infos = market_data.fetch_infos(tickers)
 
         new_entries = []
         for ticker in tickers:
             try:
-                stock = yf.Ticker(ticker)
-                hist = stock.history(period="1d")
+                hist = closes[ticker].dropna()
                 if hist.empty: continue
                 
-                price = round(hist['Close'].iloc[-1], 2)
-                divs = stock.dividends
+                price = round(hist.iloc[-1], 2)
+                divs = dividends[ticker]
+                divs = divs[divs > 0]
                 today_div = round(divs.iloc[-1], 2) if not divs.empty and (datetime.now().date() == divs.index[-1].date()) else 0
-                pe = stock.info.get('trailingPE', None)
+                pe = infos.get(ticker, {}).get('trailingPE', None)
 
                 new_entries.append({
                     "timestamp": current_time,
@@ -109,18 +263,34 @@ def update_csv_history():
             except Exception as e:
                 print(f"Error updating {ticker}: {e}")
 
-        new_df = pd.DataFrame(new_entries)
-        old_df = pd.read_csv(CSV_HISTORY_FILE)
-        combined_df = pd.concat([old_df, new_df], ignore_index=True)
-        combined_df.drop_duplicates(subset=['timestamp', 'ticker'], keep='last', inplace=True)
-    
-    # שמירת הקובץ המאוחד הראשי
-    combined_df.to_csv(CSV_HISTORY_FILE, index=False, encoding='utf-8')
-    
-    # פיצול ושמירה לקבצים נפרדים
-    save_individual_files(combined_df)
-    
+        # מצב אינקרמנטלי - הוספה בלבד, ללא קריאה וכתיבה מחדש של כל הקבצים
+        append_new_rows(pd.DataFrame(new_entries, columns=CSV_COLUMNS))
+
     print("All updates completed successfully.")
 
+def _load_portfolio_tickers():
+    with open(PORTFOLIO_FILE, 'r') as f:
+        return list(json.load(f).keys())
+
 if __name__ == "__main__":
-    update_csv_history()
+    metrics.start_run()
+    parser = argparse.ArgumentParser(description="Price history archive")
+    sub = parser.add_subparsers(dest="command")
+    bf = sub.add_parser("backfill", help="parallel, resumable full-history build")
+    bf.add_argument("tickers", nargs="*", help="tickers (default: the portfolio)")
+    bf.add_argument("--tickers-file", help="file with one ticker per line")
+    bf.add_argument("--period", default="5y")
+    bf.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    bf.add_argument("--batch-size", type=int, default=BACKFILL_BATCH)
+    bf.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    bf.add_argument("--restart", action="store_true", help="refetch tickers that already have a shard")
+    args = parser.parse_args()
+    if args.command == "backfill":
+        tickers = list(args.tickers)
+        if args.tickers_file:
+            with open(args.tickers_file, 'r', encoding='utf-8') as f:
+                tickers += [line.strip() for line in f if line.strip()]
+        backfill(tickers or _load_portfolio_tickers(), period=args.period, workers=args.workers,
+                 batch_size=args.batch_size, processes=args.processes, restart=args.restart)
+    else:
+        update_csv_history()
@@ -0,0 +1,319 @@
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+import manifest
+import metrics
+
+# --- Streaming indicator engine ---
+# O(1) state per ticker, updated once per new price sample and persisted between runs:
+#   running mean / variance (Welford)        -> z-score vs. the full history
+#   ring buffers of the last 20 / 50 prices  -> short / long moving averages
+#   ring buffer of the last 14 gains/losses  -> RSI (same simple-average RSI analysis_pro reports)
+#   Wilder-smoothed average gain/loss        -> rsi_wilder
+DATA_DIR = "data_hub"
+STATE_FILE = os.path.join(DATA_DIR, "indicator_state.json")
+SHORT_WINDOW = 20
+LONG_WINDOW = 50
+RSI_WINDOW = 14
+STATE_VERSION = 1
+
+# Classification thresholds (analysis_pro wording is keyed on these labels)
+Z_THRESHOLD = 1.5
+RSI_OVERBOUGHT = 70
+RSI_OVERSOLD = 30
+TABLE_COLUMNS = ["price", "count", "mean", "std", "z_score", "ma_short", "ma_long", "rsi"]
+
+
+class RingBuffer:
+    """Fixed-size window; push is O(1), mean is O(window) over a constant-size buffer."""
+
+    def __init__(self, size, values=None, head=0):
+        self.size = size
+        self.values = list(values) if values else []
+        self.head = head
+
+    def push(self, value):
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            self.values[self.head] = value
+            self.head = (self.head + 1) % self.size
+
+    def __len__(self):
+        return len(self.values)
+
+    def full(self):
+        return len(self.values) == self.size
+
+    def mean(self):
+        return math.fsum(self.values) / len(self.values) if self.values else float('nan')
+
+    def to_dict(self):
+        return {"size": self.size, "values": self.values, "head": self.head}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["size"], d["values"], d["head"])
+
+
+class TickerState:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last = None    # last valid price
+        self.prev = None    # previous raw sample (None when it was missing)
+        self.short = RingBuffer(SHORT_WINDOW)
+        self.long = RingBuffer(LONG_WINDOW)
+        self.gains = RingBuffer(RSI_WINDOW)
+        self.losses = RingBuffer(RSI_WINDOW)
+        self.deltas = 0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+
+    def update(self, price):
+        """Feed one raw sample. A NaN sample counts as a zero gain/loss for the simple RSI
+        (like pandas' diff().where(...)) and is otherwise skipped."""
+        if price is None or price != price:
+            self.gains.push(0.0)
+            self.losses.push(0.0)
+            self.prev = None
+            return
+        price = float(price)
+        self.count += 1
+        delta = price - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (price - self.mean)
+        self.short.push(price)
+        self.long.push(price)
+
+        if self.prev is None:
+            # pandas' diff() yields NaN after a missing sample and where() turns it into a 0 gain/loss
+            self.gains.push(0.0)
+            self.losses.push(0.0)
+        else:
+            change = price - self.prev
+            self.gains.push(max(change, 0.0))
+            self.losses.push(max(-change, 0.0))
+
+        if self.last is not None:
+            change = price - self.last
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            self.deltas += 1
+            if self.deltas <= RSI_WINDOW:
+                # Wilder seeds with a simple average of the first window
+                self.avg_gain += (gain - self.avg_gain) / self.deltas
+                self.avg_loss += (loss - self.avg_loss) / self.deltas
+            else:
+                self.avg_gain = (self.avg_gain * (RSI_WINDOW - 1) + gain) / RSI_WINDOW
+                self.avg_loss = (self.avg_loss * (RSI_WINDOW - 1) + loss) / RSI_WINDOW
+        self.prev = self.last = price
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float('nan')
+
+    @property
+    def z_score(self):
+        std = self.std
+        # The full-history z-score is taken at the latest raw sample (NaN if that sample is missing)
+        price = self.prev if self.prev is not None else float('nan')
+        return (price - self.mean) / std if std > 0 else 0
+
+    @property
+    def ma_short(self):
+        return self.short.mean() if self.short.full() else float('nan')
+
+    @property
+    def ma_long(self):
+        # analysis_pro uses window=min(len(prices), 50)
+        return self.long.mean()
+
+    @staticmethod
+    def _rsi(avg_gain, avg_loss):
+        if avg_loss == 0:
+            return 100.0 if avg_gain > 0 else 50
+        return 100 - (100 / (1 + avg_gain / avg_loss))
+
+    @property
+    def rsi(self):
+        if not self.gains.full():
+            return 50
+        return self._rsi(self.gains.mean(), self.losses.mean())
+
+    @property
+    def rsi_wilder(self):
+        if self.deltas < RSI_WINDOW:
+            return 50
+        return self._rsi(self.avg_gain, self.avg_loss)
+
+    def snapshot(self):
+        return {"price": self.last, "count": self.count, "mean": self.mean, "std": self.std,
+                "z_score": self.z_score, "ma_short": self.ma_short, "ma_long": self.ma_long,
+                "rsi": self.rsi, "rsi_wilder": self.rsi_wilder}
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "last": self.last, "prev": self.prev,
+                "short": self.short.to_dict(), "long": self.long.to_dict(),
+                "gains": self.gains.to_dict(), "losses": self.losses.to_dict(),
+                "deltas": self.deltas, "avg_gain": self.avg_gain, "avg_loss": self.avg_loss}
+
+    @classmethod
+    def from_dict(cls, d):
+        state = cls()
+        state.count, state.mean, state.m2, state.last = d["count"], d["mean"], d["m2"], d["last"]
+        state.prev = d["prev"]
+        state.short = RingBuffer.from_dict(d["short"])
+        state.long = RingBuffer.from_dict(d["long"])
+        state.gains = RingBuffer.from_dict(d["gains"])
+        state.losses = RingBuffer.from_dict(d["losses"])
+        state.deltas, state.avg_gain, state.avg_loss = d["deltas"], d["avg_gain"], d["avg_loss"]
+        return state
+
+
+def new_state():
+    return {"version": STATE_VERSION, "rows": 0, "last_ts": None, "tickers": {}}
+
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return new_state()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
+        return new_state()
+    if raw.get("version") != STATE_VERSION:
+        return new_state()
+    raw["tickers"] = {t: TickerState.from_dict(d) for t, d in raw["tickers"].items()}
+    return raw
+
+
+def save_state(state, path=STATE_FILE):
+    out = dict(state, tickers={t: s.to_dict() for t, s in state["tickers"].items()})
+    manifest.write(path, json.dumps(out))
+
+
+def update(state, df):
+    """Feed the rows of a wide frame ('ts' + ticker columns) into the state."""
+    if df.empty:
+        return state
+    columns = [c for c in df.columns if c != 'ts']
+    matrix = df[columns].to_numpy(dtype=float)
+    tickers = state["tickers"]
+    for c in columns:
+        tickers.setdefault(c, TickerState())
+    for row in matrix:
+        for c, price in zip(columns, row):
+            tickers[c].update(price)
+    state["rows"] += len(df)
+    state["last_ts"] = str(df['ts'].iloc[-1])
+    return state
+
+
+def sync(df, path=STATE_FILE, save=True):
+    """Bring the persisted state up to date with a full history frame, feeding only rows newer
+    than the last timestamp the state has seen.
+
+    Older rows may change underneath (retention compaction rolls them into bars); the state is a
+    running summary of what it has seen and is only rebuilt when the frame ends before it."""
+    state = load_state(path)
+    start = 0
+    if state["last_ts"] is not None and not df.empty:
+        last_seen = np.datetime64(pd.Timestamp(state["last_ts"]))
+        if last_seen > df['ts'].to_numpy()[-1]:
+            state = new_state()
+        else:
+            start = int(np.searchsorted(df['ts'].to_numpy(), last_seen, side='right'))
+    if start < len(df):
+        with metrics.span("indicators.update") as s:
+            update(state, df.iloc[start:])
+            s.add(rows=len(df) - start)
+        if save:
+            save_state(state, path)
+    return state
+
+
+def snapshot(state, tickers=None):
+    """{ticker: indicator values} for the requested tickers."""
+    tickers = state["tickers"] if tickers is None else [t for t in tickers if t in state["tickers"]]
+    return {t: state["tickers"][t].snapshot() for t in tickers}
+
+
+def state_table(state, tickers=None):
+    """Ticker x indicator table from the streaming state."""
+    snap = snapshot(state, tickers)
+    return pd.DataFrame.from_dict(snap, orient='index').reindex(columns=TABLE_COLUMNS)
+
+
+def _price_matrix(df):
+    return df.drop(columns='ts') if 'ts' in df.columns else df
+
+
+def compute_table(df, short=SHORT_WINDOW, long=LONG_WINDOW, rsi_window=RSI_WINDOW):
+    """Ticker x indicator table for the latest sample, computed over the whole price matrix at once.
+
+    Same definitions as the streaming engine / the old per-ticker pandas code:
+    z-score vs. the full history, moving averages over the last valid prices and the simple-average RSI."""
+    prices = _price_matrix(df).astype(float)
+    values = prices.to_numpy()
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nanmean(values, axis=0) if len(values) else np.full(values.shape[1], np.nan)
+        std = np.nanstd(values, axis=0, ddof=1) if len(values) > 1 else np.full(values.shape[1], np.nan)
+        last = values[-1] if len(values) else np.full(values.shape[1], np.nan)
+        z = np.where(std > 0, (last - mean) / std, 0.0)
+
+        # Moving averages over the last N *valid* prices of each column (dropna semantics)
+        from_end = np.cumsum(valid[::-1], axis=0)[::-1]
+        filled = np.where(valid, values, 0.0)
+        ma_short = np.where(count >= short, (filled * (from_end <= short)).sum(axis=0) / short, np.nan)
+        long_n = np.minimum(count, long)
+        ma_long = (filled * (from_end <= long)).sum(axis=0) / long_n
+
+        # RSI over the last `rsi_window` diffs; missing diffs count as 0 (pandas where() semantics)
+        delta = np.diff(values[-(rsi_window + 1):], axis=0)
+        delta = np.vstack([np.full((1, values.shape[1]), np.nan), delta]) if len(values) <= rsi_window else delta
+        gain = np.where(delta > 0, delta, 0.0).mean(axis=0)
+        loss = np.where(delta < 0, -delta, 0.0).mean(axis=0)
+        rs = gain / loss
+        rsi = 100 - 100 / (1 + rs)
+        rsi = np.where(np.isnan(rsi) | (len(values) < rsi_window), 50.0, rsi)
+
+    return pd.DataFrame({"price": last, "count": count, "mean": mean, "std": std, "z_score": z,
+                         "ma_short": ma_short, "ma_long": ma_long, "rsi": rsi}, index=prices.columns)
+
+
+def classify(table):
+    """Add label columns to an indicator table by vectorized thresholding."""
+    out = table.copy()
+    z, rsi = out['z_score'].to_numpy(dtype=float), out['rsi'].to_numpy(dtype=float)
+    out['reversion'] = np.select([z > Z_THRESHOLD, z < -Z_THRESHOLD], ["overextended", "value_opportunity"], "fair")
+    out['momentum'] = np.select([out['count'].to_numpy() < SHORT_WINDOW,
+                                 out['ma_short'].to_numpy(dtype=float) > out['ma_long'].to_numpy(dtype=float)],
+                                ["accumulating", "uptrend"], "downtrend")
+    out['rsi_zone'] = np.select([rsi > RSI_OVERBOUGHT, rsi < RSI_OVERSOLD], ["overbought", "oversold"], "neutral")
+    return out
+
+
+def rolling_indicators(df, short=SHORT_WINDOW, long=LONG_WINDOW, rsi_window=RSI_WINDOW):
+    """Full time series of every indicator for every ticker (one 2-D frame per indicator).
+
+    The z-score uses an expanding mean/std so its last row equals the full-history value."""
+    prices = _price_matrix(df).astype(float)
+    expanding = prices.expanding(min_periods=2)
+    std = expanding.std()
+    z = ((prices - expanding.mean()) / std).where(std > 0, 0.0)
+    delta = prices.diff()
+    gain = delta.where(delta > 0, 0).rolling(rsi_window).mean()
+    loss = -delta.where(delta < 0, 0).rolling(rsi_window).mean()
+    rsi = (100 - 100 / (1 + gain / loss)).fillna(50.0)
+    return {"z_score": z,
+            "ma_short": prices.rolling(short).mean(),
+            "ma_long": prices.rolling(long, min_periods=1).mean(),
+            "rsi": rsi}
+
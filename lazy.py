@@ -0,0 +1,22 @@
+import importlib.util
+import sys
+
+# --- Deferred imports ---
+# pandas = lazy.module("pandas") binds a module object whose code only runs on first attribute
+# access, so entry points that return early (missing portfolio, nothing to redraw) never pay
+# for pandas/numpy. matplotlib and yfinance are imported inside the functions that need them.
+
+
+def module(name):
+    """`name` as a lazily executed module (the real module if it is already imported)."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    loader.exec_module(mod)
+    return mod
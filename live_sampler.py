@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+import random
+import tempfile
+import time
+from collections import deque
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytz
+import price_store
+
+# --- Long-running live sampler ---
+# Polls quotes every `interval` seconds instead of once per cron run:
+#   - tickers are fetched in chunks (one request per chunk) with at most `concurrency` in flight
+#   - a chunk whose previous request is still running is not re-requested; the tick awaits
+#     the in-flight request instead (coalescing), so slow quotes never pile up
+#   - a failing chunk backs off exponentially (with jitter) and is skipped until its retry time
+#   - samples are buffered in memory and appended to the price store in batches; the store has
+#     1-second timestamps, so ticks within one second share a row ("samples" counts rows, "merged"
+#     the ticks folded into an earlier row)
+# Quote sources are objects with `async quotes(tickers) -> {ticker: price}`.
+TZ = pytz.timezone('Israel')
+DEFAULT_INTERVAL = 15.0
+DEFAULT_CONCURRENCY = 4
+FLUSH_ROWS = 20             # flush once this many samples are buffered ...
+FLUSH_SECONDS = 60.0        # ... or this long after the last flush
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+LATENCY_WINDOW = 1000       # latencies kept for the percentile stats
+
+
+class YahooQuoteSource:
+    """Last 1-minute close from the market_data backend, one batched download per chunk."""
+
+    async def quotes(self, tickers):
+        import market_data
+        loop = asyncio.get_running_loop()
+        closes = await loop.run_in_executor(
+            None, lambda: market_data.fetch_prices(tickers, period="1d", interval="1m")[0])
+        last = closes.ffill().iloc[-1] if not closes.empty else pd.Series(dtype=float)
+        return {t: float(v) for t, v in last.items() if pd.notna(v)}
+
+
+class HttpQuoteSource:
+    """GET http://host:port/quote?symbols=A,B -> {"A": price, ...} over a plain asyncio connection."""
+
+    def __init__(self, host="127.0.0.1", port=8765, timeout=10.0):
+        self.host, self.port, self.timeout = host, port, timeout
+
+    async def quotes(self, tickers):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            request = f"GET /quote?symbols={','.join(tickers)} HTTP/1.0\r\nHost: {self.host}\r\n\r\n"
+            writer.write(request.encode())
+            await writer.drain()
+            raw = await asyncio.wait_for(reader.read(), self.timeout)
+        finally:
+            writer.close()
+        head, _, body = raw.partition(b"\r\n\r\n")
+        status = head.split(b" ", 2)[1] if head else b"?"
+        if status != b"200":
+            raise RuntimeError(f"Quote server returned {status.decode()}")
+        return {t: float(v) for t, v in json.loads(body).items()}
+
+
+class FakeQuoteServer:
+    """Local quote server for offline runs: random-walk prices, configurable latency and error rate."""
+
+    def __init__(self, tickers, host="127.0.0.1", port=0, latency=0.05, error_rate=0.0, seed=None):
+        self.host, self.port = host, port
+        self.latency, self.error_rate = latency, error_rate
+        self.rng = random.Random(seed)
+        self.prices = {t: 100.0 for t in tickers}
+        self.requests = 0
+        self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            self.requests += 1
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.latency)
+            path = line.split(b" ")[1].decode() if line.count(b" ") >= 2 else ""
+            if self.rng.random() < self.error_rate or not path.startswith("/quote?symbols="):
+                writer.write(b"HTTP/1.0 503 Service Unavailable\r\n\r\n")
+            else:
+                out = {}
+                for t in path.split("=", 1)[1].split(","):
+                    price = self.prices.get(t, 100.0) * (1 + self.rng.gauss(0, 0.001))
+                    self.prices[t] = price
+                    out[t] = round(price, 2)
+                body = json.dumps(out).encode()
+                writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n"
+                             + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+class Sampler:
+    """Polls `source` for `tickers` every `interval` seconds and batches the samples into the price store."""
+
+    def __init__(self, source, tickers, interval=DEFAULT_INTERVAL, concurrency=DEFAULT_CONCURRENCY,
+                 chunk_size=None, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS,
+                 store_dir=price_store.STORE_DIR):
+        self.source = source
+        self.tickers = list(dict.fromkeys(tickers))
+        self.interval = interval
+        size = chunk_size or len(self.tickers) or 1
+        self.chunks = [tuple(self.tickers[i:i + size]) for i in range(0, len(self.tickers), size)]
+        self.flush_rows, self.flush_seconds = flush_rows, flush_seconds
+        self.store_dir = store_dir
+        self.concurrency = concurrency
+        self._semaphore = None      # created on first use, inside the running loop
+        self._flush_lock = None
+        self._inflight = {}
+        self._failures = {}
+        self._retry_at = {}
+        self._buffer = []
+        self._last_stamp = None
+        self._last_flush = time.monotonic()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"ticks": 0, "samples": 0, "merged": 0, "requests": 0, "coalesced": 0, "errors": 0,
+                      "backoff_skips": 0, "flushes": 0, "rows_written": 0}
+
+    async def _request(self, chunk):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            start = time.perf_counter()
+            self.stats["requests"] += 1
+            try:
+                prices = await self.source.quotes(list(chunk))
+            except Exception as e:
+                self.stats["errors"] += 1
+                n = self._failures.get(chunk, 0) + 1
+                self._failures[chunk] = n
+                delay = min(BACKOFF_BASE * 2 ** (n - 1), BACKOFF_MAX) * random.uniform(0.8, 1.2)
+                self._retry_at[chunk] = time.monotonic() + delay
+                logging.error(f"Live quote request failed for {','.join(chunk)} (retry in {delay:.0f}s): {e}")
+                return {}
+            self.latencies.append(time.perf_counter() - start)
+            self._failures.pop(chunk, None)
+            self._retry_at.pop(chunk, None)
+            return prices
+
+    def _fetch(self, chunk):
+        """Shared in-flight request for `chunk`, started if there is none."""
+        task = self._inflight.get(chunk)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return task
+        task = asyncio.ensure_future(self._request(chunk))
+        self._inflight[chunk] = task
+        task.add_done_callback(lambda _: self._inflight.pop(chunk, None))
+        return task
+
+    async def tick(self):
+        """Take one sample of every ticker whose chunk isn't backing off."""
+        now = time.monotonic()
+        tasks = []
+        for chunk in self.chunks:
+            if self._retry_at.get(chunk, 0) > now:
+                self.stats["backoff_skips"] += 1
+                continue
+            tasks.append(self._fetch(chunk))
+        self.stats["ticks"] += 1
+        sample = {}
+        for prices in await asyncio.gather(*tasks):
+            sample.update({t: round(float(v), 2) for t, v in prices.items() if t in self.tickers})
+        if sample:
+            ts = datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
+            if ts == self._last_stamp:
+                # The store keeps one row per second: a later sample in the same second updates the
+                # buffered row (or is dropped if that row is already flushed) and counts as merged
+                if self._buffer:
+                    self._buffer[-1][1].update(sample)
+                self.stats["merged"] += 1
+            else:
+                self._buffer.append((ts, sample))
+                self._last_stamp = ts
+                self.stats["samples"] += 1
+        if len(self._buffer) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            await self.flush()
+        return sample
+
+    async def flush(self):
+        """Append the buffered samples to the store in one write."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            return await self._flush()
+
+    async def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return 0
+        rows, self._buffer = self._buffer, []
+        df = pd.DataFrame([p for _, p in rows], columns=self.tickers)
+        df.insert(0, 'ts', [ts for ts, _ in rows])
+        loop = asyncio.get_running_loop()
+        try:
+            written = await loop.run_in_executor(None, price_store.append_frame, df, self.store_dir)
+        except Exception as e:
+            logging.error(f"Live sample flush failed ({len(rows)} rows): {e}")
+            self._buffer = rows + self._buffer
+            return 0
+        self.stats["flushes"] += 1
+        self.stats["rows_written"] += written
+        return written
+
+    async def run(self, duration=None, max_ticks=None):
+        """Sample on a fixed cadence until `duration` seconds or `max_ticks` ticks (forever if neither)."""
+        started = time.monotonic()
+        pending = set()
+        scheduled = 0
+        try:
+            while True:
+                if max_ticks is not None and scheduled >= max_ticks:
+                    break
+                if duration is not None and time.monotonic() - started >= duration:
+                    break
+                # A slow tick doesn't delay the next one; overlapping ticks share in-flight requests
+                task = asyncio.ensure_future(self.tick())
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                scheduled += 1
+                await asyncio.sleep(max(0.0, started + scheduled * self.interval - time.monotonic()))
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            await self.flush()
+        self.stats["elapsed"] = time.monotonic() - started
+        return self.report()
+
+    def report(self):
+        """Throughput and per-request latency summary."""
+        lat = np.array(self.latencies) * 1000
+        elapsed = self.stats.get("elapsed") or 0.0
+        out = dict(self.stats)
+        out["samples_per_sec"] = self.stats["samples"] / elapsed if elapsed else 0.0
+        if len(lat):
+            out.update(latency_ms_p50=float(np.percentile(lat, 50)), latency_ms_p95=float(np.percentile(lat, 95)),
+                       latency_ms_max=float(lat.max()))
+        return out
+
+
+def print_report(report):
+    print(f"{report['samples']} samples in {report.get('elapsed', 0):.1f}s "
+          f"({report['samples_per_sec']:.2f}/s, {report['merged']} more merged into the same second), "
+          f"{report['rows_written']} rows in {report['flushes']} flushes")
+    print(f"requests {report['requests']}, coalesced {report['coalesced']}, errors {report['errors']}, "
+          f"backoff skips {report['backoff_skips']}")
+    if "latency_ms_p50" in report:
+        print(f"latency p50 {report['latency_ms_p50']:.1f} ms, p95 {report['latency_ms_p95']:.1f} ms, "
+              f"max {report['latency_ms_max']:.1f} ms")
+
+
+async def run_fake(tickers, duration=10.0, interval=0.1, store_dir=None, **server_opts):
+    """Run the sampler against a local FakeQuoteServer (one request per ticker) and return the report.
+
+    Fake prices go to a scratch store unless `store_dir` is given, never to the real one."""
+    if store_dir is None:
+        with tempfile.TemporaryDirectory(prefix="sapa_live_") as scratch:
+            return await run_fake(tickers, duration, interval, scratch, **server_opts)
+    async with FakeQuoteServer(tickers, **server_opts) as server:
+        sampler = Sampler(HttpQuoteSource(server.host, server.port), tickers, interval=interval,
+                          chunk_size=1, store_dir=store_dir)
+        return await sampler.run(duration=duration)
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+
+# --- Output manifest ---
+# data_hub/manifest.json records, for every generated file, the inputs it was built from
+# (portfolio hash, a price hash per ticker, the USD/ILS rate, ...) and the hash and size of the
+# bytes written. A stage compares its current inputs with the recorded ones and leaves the
+# output alone when they match; `write` additionally skips files whose new bytes hash to what
+# is already on disk, and replaces the others through a temp file + rename, so the auto-commit
+# only carries files whose content actually changed.
+DATA_DIR = "data_hub"
+MANIFEST_FILE = os.path.join(DATA_DIR, "manifest.json")
+
+_manifest = {"path": None, "entries": None}
+stats = {"written": 0, "unchanged": 0}
+
+
+def digest(*parts):
+    """Stable hash of arrays / bytes / JSON-able values."""
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(str(part.dtype).encode())
+            h.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """Hash of a file's bytes ("missing" when it doesn't exist)."""
+    if not os.path.exists(path):
+        return "missing"
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def price_digests(df, tickers):
+    """{ticker: hash of its (timestamp, price) points} for the tickers present in a price frame."""
+    ts = df['ts'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    out = {}
+    for t in tickers:
+        if t not in df.columns:
+            continue
+        values = df[t].to_numpy(dtype=float)
+        mask = ~np.isnan(values)
+        out[t] = digest(ts[mask], values[mask])
+    return out
+
+
+def _entries(path=MANIFEST_FILE):
+    if _manifest["path"] != path:
+        entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Manifest unreadable, rebuilding: {e}")
+        _manifest.update(path=path, entries=entries)
+    return _manifest["entries"]
+
+
+def _save(path=MANIFEST_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(_entries(path), f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _normalize(inputs):
+    # Compared as they would read back from the manifest (tuples become lists, keys strings)
+    return json.loads(json.dumps(inputs, default=str))
+
+
+def _on_disk(entry, output):
+    return entry is not None and os.path.exists(output) and os.path.getsize(output) == entry.get("bytes")
+
+
+def fresh(output, inputs, path=MANIFEST_FILE):
+    """True when `output` exists and was last written from exactly these inputs."""
+    entry = _entries(path).get(output)
+    return _on_disk(entry, output) and entry.get("inputs") == _normalize(inputs)
+
+
+def write(output, data, inputs=None, path=MANIFEST_FILE):
+    """Atomically write `data` (str or bytes) to `output` unless the file already holds it.
+
+    Returns True when the file was (re)written."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    entries = _entries(path)
+    entry = entries.get(output)
+    sha1 = hashlib.sha1(data).hexdigest()
+    if inputs is not None:
+        inputs = _normalize(inputs)
+    if _on_disk(entry, output) and entry.get("sha1") == sha1:
+        stats["unchanged"] += 1
+        if inputs is not None and entry.get("inputs") != inputs:
+            entry["inputs"] = inputs
+            _save(path)
+        return False
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = output + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, output)
+    entries[output] = {"sha1": sha1, "bytes": len(data)}
+    if inputs is not None:
+        entries[output]["inputs"] = inputs
+    _save(path)
+    stats["written"] += 1
+    return True
@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+import pandas as pd
+import market_data
+import metrics
+
+# --- Shared daily market data cache ---
+# Two layers: an in-process LRU (hits are a dict lookup + slice) in front of an on-disk SQLite
+# store shared by stock_tracker, generate_report and history_logger within one workflow run.
+# Each symbol remembers the date range it covers; only the missing part of a request is fetched.
+DATA_DIR = "data_hub"
+CACHE_FILE = os.path.join(DATA_DIR, "market_cache.sqlite")
+DEFAULT_TTL = 15 * 60                       # seconds before the trailing (still moving) bar is refetched
+SERIES_TTL = {market_data.FX_TICKER: 60 * 60, "^GSPC": 15 * 60}
+MAX_MEMORY_SERIES = 64
+MAX_DISK_SERIES = 512
+REFRESH_OVERLAP_DAYS = 3                    # re-read the last few days on refresh to pick up late corrections
+
+_memory = OrderedDict()                     # symbol -> (frame, covered_from, covered_to, fetched_at)
+stats = {"memory_hits": 0, "disk_hits": 0, "fetches": 0}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    symbol TEXT NOT NULL, day TEXT NOT NULL, close REAL, dividend REAL,
+    PRIMARY KEY (symbol, day)
+);
+CREATE TABLE IF NOT EXISTS series (
+    symbol TEXT PRIMARY KEY, covered_from TEXT, covered_to TEXT, fetched_at REAL, accessed_at REAL
+);
+"""
+
+
+def _connect():
+    os.makedirs(os.path.dirname(CACHE_FILE) or ".", exist_ok=True)
+    conn = sqlite3.connect(CACHE_FILE, timeout=30)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def ttl_for(symbol):
+    return SERIES_TTL.get(symbol, DEFAULT_TTL)
+
+
+def _as_date(value):
+    if value is None:
+        return date.today()
+    return pd.Timestamp(value).date()
+
+
+def _missing_ranges(entry, start, end, now, ttl):
+    """Date ranges (inclusive) that still have to be fetched for a [start, end] request."""
+    if entry is None:
+        return [(start, end)]
+    covered_from, covered_to, fetched_at = entry
+    ranges = []
+    if start < covered_from:
+        ranges.append((start, covered_from - timedelta(days=1)))
+    stale = covered_to >= date.today() - timedelta(days=1) and now - fetched_at > ttl
+    if end > covered_to or (stale and end >= covered_to - timedelta(days=REFRESH_OVERLAP_DAYS)):
+        # Only the tail past (and the last few days of) the coverage, but never leaving a gap after it
+        lo = max(start, covered_to - timedelta(days=REFRESH_OVERLAP_DAYS))
+        ranges.append((min(lo, covered_to + timedelta(days=1)), end))
+    return ranges
+
+
+def _load_meta(conn, symbol):
+    row = conn.execute("SELECT covered_from, covered_to, fetched_at FROM series WHERE symbol = ?", (symbol,)).fetchone()
+    if row is None:
+        return None
+    return date.fromisoformat(row[0]), date.fromisoformat(row[1]), row[2]
+
+
+def _load_disk(conn, symbol):
+    meta = _load_meta(conn, symbol)
+    if meta is None:
+        return None, None
+    frame = pd.read_sql_query("SELECT day, close, dividend FROM bars WHERE symbol = ? ORDER BY day",
+                              conn, params=(symbol,), index_col='day')
+    frame.index = pd.to_datetime(frame.index)
+    return frame.dropna(subset=['close']), meta
+
+
+def _remember(symbol, frame, meta):
+    _memory[symbol] = (frame,) + meta
+    _memory.move_to_end(symbol)
+    while len(_memory) > MAX_MEMORY_SERIES:
+        _memory.popitem(last=False)
+
+
+def _evict_disk(conn):
+    count = conn.execute("SELECT COUNT(*) FROM series").fetchone()[0]
+    if count <= MAX_DISK_SERIES:
+        return
+    victims = [r[0] for r in conn.execute("SELECT symbol FROM series ORDER BY accessed_at LIMIT ?",
+                                          (count - MAX_DISK_SERIES,))]
+    conn.executemany("DELETE FROM bars WHERE symbol = ?", [(s,) for s in victims])
+    conn.executemany("DELETE FROM series WHERE symbol = ?", [(s,) for s in victims])
+    for s in victims:
+        _memory.pop(s, None)
+
+
+def _store(conn, symbol, closes, dividends, meta, now):
+    closes = closes.dropna()
+    if not closes.empty:
+        days = closes.groupby(closes.index.normalize()).last()
+        divs = dividends.reindex(closes.index).fillna(0.0).groupby(closes.index.normalize()).sum()
+        conn.executemany("INSERT OR REPLACE INTO bars (symbol, day, close, dividend) VALUES (?, ?, ?, ?)",
+                         [(symbol, d.strftime('%Y-%m-%d'), float(c), float(v))
+                          for d, c, v in zip(days.index, days.to_numpy(), divs.reindex(days.index).to_numpy())])
+    conn.execute("INSERT OR REPLACE INTO series (symbol, covered_from, covered_to, fetched_at, accessed_at) "
+                 "VALUES (?, ?, ?, ?, ?)", (symbol, meta[0].isoformat(), meta[1].isoformat(), meta[2], now))
+
+
+def get_daily(symbols, start=None, end=None, period=None):
+    """Daily (closes, dividends) wide frames for [start, end], fetching only ranges not already cached."""
+    before = stats["memory_hits"] + stats["disk_hits"]
+    with metrics.span("cache.daily", symbols=len(symbols)) as s:
+        closes, dividends = _get_daily(symbols, start, end, period)
+        hits = stats["memory_hits"] + stats["disk_hits"] - before
+        s.add(rows=len(closes), cache_hits=hits, cache_misses=len(closes.columns) - hits)
+    return closes, dividends
+
+
+def _get_daily(symbols, start, end, period):
+    symbols = list(dict.fromkeys(symbols))
+    end = _as_date(end)
+    start = _as_date(start) if start is not None else end - timedelta(days=market_data.PERIOD_DAYS.get(period or "1y", 366))
+    now = time.time()
+
+    frames = {}
+    pending = {}
+    conn = None
+    try:
+        for s in symbols:
+            entry = _memory.get(s)
+            if entry is not None and not _missing_ranges(entry[1:], start, end, now, ttl_for(s)):
+                _memory.move_to_end(s)
+                stats["memory_hits"] += 1
+                frames[s] = entry[0]
+                continue
+            if conn is None:
+                conn = _connect()
+            frame, meta = _load_disk(conn, s)
+            ranges = _missing_ranges(meta, start, end, now, ttl_for(s))
+            if not ranges:
+                stats["disk_hits"] += 1
+                _remember(s, frame, meta)
+                frames[s] = frame
+                conn.execute("UPDATE series SET accessed_at = ? WHERE symbol = ?", (now, s))
+                continue
+            for r in ranges:
+                pending.setdefault(r, []).append(s)
+
+        # One batched request per distinct missing range
+        for (lo, hi), group in pending.items():
+            stats["fetches"] += 1
+            closes, dividends = market_data.fetch_prices(group, start=lo.isoformat(),
+                                                         end=(hi + timedelta(days=1)).isoformat())
+            for s in group:
+                col = closes[s].dropna() if s in closes.columns else pd.Series(dtype=float)
+                if col.empty:
+                    # Don't mark a range as covered when the source returned nothing (e.g. a failed request)
+                    continue
+                div = dividends[s] if s in dividends.columns else pd.Series(dtype=float)
+                meta = _load_meta(conn, s)
+                covered_from = min(lo, meta[0]) if meta else lo
+                covered_to = max(hi, meta[1]) if meta else hi
+                fetched_at = now if meta is None or hi >= meta[1] else meta[2]
+                _store(conn, s, col, div, (covered_from, covered_to, fetched_at), now)
+        for s in set(symbols) - set(frames):
+            frame, meta = _load_disk(conn, s)
+            if frame is None:
+                frame = pd.DataFrame({'close': [], 'dividend': []}, index=pd.DatetimeIndex([]))
+            else:
+                _remember(s, frame, meta)
+            frames[s] = frame
+        if conn is not None:
+            _evict_disk(conn)
+            conn.commit()
+    finally:
+        if conn is not None:
+            conn.close()
+
+    lo, hi = pd.Timestamp(start), pd.Timestamp(end)
+    closes = pd.DataFrame({s: frames[s]['close'].loc[lo:hi] for s in symbols}).reindex(columns=symbols)
+    dividends = pd.DataFrame({s: frames[s]['dividend'].loc[lo:hi] for s in symbols}).reindex(columns=symbols)
+    closes.index.name = dividends.index.name = 'Date'
+    return closes, dividends.fillna(0.0)
+
+
+def get_series(symbol, start=None, end=None, period=None):
+    """Daily close series for one symbol."""
+    end_day = _as_date(end)
+    start_day = _as_date(start) if start is not None else end_day - timedelta(days=market_data.PERIOD_DAYS.get(period or "1y", 366))
+    entry = _memory.get(symbol)
+    if entry is not None and not _missing_ranges(entry[1:], start_day, end_day, time.time(), ttl_for(symbol)):
+        # Fast path: no frame construction, just a slice of the cached column
+        _memory.move_to_end(symbol)
+        stats["memory_hits"] += 1
+        close = entry[0]['close']
+        idx = close.index
+        lo = idx.searchsorted(pd.Timestamp(start_day), 'left')
+        hi = idx.searchsorted(pd.Timestamp(end_day), 'right')
+        return close.iloc[lo:hi]
+    return get_daily([symbol], start=start_day, end=end_day)[0][symbol].dropna()
+
+
+def latest_close(symbol, default=None, lookback_days=7):
+    """Most recent cached/fetched daily close, or `default` when nothing is available."""
+    series = get_series(symbol, start=date.today() - timedelta(days=lookback_days))
+    return float(series.iloc[-1]) if not series.empty else default
+
+
+def clear_memory():
+    _memory.clear()
@@ -0,0 +1,174 @@
+import glob
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import metrics
+
+# --- Market data fetch layer ---
+# All network access goes through a backend object so the scripts can run offline:
+#   SAPA_MARKET_BACKEND=yahoo              (default) batched yf.download calls
+#   SAPA_MARKET_BACKEND=local:<directory>  per-ticker CSVs on disk (same layout as individual_stocks/)
+BACKEND_ENV = "SAPA_MARKET_BACKEND"
+FX_TICKER = "ILS=X"
+MAX_INFO_WORKERS = 8
+PERIOD_DAYS = {"1d": 1, "5d": 5, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827, "10y": 3653}
+
+_backend = None
+
+
+def _normalize_index(df):
+    df.index = pd.to_datetime(df.index)
+    if df.index.tz is not None:
+        df.index = df.index.tz_localize(None)
+    df.index.name = 'Date'
+    return df
+
+
+def _field(raw, field, tickers):
+    """Extract one price field as a wide frame (index=date, columns=tickers) from a yf.download result.
+
+    A field missing from the result comes back as NaN so callers drop it rather than store zeros."""
+    if raw is None or raw.empty:
+        return pd.DataFrame(columns=tickers, dtype=float)
+    if isinstance(raw.columns, pd.MultiIndex):
+        if field not in raw.columns.get_level_values(0):
+            return pd.DataFrame(index=raw.index, columns=tickers, dtype=float)
+        out = raw[field]
+    else:
+        if field not in raw.columns:
+            return pd.DataFrame(index=raw.index, columns=tickers, dtype=float)
+        out = raw[[field]].rename(columns={field: tickers[0]})
+    return out.reindex(columns=tickers)
+
+
+class YahooBackend:
+    """Live Yahoo Finance backend: one yf.download call per batch of tickers."""
+
+    def history(self, tickers, period="5y", interval="1d", start=None, end=None):
+        import yfinance as yf
+        kwargs = {"interval": interval, "progress": False, "actions": True, "auto_adjust": True}
+        if start is not None:
+            kwargs.update(start=start, end=end)
+        else:
+            kwargs["period"] = period
+        raw = yf.download(list(tickers), **kwargs)
+        closes = _normalize_index(_field(raw, 'Close', list(tickers)))
+        dividends = _normalize_index(_field(raw, 'Dividends', list(tickers)).fillna(0.0))
+        return closes, dividends
+
+    def info(self, ticker):
+        import yfinance as yf
+        return yf.Ticker(ticker).info
+
+
+class LocalBackend:
+    """Offline backend reading <root>/<TICKER>_history.csv files in the archive format
+    (timestamp, ticker, price, dividend, pe_ratio, usd_ils). ILS=X is served from the usd_ils column."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _load(self, ticker, start=None, end=None):
+        import price_query
+        if ticker == FX_TICKER:
+            files = sorted(glob.glob(os.path.join(self.root, "*_history.csv")))
+            if not files:
+                return None
+            source = os.path.basename(files[0])[:-len("_history.csv")]
+            df = price_query.read_archive(source, start, end, self.root)
+            if df is None:
+                return None
+            df = df[['timestamp', 'usd_ils']].rename(columns={'usd_ils': 'price'})
+            df['dividend'] = 0.0
+        else:
+            # Date-bounded requests only read the needed byte range via the archive's offset index
+            df = price_query.read_archive(ticker, start, end, self.root)
+            if df is None:
+                return None
+        df.index = pd.to_datetime(df['timestamp'])
+        return df
+
+    def _window(self, df, period, interval, start, end):
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+            if end is not None:
+                df = df[df.index < pd.Timestamp(end)]
+        elif period in PERIOD_DAYS:
+            df = df[df.index > df.index.max() - pd.Timedelta(days=PERIOD_DAYS[period])]
+        if not interval.endswith("d") and not interval.endswith("wk") and not interval.endswith("mo"):
+            # Intraday requests only ever use the latest quote
+            df = df.iloc[-1:]
+        return df
+
+    def history(self, tickers, period="5y", interval="1d", start=None, end=None):
+        closes, dividends = {}, {}
+        for t in tickers:
+            df = self._load(t, start, end)
+            if df is None:
+                continue
+            df = self._window(df, period, interval, start, end)
+            closes[t] = df['price'].astype(float)
+            dividends[t] = df['dividend'].astype(float)
+        closes = pd.DataFrame(closes).reindex(columns=list(tickers))
+        dividends = pd.DataFrame(dividends).reindex(columns=list(tickers)).fillna(0.0)
+        return _normalize_index(closes), _normalize_index(dividends)
+
+    def info(self, ticker):
+        df = self._load(ticker)
+        if df is None or 'pe_ratio' not in df.columns:
+            return {}
+        pe = df['pe_ratio'].dropna()
+        return {"trailingPE": float(pe.iloc[-1])} if not pe.empty else {}
+
+
+def backend_from_env():
+    spec = os.environ.get(BACKEND_ENV, "yahoo")
+    if spec.startswith("local:"):
+        return LocalBackend(spec.split(":", 1)[1])
+    return YahooBackend()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = backend_from_env()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the data source (e.g. LocalBackend for offline runs). Returns the previous backend."""
+    global _backend
+    previous = _backend
+    _backend = backend
+    return previous
+
+
+def fetch_prices(tickers, period="5y", interval="1d", start=None, end=None):
+    """Batched close prices and dividends for all tickers. Returns (closes, dividends) wide frames."""
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return pd.DataFrame(), pd.DataFrame()
+    with metrics.span("fetch.prices", tickers=len(tickers), interval=interval) as s:
+        closes, dividends = get_backend().history(tickers, period=period, interval=interval, start=start, end=end)
+        s.add(rows=len(closes))
+    return closes, dividends
+
+
+def fetch_infos(tickers, max_workers=MAX_INFO_WORKERS):
+    """Per-symbol .info lookups with bounded concurrency. Failed lookups map to {}."""
+    backend = get_backend()
+
+    def one(ticker):
+        try:
+            return backend.info(ticker) or {}
+        except Exception as e:
+            logging.error(f"Info lookup failed for {ticker}: {e}")
+            return {}
+
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+    with metrics.span("fetch.infos", tickers=len(tickers)):
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tickers)))) as pool:
+            return dict(zip(tickers, pool.map(one, tickers)))
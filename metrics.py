@@ -0,0 +1,173 @@
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- Run instrumentation ---
+#   with metrics.span("fetch.prices", tickers=5) as s:
+#       ...
+#       s.add(rows=len(df), bytes_read=n, cache_hits=1)
+# Spans nest (the recorded name is the dotted path of the open spans) and cost two
+# perf_counter calls when enabled. Importing this module writes nothing: a command-line entry
+# point calls metrics.start_run() first thing, and at exit that run's spans are appended as one
+# JSON line to data_hub/metrics.jsonl (script, start time, duration, per-span duration and
+# counters). Without start_run the spans are only kept in memory (summary()).
+#   SAPA_METRICS=0                     disable recording
+#   SAPA_PROFILE=cprofile|pyinstrument profile the run from start_run() on, into data_hub/profiles/
+DATA_DIR = "data_hub"
+METRICS_FILE = os.path.join(DATA_DIR, "metrics.jsonl")
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+METRICS_ENV = "SAPA_METRICS"
+PROFILE_ENV = "SAPA_PROFILE"
+MAX_METRICS_BYTES = 5 * 2**20     # rotated to metrics.jsonl.1 beyond this
+
+enabled = os.environ.get(METRICS_ENV, "1") != "0"
+_spans = []
+_local = threading.local()     # open spans per thread (backfill workers record their own)
+_run = {"started": None, "t0": None, "path": None, "profiler": None}
+
+
+class Span:
+    __slots__ = ("name", "attrs", "counters", "start", "duration")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.counters = {}
+        self.start = 0.0
+        self.duration = 0.0
+
+    def add(self, **counters):
+        """Accumulate counters (rows, bytes_read, bytes_written, cache_hits, ...)."""
+        for k, v in counters.items():
+            if v:
+                self.counters[k] = self.counters.get(k, 0) + v
+
+    def to_dict(self):
+        out = {"name": self.name, "ms": round(self.duration * 1000, 3)}
+        out.update(self.counters)
+        out.update(self.attrs)
+        return out
+
+
+class _NullSpan:
+    def add(self, **counters):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+def start_run(path=METRICS_FILE):
+    """Opt this process in: append its spans to `path` at exit and start the SAPA_PROFILE profiler."""
+    if _run["started"] is not None:
+        return
+    _run["started"] = datetime.now().isoformat(timespec='seconds')
+    _run["t0"] = time.perf_counter()
+    _run["path"] = path
+    atexit.register(flush)
+    _start_profiler()
+
+
+@contextmanager
+def span(name, **attrs):
+    if not enabled:
+        yield _NULL
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    s = Span(f"{stack[-1].name}.{name}" if stack else name, attrs)
+    stack.append(s)
+    s.start = time.perf_counter()
+    try:
+        yield s
+    finally:
+        s.duration = time.perf_counter() - s.start
+        stack.pop()
+        _spans.append(s)
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def summary():
+    """Total time and counters per span name for the spans recorded so far."""
+    totals = {}
+    for s in _spans:
+        t = totals.setdefault(s.name, {"calls": 0, "ms": 0.0})
+        t["calls"] += 1
+        t["ms"] += s.duration * 1000
+        for k, v in s.counters.items():
+            t[k] = t.get(k, 0) + v
+    return totals
+
+
+def flush(path=None):
+    """Append this run's spans as one JSON line (to the start_run path by default) and reset them."""
+    _stop_profiler()
+    path = path or _run["path"]
+    if not _spans or path is None:
+        return
+    record = {
+        "script": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "python",
+        "started": _run["started"],
+        "duration_ms": round((time.perf_counter() - (_run["t0"] or min(s.start for s in _spans))) * 1000, 3),
+        "spans": [s.to_dict() for s in sorted(_spans, key=lambda s: s.start)],
+    }
+    _spans.clear()
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if file_size(path) > MAX_METRICS_BYTES:
+            os.replace(path, path + ".1")
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logging.error(f"Could not write metrics: {e}")
+
+
+# --- Optional whole-run profile ---
+
+def _start_profiler():
+    kind = os.environ.get(PROFILE_ENV, "").lower()
+    if not kind:
+        return
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            _run["profiler"] = ("pyinstrument", profiler)
+            return
+        except ImportError:
+            logging.error("pyinstrument is not installed; falling back to cProfile")
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    _run["profiler"] = ("cprofile", profiler)
+
+
+def _stop_profiler():
+    if _run["profiler"] is None:
+        return
+    kind, profiler = _run["profiler"]
+    _run["profiler"] = None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    script = os.path.splitext(os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "python")[0]
+    base = os.path.join(PROFILE_DIR, f"{script}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    if kind == "pyinstrument":
+        profiler.stop()
+        with open(base + ".html", 'w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        profiler.dump_stats(base + ".prof")
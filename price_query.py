@@ -0,0 +1,197 @@
+import bisect
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+import price_store
+
+# --- Range queries over the price archives ---
+# get_prices(tickers, start, end, fields) reads only what a time range needs:
+#   source="store"   binary search on the memory-mapped timestamp column of each store tier,
+#                    then slices of the per-ticker memmaps (only the touched pages are read)
+#   source="archive" per-ticker CSVs in price_history_archive/individual_stocks with a sparse
+#                    (timestamp -> byte offset) index; a query seeks to the nearest checkpoint and
+#                    reads forward until it passes `end`
+ARCHIVE_DIR = os.path.join("data_hub", "price_history_archive", "individual_stocks")
+# Rate the archive was filled with before it recorded real USD/ILS quotes; read back as missing
+PLACEHOLDER_USD_ILS = 3.65
+INDEX_SUFFIX = ".idx"
+INDEX_STRIDE = 256          # one checkpoint every N data rows
+STORE_FIELDS = ("price",) + price_store.OHLC_FIELDS
+
+
+def _ts64(value):
+    return None if value is None else np.datetime64(pd.Timestamp(value).tz_localize(None), 's').astype(np.int64)
+
+
+# --- Binary store -----------------------------------------------------------------------------
+
+def _store_slice(store_dir, columns, start, end):
+    ts = price_store.read_timestamps(store_dir)
+    lo = 0 if start is None else int(np.searchsorted(ts, start, side='left'))
+    hi = len(ts) if end is None else int(np.searchsorted(ts, end, side='right'))
+    meta = price_store.read_meta(store_dir)
+    data = {"ts": np.asarray(ts[lo:hi]).view('datetime64[s]').astype('datetime64[ns]')}
+    for name, column in columns:
+        if column in meta["columns"]:
+            data[name] = np.array(price_store.read_column(column, store_dir)[lo:hi])
+    return pd.DataFrame(data)
+
+
+def _store_prices(tickers, start, end, fields):
+    start, end = _ts64(start), _ts64(end)
+    single = len(fields) == 1
+    parts = []
+    for tier in (price_store.DAILY_DIR, price_store.HOURLY_DIR):
+        cols = [(t if single else f"{t}.{f}", f"{t}.{'close' if f == 'price' else f}") for t in tickers for f in fields]
+        parts.append(_store_slice(tier, cols, start, end))
+    # Raw samples have a single price, which is also their open/high/low/close
+    cols = [(t if single else f"{t}.{f}", t) for t in tickers for f in fields]
+    parts.append(_store_slice(price_store.STORE_DIR, cols, start, end))
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=['ts'])
+    return pd.concat(parts, ignore_index=True)
+
+
+# --- CSV archive ------------------------------------------------------------------------------
+
+def _archive_path(ticker, archive_dir):
+    return os.path.join(archive_dir, f"{ticker}_history.csv")
+
+
+def _scan(f, offset, row, checkpoints):
+    """Add checkpoints for every INDEX_STRIDE-th row from `offset` (row number `row`) to EOF."""
+    f.seek(offset)
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        if line.strip():
+            if row % INDEX_STRIDE == 0:
+                checkpoints.append([line.split(b",", 1)[0].decode('utf-8'), offset, row])
+            row += 1
+        offset += len(line)
+    return offset, row
+
+
+def load_index(ticker, archive_dir=ARCHIVE_DIR):
+    """Sparse offset index for one per-ticker CSV, built or extended incrementally and validated
+    against the file (a rewritten file is re-indexed from scratch)."""
+    path = _archive_path(ticker, archive_dir)
+    if not os.path.exists(path):
+        return None
+    size = os.path.getsize(path)
+    idx_path = path + INDEX_SUFFIX
+    index = None
+    if os.path.exists(idx_path):
+        try:
+            with open(idx_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if index is not None:
+            valid = index["header"] == header.decode('utf-8') and index["size"] <= size
+            if valid and index["checkpoints"]:
+                ts, offset, _ = index["checkpoints"][-1]
+                f.seek(offset)
+                valid = f.readline().split(b",", 1)[0].decode('utf-8') == ts
+            if valid and index["size"] == size:
+                return index
+            if not valid:
+                index = None
+        if index is None:
+            index = {"header": header.decode('utf-8'), "checkpoints": [], "size": len(header), "rows": 0}
+        index["size"], index["rows"] = _scan(f, index["size"], index["rows"], index["checkpoints"])
+
+    tmp = idx_path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp, idx_path)
+    return index
+
+
+def read_archive(ticker, start=None, end=None, archive_dir=ARCHIVE_DIR):
+    """Raw archive rows of one ticker with start <= timestamp <= end (None if there is no file)."""
+    index = load_index(ticker, archive_dir)
+    if index is None or not index["checkpoints"]:
+        return None
+    keys = [c[0] for c in index["checkpoints"]]
+    start_s = None if start is None else pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S')
+    end_s = None if end is None else pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S')
+    # Last checkpoint strictly before `start` (rows with equal timestamps may precede a checkpoint)
+    pos = 0 if start_s is None else max(bisect.bisect_left(keys, start_s) - 1, 0)
+    offset = index["checkpoints"][pos][1]
+
+    chunks = []
+    with open(_archive_path(ticker, archive_dir), 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            ts = line.split(b",", 1)[0].decode('utf-8')
+            if end_s is not None and ts > end_s:
+                break
+            if start_s is None or ts >= start_s:
+                chunks.append(line)
+    names = index["header"].strip().split(",")
+    return mask_placeholder_fx(pd.read_csv(io.BytesIO(b"".join(chunks)), header=None, names=names))
+
+
+def mask_placeholder_fx(rows):
+    """Archive rows with the placeholder USD/ILS rate set to NaN (in place; returns `rows`)."""
+    if 'usd_ils' in rows.columns:
+        rows['usd_ils'] = rows['usd_ils'].where(rows['usd_ils'] != PLACEHOLDER_USD_ILS)
+    return rows
+
+
+def _archive_prices(tickers, start, end, fields, archive_dir):
+    single = len(fields) == 1
+    frames = []
+    for t in tickers:
+        df = read_archive(t, start, end, archive_dir)
+        if df is None or df.empty:
+            continue
+        df = df.drop_duplicates('timestamp', keep='last').set_index('timestamp')
+        cols = {f: (t if single else f"{t}.{f}") for f in fields if f in df.columns}
+        frames.append(df[list(cols)].rename(columns=cols))
+    if not frames:
+        return pd.DataFrame(columns=['ts'])
+    out = pd.concat(frames, axis=1).sort_index()
+    out.index = pd.to_datetime(out.index)
+    return out.rename_axis('ts').reset_index()
+
+
+# --- Public API -------------------------------------------------------------------------------
+
+def get_prices(tickers, start=None, end=None, fields=("price",), source="store", archive_dir=ARCHIVE_DIR):
+    """Wide frame ('ts' + one column per ticker, or '<ticker>.<field>' for several fields) for [start, end].
+
+    store fields: price, open, high, low, close.  archive fields: price, dividend, pe_ratio, usd_ils
+    (NaN where the archive only holds the placeholder rate)."""
+    tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+    fields = (fields,) if isinstance(fields, str) else tuple(fields)
+    if source == "store":
+        unknown = set(fields) - set(STORE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unsupported store field(s): {', '.join(sorted(unknown))}")
+        return _store_prices(tickers, start, end, fields)
+    if source == "archive":
+        return _archive_prices(tickers, start, end, fields, archive_dir)
+    raise ValueError(f"Unknown source: {source}")
+
+
+def price_at(tickers, when, source="store", lookback=pd.Timedelta(days=7), archive_dir=ARCHIVE_DIR):
+    """Last known price at or before `when` for each ticker ({ticker: price or None}).
+
+    Reads only the `lookback` window before `when`, so the cost doesn't grow with the archive."""
+    tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+    when = pd.Timestamp(when)
+    window = get_prices(tickers, when - lookback, when, source=source, archive_dir=archive_dir)
+    out = {}
+    for t in tickers:
+        col = window[t].dropna() if t in window.columns else pd.Series(dtype=float)
+        out[t] = float(col.iloc[-1]) if not col.empty else None
+    return out
@@ -0,0 +1,400 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import manifest
+import metrics
+
+# --- Columnar price store ---
+# data_hub/price_store/
+#   meta.json     -> {"version", "rows", "columns"}  (rows is authoritative), plus "adjusted_until":
+#                    rows up to that timestamp are Yahoo's dividend-adjusted daily closes (the
+#                    tracker's backfill); later rows are raw quotes
+#   ts.i64        -> int64 seconds since epoch (naive Israel time, as written by stock_tracker)
+#   <TICKER>.f64  -> float64 close prices, one value per timestamp (NaN when missing)
+#   hourly/, daily/ -> older data rolled up by retention.py into <TICKER>.<open|high|low|close> columns
+# A full rewrite (write_frame) builds the new tier in <dir>.build, renames it to <dir>.rewrite once
+# complete, then moves its files over the old ones with meta.json last (columns missing from the
+# new tier are deleted). A rewrite interrupted after the rename is finished by the next read_meta;
+# an unfinished .build is simply discarded.
+#
+# stock_history.json (compatibility view) is written in a compact form:
+#   {"format": "sapa.history", "version": 2, "tickers": [...], "scale": 100,
+#    "ts": [seconds since the previous row, ...], "prices": [[price deltas in cents or null], ...]}
+# "prices" holds one list per ticker (flat lists parse much faster than one list per row). Each
+# delta is against the ticker's last non-null price, so a column decodes with a cumulative sum.
+# Prices that aren't whole cents are stored as plain values ("scale": null). The reader also
+# accepts the old list of {"timestamp", "prices"} rows.
+DATA_DIR = "data_hub"
+STORE_DIR = os.path.join(DATA_DIR, "price_store")
+LEGACY_JSON_FILE = os.path.join(DATA_DIR, "stock_history.json")
+META_NAME = "meta.json"
+TS_NAME = "ts.i64"
+TS_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f8')
+STORE_VERSION = 1
+HOURLY_DIR = os.path.join(STORE_DIR, "hourly")
+DAILY_DIR = os.path.join(STORE_DIR, "daily")
+OHLC_FIELDS = ("open", "high", "low", "close")
+HISTORY_FORMAT = "sapa.history"
+HISTORY_VERSION = 2
+PRICE_SCALE = 100
+
+
+def _meta_path(store_dir):
+    return os.path.join(store_dir, META_NAME)
+
+
+def _column_path(store_dir, column):
+    return os.path.join(store_dir, f"{column}.f64")
+
+
+def _finish_rewrite(store_dir):
+    """Move a completed <dir>.rewrite into place: data files first, meta.json (the commit) last."""
+    staged = os.path.normpath(store_dir) + ".rewrite"
+    if not os.path.isdir(staged):
+        return
+    if os.path.exists(_meta_path(staged)):
+        with open(_meta_path(staged), 'r', encoding='utf-8') as f:
+            new_columns = set(json.load(f)["columns"])
+        old = _read_meta(store_dir)
+        for c in old["columns"]:
+            if c not in new_columns and os.path.exists(_column_path(store_dir, c)):
+                os.remove(_column_path(store_dir, c))
+        for name in os.listdir(staged):
+            if name != META_NAME:
+                os.replace(os.path.join(staged, name), os.path.join(store_dir, name))
+        os.replace(_meta_path(staged), _meta_path(store_dir))
+    shutil.rmtree(staged, ignore_errors=True)
+
+
+def read_meta(store_dir=STORE_DIR):
+    _finish_rewrite(store_dir)
+    return _read_meta(store_dir)
+
+
+def _read_meta(store_dir):
+    path = _meta_path(store_dir)
+    if not os.path.exists(path):
+        return {"version": STORE_VERSION, "rows": 0, "columns": []}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_meta(store_dir, meta):
+    tmp = _meta_path(store_dir) + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp, _meta_path(store_dir))
+
+
+def row_count(store_dir=STORE_DIR):
+    return read_meta(store_dir)["rows"]
+
+
+def _map(path, dtype, rows, mmap):
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+    return np.fromfile(path, dtype=dtype, count=rows)
+
+
+def read_timestamps(store_dir=STORE_DIR, mmap=True):
+    """Raw int64 timestamp column (seconds since epoch)."""
+    meta = read_meta(store_dir)
+    return _map(os.path.join(store_dir, TS_NAME), TS_DTYPE, meta["rows"], mmap)
+
+
+def read_column(column, store_dir=STORE_DIR, mmap=True):
+    meta = read_meta(store_dir)
+    return _map(_column_path(store_dir, column), VALUE_DTYPE, meta["rows"], mmap)
+
+
+def last_timestamp(store_dir=STORE_DIR):
+    """Last stored timestamp as a pandas Timestamp, or None for an empty store."""
+    meta = read_meta(store_dir)
+    if meta["rows"] == 0:
+        return None
+    with open(os.path.join(store_dir, TS_NAME), 'rb') as f:
+        f.seek((meta["rows"] - 1) * TS_DTYPE.itemsize)
+        value = np.frombuffer(f.read(TS_DTYPE.itemsize), dtype=TS_DTYPE)[0]
+    return pd.Timestamp(int(value), unit='s')
+
+
+def adjusted_until(store_dir=STORE_DIR):
+    """Timestamp of the last dividend-adjusted row, or None if every row is a raw quote."""
+    value = read_meta(store_dir).get("adjusted_until")
+    return None if value is None else pd.Timestamp(int(value), unit='s')
+
+
+def mark_adjusted(until, store_dir=STORE_DIR):
+    """Record that the rows up to `until` hold dividend-adjusted closes."""
+    meta = read_meta(store_dir)
+    meta["adjusted_until"] = int(_to_epoch_seconds([until])[0])
+    _write_meta(store_dir, meta)
+
+
+def _to_epoch_seconds(ts):
+    return pd.to_datetime(pd.Series(ts)).dt.tz_localize(None).to_numpy('datetime64[s]').astype(TS_DTYPE)
+
+
+def _truncate(path, nbytes):
+    # Drop any bytes past the committed row count (left over by an interrupted append)
+    if os.path.exists(path) and os.path.getsize(path) > nbytes:
+        with open(path, 'r+b') as f:
+            f.truncate(nbytes)
+
+
+def _append_frame(df, store_dir):
+    if df is None or df.empty:
+        return 0
+    os.makedirs(store_dir, exist_ok=True)
+    meta = read_meta(store_dir)
+    rows = meta["rows"]
+
+    ts = _to_epoch_seconds(df['ts'])
+    order = np.argsort(ts, kind='stable')
+    ts = ts[order]
+    keep = np.ones(len(ts), dtype=bool)
+    keep[1:] = ts[1:] > ts[:-1]
+    last = last_timestamp(store_dir)
+    if last is not None:
+        keep &= ts > int(last.value // 10**9)
+    if not keep.any():
+        return 0
+    idx = order[keep]
+    ts = ts[keep]
+
+    columns = list(meta["columns"])
+    new_columns = [c for c in df.columns if c != 'ts' and c not in columns]
+
+    ts_path = os.path.join(store_dir, TS_NAME)
+    _truncate(ts_path, rows * TS_DTYPE.itemsize)
+    for c in columns:
+        _truncate(_column_path(store_dir, c), rows * VALUE_DTYPE.itemsize)
+
+    for c in new_columns:
+        # A ticker that shows up late is back-padded with NaN so all columns stay aligned
+        with open(_column_path(store_dir, c), 'wb') as f:
+            np.full(rows, np.nan, dtype=VALUE_DTYPE).tofile(f)
+    columns += new_columns
+
+    for c in columns:
+        if c in df.columns:
+            values = pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=VALUE_DTYPE, na_value=np.nan)[idx]
+        else:
+            values = np.full(len(ts), np.nan, dtype=VALUE_DTYPE)
+        with open(_column_path(store_dir, c), 'ab') as f:
+            values.astype(VALUE_DTYPE, copy=False).tofile(f)
+    with open(ts_path, 'ab') as f:
+        ts.tofile(f)
+
+    meta.update({"version": STORE_VERSION, "rows": rows + len(ts), "columns": columns})
+    _write_meta(store_dir, meta)
+    return len(ts)
+
+
+def append_frame(df, store_dir=STORE_DIR):
+    """Append rows of a wide frame ('ts' + one column per ticker). Rows not newer than the store are dropped."""
+    with metrics.span("store.append", store=os.path.basename(store_dir)) as s:
+        written = _append_frame(df, store_dir)
+        s.add(rows=written, bytes_written=written * (len(read_meta(store_dir)["columns"]) + 1) * 8)
+    return written
+
+
+def append_sample(timestamp, prices, store_dir=STORE_DIR):
+    """Append a single {ticker: price} sample."""
+    row = {"ts": [timestamp]}
+    row.update({t: [v] for t, v in prices.items()})
+    return append_frame(pd.DataFrame(row), store_dir)
+
+
+def write_frame(df, store_dir=STORE_DIR):
+    """Rewrite the whole store from a wide frame (used for migrations and compaction).
+
+    The old rows stay readable until the new ones are completely written."""
+    os.makedirs(store_dir, exist_ok=True)
+    base = os.path.normpath(store_dir)
+    build = base + ".build"
+    shutil.rmtree(build, ignore_errors=True)
+    os.makedirs(build)
+    meta = read_meta(store_dir)
+    meta.update({"version": STORE_VERSION, "rows": 0, "columns": []})
+    _write_meta(build, meta)
+    written = append_frame(df, build)
+    # Every data file is recreated, so an empty rewrite also replaces the old ts.i64
+    open(os.path.join(build, TS_NAME), 'ab').close()
+    os.rename(build, base + ".rewrite")
+    _finish_rewrite(store_dir)
+    return written
+
+
+def _load_single(store_dir, columns, mmap):
+    meta = read_meta(store_dir)
+    wanted = meta["columns"] if columns is None else [c for c in columns if c in meta["columns"]]
+    ts = read_timestamps(store_dir, mmap).view('datetime64[s]').astype('datetime64[ns]')
+    data = {"ts": ts}
+    for c in wanted:
+        data[c] = read_column(c, store_dir, mmap)
+    return pd.DataFrame(data)
+
+
+def load_tier_closes(tier_dir, columns=None, mmap=True):
+    """Close prices of a rolled-up tier, with columns renamed back to plain tickers."""
+    meta = read_meta(tier_dir)
+    closes = [c for c in meta["columns"] if c.endswith(".close")]
+    if columns is not None:
+        closes = [c for c in closes if c[:-len(".close")] in columns]
+    df = _load_single(tier_dir, closes, mmap)
+    return df.rename(columns={c: c[:-len(".close")] for c in closes})
+
+
+def load_frame(store_dir=STORE_DIR, columns=None, mmap=True, tiers=None):
+    """Load the store as a DataFrame with a 'ts' column followed by one float column per ticker.
+
+    For the main store the daily and hourly retention tiers are prepended (their close prices),
+    so consumers see one continuous history."""
+    if store_dir == STORE_DIR:
+        migrate_legacy_json()
+    if tiers is None:
+        tiers = store_dir == STORE_DIR
+    with metrics.span("store.load") as s:
+        df = _load_frame(store_dir, columns, mmap, tiers)
+        s.add(rows=len(df), bytes_read=df.shape[0] * df.shape[1] * 8)
+    return df
+
+
+def _load_frame(store_dir, columns, mmap, tiers):
+    df = _load_single(store_dir, columns, mmap)
+    if not tiers:
+        return df
+    parts = [load_tier_closes(d, columns, mmap) for d in (DAILY_DIR, HOURLY_DIR)]
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return df
+    order = list(df.columns)
+    for p in parts:
+        order += [c for c in p.columns if c not in order]
+    return pd.concat(parts + [df], ignore_index=True).reindex(columns=order)
+
+
+def history_to_frame(history):
+    """Convert the legacy list of {"timestamp", "prices"} rows into a wide frame."""
+    if not history:
+        return pd.DataFrame({"ts": pd.to_datetime([])})
+    df = pd.DataFrame.from_records([e['prices'] for e in history])
+    df.insert(0, 'ts', pd.to_datetime([e['timestamp'] for e in history]))
+    return df
+
+
+def frame_to_history(df):
+    """Inverse of history_to_frame, used for the JSON compatibility view."""
+    history = []
+    if df.empty:
+        return history
+    stamps = df['ts'].dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+    prices = df.drop(columns='ts')
+    for ts, row in zip(stamps, prices.to_dict('records')):
+        history.append({"timestamp": ts, "prices": {t: v for t, v in row.items() if pd.notna(v)}})
+    return history
+
+
+def encode_history(df):
+    """Compact (version 2) document for a wide frame."""
+    tickers = [c for c in df.columns if c != 'ts']
+    ts = _to_epoch_seconds(df['ts']) if len(df) else np.array([], dtype=TS_DTYPE)
+    values = df[tickers].to_numpy(dtype=float)
+    missing = np.isnan(values)
+    scaled = np.round(values * PRICE_SCALE)
+    exact = bool(np.all(missing | (np.abs(scaled / PRICE_SCALE - values) < 1e-9)))
+    if exact:
+        prev = pd.DataFrame(scaled).ffill().shift(1).fillna(0.0).to_numpy()
+        cells = (scaled - np.where(missing, 0.0, prev)).astype(object)
+        cells[~missing] = (scaled - prev)[~missing].astype(np.int64)
+    else:
+        cells = values.astype(object)
+    cells[missing] = None
+    return {
+        "format": HISTORY_FORMAT,
+        "version": HISTORY_VERSION,
+        "tickers": tickers,
+        "scale": PRICE_SCALE if exact else None,
+        "ts": np.diff(ts, prepend=0).tolist(),
+        "prices": cells.T.tolist(),
+    }
+
+
+def decode_history(doc):
+    """Wide frame from a compact document or from the old list-of-rows schema."""
+    if isinstance(doc, list):
+        return history_to_frame(doc)
+    ts = np.cumsum(np.asarray(doc["ts"], dtype=TS_DTYPE))
+    data = {"ts": ts.astype('datetime64[s]').astype('datetime64[ns]')}
+    for ticker, column in zip(doc["tickers"], doc["prices"]):
+        values = np.array(column, dtype=float)
+        if doc.get("scale"):
+            missing = np.isnan(values)
+            values = np.cumsum(np.nan_to_num(values)) / doc["scale"]
+            values[missing] = np.nan
+        data[ticker] = values
+    return pd.DataFrame(data)
+
+
+def _dumps(doc):
+    try:
+        import orjson
+        return orjson.dumps(doc)
+    except ImportError:
+        return json.dumps(doc, separators=(",", ":")).encode('utf-8')
+
+
+def _loads(data):
+    try:
+        import orjson
+        return orjson.loads(data)
+    except ImportError:
+        return json.loads(data)
+
+
+def read_history_frame(json_file=LEGACY_JSON_FILE):
+    """stock_history.json (either format) as a wide frame."""
+    with metrics.span("json.parse", file=os.path.basename(json_file)) as s:
+        with open(json_file, 'rb') as f:
+            data = f.read()
+        df = decode_history(_loads(data))
+        s.add(rows=len(df), bytes_read=len(data))
+    return df
+
+
+def read_history(json_file=LEGACY_JSON_FILE):
+    """stock_history.json (either format) as the old list of {"timestamp", "prices"} rows."""
+    return frame_to_history(read_history_frame(json_file))
+
+
+def migrate_legacy_json(json_file=LEGACY_JSON_FILE, store_dir=STORE_DIR):
+    """One-time import of stock_history.json into an empty store."""
+    if row_count(store_dir) or not os.path.exists(json_file):
+        return 0
+    df = read_history_frame(json_file)
+    written = append_frame(df, store_dir)
+    # The tracker's backfill wrote its adjusted daily closes at midnight, before the first live sample
+    if written:
+        ts = df['ts'].sort_values()
+        daily = ts[(ts == ts.dt.normalize()).cummin()]
+        if not daily.empty:
+            mark_adjusted(daily.iloc[-1], store_dir)
+    return written
+
+
+def export_json(json_file=LEGACY_JSON_FILE, max_rows=None, store_dir=STORE_DIR, df=None):
+    """Write the compact stock_history.json view of the store (or of an already loaded frame)."""
+    if df is None:
+        df = load_frame(store_dir)
+    if max_rows:
+        df = df.iloc[-max_rows:]
+    with metrics.span("json.export", file=os.path.basename(json_file)) as s:
+        data = _dumps(encode_history(df))
+        if manifest.write(json_file, data):
+            s.add(rows=len(df), bytes_written=len(data))
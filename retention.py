@@ -0,0 +1,104 @@
+import os
+from datetime import datetime
+import pandas as pd
+import price_store
+import metrics
+
+# --- Tiered retention for the price store ---
+#   raw    (price_store/)        full resolution for the last RAW_DAYS
+#   hourly (price_store/hourly/) OHLC bars per hour up to HOURLY_DAYS back
+#   daily  (price_store/daily/)  OHLC bars per day beyond that (kept forever, ~250 rows/year)
+# A bar is stamped at its last source sample, never at the bucket start.
+# Compaction is incremental: only rows that crossed a cutoff since the last run are rolled up
+# and appended to the next tier; the raw and hourly tiers are rewritten, but both are bounded.
+RAW_DAYS = 7
+HOURLY_DAYS = 90
+
+
+def to_ohlc(df):
+    """Raw price samples as an OHLC frame (all four fields equal to the sampled price)."""
+    prices = df.drop(columns='ts')
+    data = {"ts": df['ts'].to_numpy()}
+    for t in prices.columns:
+        for field in price_store.OHLC_FIELDS:
+            data[f"{t}.{field}"] = prices[t].to_numpy()
+    return pd.DataFrame(data)
+
+
+def rollup(ohlc, freq):
+    """Aggregate an OHLC frame into bars of `freq` ('h' or 'D').
+
+    Each bar is stamped at the last source timestamp in its bucket, so a close is never dated
+    before the sample it came from."""
+    if ohlc.empty:
+        return ohlc
+    bucket = ohlc['ts'].dt.floor(freq)
+    values = ohlc.drop(columns='ts')
+    grouped = values.groupby(bucket.to_numpy())
+    how = {"open": "first", "high": "max", "low": "min", "close": "last"}
+    parts = []
+    for field, agg in how.items():
+        cols = [c for c in values.columns if c.endswith(f".{field}")]
+        if cols:
+            parts.append(getattr(grouped[cols], agg)())
+    bars = pd.concat(parts, axis=1)[[c for c in values.columns]]
+    bars.insert(0, 'ts', ohlc['ts'].groupby(bucket.to_numpy()).max())
+    return bars.reset_index(drop=True)
+
+
+def _split(df, cutoff):
+    older = df[df['ts'] < cutoff]
+    return older, df[df['ts'] >= cutoff]
+
+
+def compact(now=None, raw_days=RAW_DAYS, hourly_days=HOURLY_DAYS,
+            store_dir=price_store.STORE_DIR, hourly_dir=price_store.HOURLY_DIR, daily_dir=price_store.DAILY_DIR):
+    """Move rows past each cutoff one tier down. Returns {"hourly": n, "daily": n} bars appended."""
+    now = pd.Timestamp(now if now is not None else datetime.now())
+    if now.tzinfo is not None:
+        now = now.tz_localize(None)
+    moved = {"hourly": 0, "daily": 0}
+    with metrics.span("retention.compact") as s:
+        _compact(now, raw_days, hourly_days, store_dir, hourly_dir, daily_dir, moved)
+        s.add(rows=moved["hourly"] + moved["daily"])
+    return moved
+
+
+def _compact(now, raw_days, hourly_days, store_dir, hourly_dir, daily_dir, moved):
+    # Cutoffs sit on bucket boundaries so a bar is only written once all of its samples are old enough
+    raw_cutoff = (now - pd.Timedelta(days=raw_days)).floor('h')
+    raw = price_store.load_frame(store_dir, tiers=False)
+    if not raw.empty and raw['ts'].iloc[0] < raw_cutoff:
+        older, recent = _split(raw, raw_cutoff)
+        moved["hourly"] = price_store.append_frame(rollup(to_ohlc(older), 'h'), hourly_dir)
+        price_store.write_frame(recent, store_dir)
+
+    hourly_cutoff = (now - pd.Timedelta(days=hourly_days)).floor('D')
+    hourly = price_store.load_frame(hourly_dir, tiers=False)
+    if not hourly.empty and hourly['ts'].iloc[0] < hourly_cutoff:
+        older, recent = _split(hourly, hourly_cutoff)
+        moved["daily"] = price_store.append_frame(rollup(older, 'D'), daily_dir)
+        price_store.write_frame(recent, hourly_dir)
+
+
+def tier_sizes(store_dir=price_store.STORE_DIR):
+    """Row count and bytes on disk per tier."""
+    sizes = {}
+    for name, d in (("raw", store_dir), ("hourly", price_store.HOURLY_DIR), ("daily", price_store.DAILY_DIR)):
+        files = [os.path.join(d, f) for f in os.listdir(d)] if os.path.isdir(d) else []
+        sizes[name] = {"rows": price_store.row_count(d),
+                       "bytes": sum(os.path.getsize(f) for f in files if os.path.isfile(f))}
+    return sizes
+
+
+def load_ohlc(tickers=None):
+    """Daily OHLC over the whole history: the daily tier plus the hourly and raw tiers rolled up on the fly."""
+    daily = price_store.load_frame(price_store.DAILY_DIR, tiers=False)
+    hourly = price_store.load_frame(price_store.HOURLY_DIR, tiers=False)
+    raw = price_store.load_frame(tiers=False)
+    recent = pd.concat([hourly, to_ohlc(raw)], ignore_index=True) if not raw.empty else hourly
+    frame = pd.concat([daily, rollup(recent, 'D')], ignore_index=True)
+    if tickers is not None:
+        keep = ['ts'] + [c for c in frame.columns if c.rsplit(".", 1)[0] in tickers]
+        frame = frame[keep]
+    return frame
@@ -0,0 +1,186 @@
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import manifest
+import metrics
+import price_query
+
+# --- Monte Carlo risk ---
+# Daily log returns of the held tickers plus USD/ILS come from the per-ticker archive CSVs (the
+# rows of full_stocks_extended_history.csv, split by ticker). Their mean and (pairwise) covariance drive
+# correlated paths over `horizon` trading days:
+#   r = mu + z @ L.T        z ~ N(0, I) of shape (paths, horizon, assets), L = cholesky(cov)
+#   value_ils(t) = (position_usd . exp(cumsum r_stocks)) * usd_ils * exp(cumsum r_fx)
+# Paths are drawn CHUNK_PATHS at a time, each chunk from its own spawned seed, so memory stays at
+# chunk x horizon x assets floats and the result is the same with or without the process pool.
+# Reported: VaR / CVaR of the ILS loss at the horizon and percentiles of each path's max drawdown.
+# Results are cached in data_hub/risk_cache.json until the returns, holdings or settings change.
+DATA_DIR = "data_hub"
+PORTFOLIO_FILE = os.path.join(DATA_DIR, "portfolio.json")
+CACHE_FILE = os.path.join(DATA_DIR, "risk_cache.json")
+FX_COLUMN = "USD/ILS"
+DEFAULT_PATHS = 100_000
+DEFAULT_HORIZON = 21            # trading days (about a month)
+LOOKBACK_DAYS = 730             # calendar days of history behind the covariance
+CHUNK_PATHS = 5000
+CONFIDENCE = (0.95, 0.99)
+DRAWDOWN_PERCENTILES = (50, 95, 99)
+RISK_VERSION = 2                # bump when the model changes so cached results are recomputed
+
+
+def daily_returns(tickers, lookback_days=LOOKBACK_DAYS, archive_dir=price_query.ARCHIVE_DIR):
+    """(log returns, last prices) per trading day; columns are the tickers with an archive plus USD/ILS."""
+    prices = price_query.get_prices(tickers, fields=("price", "usd_ils"), source="archive", archive_dir=archive_dir)
+    if prices.empty:
+        return pd.DataFrame(), pd.Series(dtype=float)
+    start = prices['ts'].max() - pd.Timedelta(days=lookback_days)
+    prices = prices[prices['ts'] >= start]
+    # Intraday rows appended by the hourly archive update collapse into that day's last value
+    daily = prices.groupby(prices['ts'].dt.normalize()).last()
+    held = [t for t in tickers if f"{t}.price" in daily.columns]
+    fx_cols = [f"{t}.usd_ils" for t in held]
+    frame = daily[[f"{t}.price" for t in held]].set_axis(held, axis=1).ffill().dropna()
+    # USD/ILS is NaN on rows that only hold the archive's placeholder rate. Those days take the
+    # ILS=X close; days still without a rate get no FX return, and its mean and covariances come
+    # from the days with real quotes (pairwise)
+    fx = daily[fx_cols].bfill(axis=1).iloc[:, 0] if fx_cols else pd.Series(np.nan, index=daily.index)
+    if fx.isna().any():
+        fx = fx.fillna(_fx_closes(fx.index))
+    frame[FX_COLUMN] = fx.ffill().reindex(frame.index)
+    returns = np.log(frame).diff().iloc[1:]
+    if returns[FX_COLUMN].count() < 2:
+        # Not enough real quotes for a volatility: hold the rate fixed
+        returns[FX_COLUMN] = returns[FX_COLUMN].fillna(0.0)
+        frame[FX_COLUMN] = frame[FX_COLUMN].fillna(price_query.PLACEHOLDER_USD_ILS)
+    return returns, frame.iloc[-1] if not frame.empty else pd.Series(dtype=float)
+
+
+def _fx_closes(days):
+    """ILS=X daily closes on `days` from the market data cache (NaN where unavailable)."""
+    try:
+        import market_cache
+        import market_data
+        closes = market_cache.get_daily([market_data.FX_TICKER], start=days.min(), end=days.max())[0]
+        return closes[market_data.FX_TICKER].reindex(days)
+    except Exception as e:
+        logging.error(f"USD/ILS history unavailable: {e}")
+        return pd.Series(np.nan, index=days)
+
+
+def cholesky(cov):
+    """Lower Cholesky factor, with eigenvalues clipped to zero if `cov` isn't positive definite."""
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        w, v = np.linalg.eigh(cov)
+        fixed = (v * np.clip(w, 1e-12, None)) @ v.T
+        return np.linalg.cholesky(fixed + np.eye(len(cov)) * 1e-12)
+
+
+def _simulate_chunk(task):
+    mu, chol, position_usd, fx0, n_paths, horizon, seed = task
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((n_paths, horizon, len(mu)))
+    growth = np.exp(np.cumsum(mu + z @ chol.T, axis=1))
+    del z
+    values = (growth[..., :-1] @ position_usd) * fx0 * growth[..., -1]
+    start = float(position_usd.sum() * fx0)
+    loss = start - values[:, -1]
+    peak = np.maximum(np.maximum.accumulate(values, axis=1), start)
+    drawdown = (1.0 - values / peak).max(axis=1)
+    return loss, drawdown
+
+
+def simulate(returns, last, holdings, paths=DEFAULT_PATHS, horizon=DEFAULT_HORIZON, chunk=CHUNK_PATHS,
+             seed=0, workers=None):
+    """Run the Monte Carlo and summarize it (all money figures in ILS)."""
+    tickers = [c for c in returns.columns if c != FX_COLUMN]
+    mu = returns.mean().to_numpy()
+    chol = cholesky(returns.cov().to_numpy())
+    position_usd = np.array([holdings[t]['amount'] * last[t] for t in tickers], dtype=float)
+    fx0 = float(last[FX_COLUMN])
+    sizes = [min(chunk, paths - i) for i in range(0, paths, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(mu, chol, position_usd, fx0, n, horizon, s) for n, s in zip(sizes, seeds)]
+
+    with metrics.span("risk.simulate", paths=paths, horizon=horizon, workers=workers or 1):
+        if workers and workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_simulate_chunk, tasks))
+        else:
+            results = [_simulate_chunk(t) for t in tasks]
+    loss = np.concatenate([r[0] for r in results])
+    drawdown = np.concatenate([r[1] for r in results])
+
+    value = float(position_usd.sum() * fx0)
+    out = {"value_ils": value, "paths": paths, "horizon_days": horizon, "observations": len(returns),
+           "start": str(returns.index[0].date()), "end": str(returns.index[-1].date()), "var": {}, "cvar": {},
+           "drawdown_pct": {}}
+    for c in CONFIDENCE:
+        var = float(np.quantile(loss, c))
+        out["var"][f"{c:.0%}"] = var
+        out["cvar"][f"{c:.0%}"] = float(loss[loss >= var].mean())
+    for p in DRAWDOWN_PERCENTILES:
+        out["drawdown_pct"][f"p{p}"] = float(np.percentile(drawdown, p) * 100)
+    return out
+
+
+def _load_cache():
+    if not os.path.exists(CACHE_FILE):
+        return {}
+    try:
+        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def run(holdings=None, paths=DEFAULT_PATHS, horizon=DEFAULT_HORIZON, seed=0, workers=None, force=False,
+        archive_dir=price_query.ARCHIVE_DIR):
+    """Risk summary for the portfolio, recomputed only when its inputs changed (None without data)."""
+    if holdings is None:
+        with open(PORTFOLIO_FILE, 'r') as f:
+            holdings = json.load(f)
+    returns, last = daily_returns(list(holdings), archive_dir=archive_dir)
+    if len(returns) < 2 or len(returns.columns) < 2:
+        return None
+    held = {t: holdings[t]['amount'] for t in returns.columns if t != FX_COLUMN}
+    key = manifest.digest(RISK_VERSION, returns.to_numpy(), list(returns.columns), last.to_dict(), held,
+                          paths, horizon, CHUNK_PATHS, seed)
+    cache = _load_cache()
+    if not force and cache.get("key") == key:
+        return cache["result"]
+    result = simulate(returns, last, holdings, paths, horizon, seed=seed, workers=workers)
+    manifest.write(CACHE_FILE, json.dumps({"key": key, "result": result}, indent=2, sort_keys=True))
+    return result
+
+
+def print_report(result):
+    print(f"Portfolio value ₪{result['value_ils']:,.0f}, {result['paths']:,} paths over "
+          f"{result['horizon_days']} trading days ({result['observations']} daily returns, "
+          f"{result['start']} .. {result['end']})")
+    for c in result["var"]:
+        print(f"  VaR {c}: ₪{result['var'][c]:,.0f}   CVaR {c}: ₪{result['cvar'][c]:,.0f}")
+    print("  max drawdown: " + ", ".join(f"{k} {v:.1f}%" for k, v in result["drawdown_pct"].items()))
+
+
+if __name__ == "__main__":
+    metrics.start_run()
+    logging.basicConfig(filename=os.path.join(DATA_DIR, "error_log.txt"), level=logging.ERROR,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Monte Carlo VaR / CVaR for the portfolio")
+    parser.add_argument("--paths", type=int, default=DEFAULT_PATHS)
+    parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON, help="trading days")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="simulate chunks in a process pool of this size")
+    parser.add_argument("--force", action="store_true", help="ignore the cached result")
+    args = parser.parse_args()
+    result = run(paths=args.paths, horizon=args.horizon, seed=args.seed, workers=args.workers, force=args.force)
+    if result is None:
+        print("Not enough archive history for a risk estimate.")
+    else:
+        print_report(result)
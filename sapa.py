@@ -0,0 +1,197 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import namedtuple
+import metrics
+
+# --- Single-process pipeline runner ---
+# python -m sapa run  ->  archive, tracker -> report / analysis, in one interpreter.
+# The tracker's price frame is handed to the later stages in memory; a stage whose input
+# fingerprint matches the previous run (data_hub/pipeline_state.json) is skipped. The report and
+# analysis also read the CSV archive (dividends, USD/ILS, risk returns), so it is updated first
+# and its files are part of their fingerprint.
+DATA_DIR = "data_hub"
+STATE_FILE = os.path.join(DATA_DIR, "pipeline_state.json")
+PORTFOLIO_FILE = os.path.join(DATA_DIR, "portfolio.json")
+ARCHIVE_DIR = os.path.join(DATA_DIR, "price_history_archive", "individual_stocks")
+
+# fingerprint(ctx) -> str, or None for stages that must always run (they pull live data)
+Stage = namedtuple("Stage", ["name", "deps", "run", "fingerprint", "outputs"])
+
+
+def _portfolio_bytes():
+    if not os.path.exists(PORTFOLIO_FILE):
+        return b""
+    with open(PORTFOLIO_FILE, 'rb') as f:
+        return f.read()
+
+
+def frame_fingerprint(df):
+    import pandas as pd
+    if df is None or df.empty:
+        return "empty"
+    h = hashlib.sha1()
+    h.update(",".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def archive_fingerprint(archive_dir=ARCHIVE_DIR):
+    """Hash of the per-ticker archive CSVs (prices, dividends and USD/ILS), "" when there are none."""
+    if not os.path.isdir(archive_dir):
+        return ""
+    h = hashlib.sha1()
+    for name in sorted(os.listdir(archive_dir)):
+        if name.endswith("_history.csv"):
+            h.update(name.encode())
+            with open(os.path.join(archive_dir, name), 'rb') as f:
+                h.update(hashlib.sha1(f.read()).digest())
+    return h.hexdigest()
+
+
+def _fx_fallback():
+    # The report only converts at the live rate when there is no archive to take USD/ILS from
+    import market_cache
+    import market_data
+    return str(market_cache.latest_close(market_data.FX_TICKER))
+
+
+def _frame_inputs(ctx):
+    h = hashlib.sha1(_portfolio_bytes())
+    h.update(frame_fingerprint(ctx.get("frame")).encode())
+    archive = archive_fingerprint()
+    h.update(archive.encode() if archive else _fx_fallback().encode())
+    return h.hexdigest()
+
+
+def run_tracker(ctx):
+    import stock_tracker
+    ctx["frame"] = stock_tracker.main()
+
+
+def run_report(ctx):
+    import generate_report
+    generate_report.main(ctx.get("frame"))
+
+
+def run_analysis(ctx):
+    import analysis_pro
+    analysis_pro.main(ctx.get("frame"))
+
+
+def run_archive(ctx):
+    import history_logger
+    history_logger.update_csv_history()
+
+
+STAGES = [
+    Stage("archive", (), run_archive, None, ()),
+    Stage("tracker", (), run_tracker, None, ()),
+    Stage("report", ("archive", "tracker"), run_report, _frame_inputs,
+          ("README.md", os.path.join(DATA_DIR, "portfolio_performance.png"),
+           os.path.join(DATA_DIR, "snapshots", "summary.json"))),
+    Stage("analysis", ("archive", "tracker"), run_analysis, _frame_inputs,
+          ("ANALYSIS_REPORT.md", os.path.join(DATA_DIR, "predictions.png"))),
+]
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    import manifest
+    manifest.write(STATE_FILE, json.dumps(state, indent=2, sort_keys=True))
+
+
+def select_stages(names=None, stages=STAGES):
+    """Requested stages plus everything they depend on, in declaration (= dependency) order."""
+    if not names:
+        return list(stages)
+    by_name = {s.name: s for s in stages}
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise SystemExit(f"Unknown stage(s): {', '.join(unknown)}. Available: {', '.join(by_name)}")
+    wanted = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(by_name[name].deps)
+    return [s for s in stages if s.name in wanted]
+
+
+def run_pipeline(names=None, force=False, stages=STAGES):
+    state = load_state()
+    ctx = {}
+    results = []
+    status = {}
+    for stage in select_stages(names, stages):
+        blocked = [d for d in stage.deps if status.get(d) == "failed"]
+        if blocked:
+            status[stage.name] = "failed"
+            results.append((stage.name, f"blocked by {', '.join(blocked)}", 0.0))
+            continue
+
+        start = time.perf_counter()
+        fingerprint = stage.fingerprint(ctx) if stage.fingerprint else None
+        outputs_ok = all(os.path.exists(p) for p in stage.outputs)
+        if not force and fingerprint is not None and outputs_ok and state.get(stage.name) == fingerprint:
+            status[stage.name] = "skipped"
+            results.append((stage.name, "skipped (inputs unchanged)", time.perf_counter() - start))
+            continue
+
+        try:
+            with metrics.span(f"stage.{stage.name}"):
+                stage.run(ctx)
+        except Exception as e:
+            logging.error(f"Pipeline stage {stage.name} failed: {e}")
+            status[stage.name] = "failed"
+            results.append((stage.name, f"failed: {e}", time.perf_counter() - start))
+            continue
+        status[stage.name] = "ran"
+        if fingerprint is not None:
+            state[stage.name] = fingerprint
+        results.append((stage.name, "ran", time.perf_counter() - start))
+
+    save_state(state)
+    return results
+
+
+def print_timings(results, total):
+    print("\nStage timings:")
+    for name, outcome, seconds in results:
+        print(f"  {name:<10} {seconds:8.2f}s  {outcome}")
+    print(f"  {'total':<10} {total:8.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sapa", description="Portfolio tracker pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="run the archive, tracker, report and analysis stages")
+    run.add_argument("stages", nargs="*", help=f"subset of stages ({', '.join(s.name for s in STAGES)})")
+    run.add_argument("--force", action="store_true", help="ignore the previous run's fingerprints")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        start = time.perf_counter()
+        results = run_pipeline(args.stages, force=args.force)
+        print_timings(results, time.perf_counter() - start)
+        return 1 if any(outcome.startswith(("failed", "blocked")) for _, outcome, _ in results) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    metrics.start_run()
+    sys.exit(main())
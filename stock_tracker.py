@@ -1,10 +1,20 @@
-import yfinance as yf
+import argparse
+import asyncio
 import json
 import os
 from datetime import datetime
 import pytz
-import pandas as pd
 import logging
+import lazy
+import metrics
+
+pd = lazy.module("pandas")
+price_store = lazy.module("price_store")
+market_data = lazy.module("market_data")
+market_cache = lazy.module("market_cache")
+indicators = lazy.module("indicators")
+retention = lazy.module("retention")
+live_sampler = lazy.module("live_sampler")
 
 # --- Paths & Config ---
 BASE_DIR = "data_hub"
@@ -17,47 +27,87 @@ MAX_ROWS = 10000
 os.makedirs(BASE_DIR, exist_ok=True)
 logging.basicConfig(filename=LOG_FILE, level=logging.ERROR, format='%(asctime)s: %(message)s')
 
-def main():
+def load_tickers():
     if not os.path.exists(PORTFOLIO_FILE):
         with open(PORTFOLIO_FILE, 'w') as f: json.dump({"SPY": 1}, f)
     
     with open(PORTFOLIO_FILE, 'r') as f: holdings = json.load(f)
     tickers = list(holdings.keys())
     if "SPY" not in tickers: tickers.append("SPY")
+    return tickers
 
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f: history = json.load(f)
-    else:
-        history = []
+def main():
+    tickers = load_tickers()
+
+    # Columnar store (data_hub/price_store); stock_history.json is migrated on first load
+    price_store.migrate_legacy_json(HISTORY_FILE)
 
     # Backfill logic
-    if not history:
+    if price_store.row_count() == 0:
         print("Backfilling...")
-        df = yf.download(tickers, period="1y", interval="1d", progress=False)['Close']
-        df = df.ffill().bfill()
-        for dt, row in df.iterrows():
-            history.append({
-                "timestamp": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                "prices": {t: round(float(v), 2) for t, v in row.to_dict().items() if pd.notna(v)}
-            })
+        df = market_cache.get_daily(tickers, period="1y")[0].dropna(how='all')
+        df = df.ffill().bfill().round(2)
+        if price_store.append_frame(df.rename_axis('ts').reset_index()):
+            # Yahoo's daily closes are dividend-adjusted; total_return must not reinvest these dividends again
+            price_store.mark_adjusted(df.index[-1])
 
     # Live sample
     try:
-        live = yf.download(tickers, period="1d", interval="1m", progress=False)['Close']
+        live = market_data.fetch_prices(tickers, period="1d", interval="1m")[0].dropna(how='all')
         if not live.empty:
             last = live.iloc[-1]
             ts = datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
-            if not history or history[-1]['timestamp'][:16] != ts[:16]:
-                history.append({
-                    "timestamp": ts,
-                    "prices": {t: round(float(v), 2) for t, v in last.to_dict().items() if pd.notna(v)}
-                })
+            last_ts = price_store.last_timestamp()
+            if last_ts is None or last_ts.strftime("%Y-%m-%d %H:%M") != ts[:16]:
+                price_store.append_sample(ts, {t: round(float(v), 2) for t, v in last.to_dict().items() if pd.notna(v)})
     except Exception as e:
         logging.error(f"Sampling failed: {e}")
 
-    history = sorted(history, key=lambda x: x['timestamp'])[-MAX_ROWS:]
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history, f, indent=4)
+    # Tiered retention: samples older than a week become hourly bars, older than 3 months daily OHLC
+    try:
+        retention.compact(now=datetime.now(TZ))
+    except Exception as e:
+        logging.error(f"Retention compaction failed: {e}")
+
+    # JSON view kept for compatibility with older consumers
+    df = price_store.load_frame()
+    price_store.export_json(HISTORY_FILE, max_rows=MAX_ROWS, df=df)
+
+    # Streaming indicators: only the newly appended samples are fed into the persisted state
+    try:
+        indicators.sync(df)
+    except Exception as e:
+        logging.error(f"Indicator update failed: {e}")
+    return df
+
+def live(interval=None, duration=None, fake=False):
+    """Long-running sampler: polls every `interval` seconds and appends to the store in batches."""
+    tickers = load_tickers()
+    if fake:
+        # Each mode keeps its own default interval (0.1 s against the fake server, 15 s against Yahoo)
+        options = {"interval": interval} if interval else {}
+        report = asyncio.run(live_sampler.run_fake(tickers, duration=duration or 10.0, **options))
+    else:
+        price_store.migrate_legacy_json(HISTORY_FILE)
+        sampler = live_sampler.Sampler(live_sampler.YahooQuoteSource(), tickers,
+                                       interval=interval or live_sampler.DEFAULT_INTERVAL)
+        try:
+            report = asyncio.run(sampler.run(duration=duration))
+        except KeyboardInterrupt:
+            # run() flushes the buffer on cancellation before the loop shuts down
+            report = sampler.report()
+    live_sampler.print_report(report)
+    return report
 
 if __name__ == "__main__":
-    main()
+    metrics.start_run()
+    parser = argparse.ArgumentParser(description="Sample portfolio prices into the price store")
+    parser.add_argument("--live", action="store_true", help="keep polling instead of taking a single sample")
+    parser.add_argument("--interval", type=float, help="seconds between samples (default 15, 0.1 with --fake)")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds (default: run until interrupted)")
+    parser.add_argument("--fake", action="store_true", help="sample a local fake quote server instead of Yahoo")
+    args = parser.parse_args()
+    if args.live or args.fake:
+        live(args.interval, args.duration, args.fake)
+    else:
+        main()
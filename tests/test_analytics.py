@@ -0,0 +1,82 @@
+import json
+import os
+import numpy as np
+import pytest
+import analytics
+import price_store
+from conftest import ROOT
+
+HISTORY_FILE = os.path.join(ROOT, "data_hub", "stock_history.json")
+PORTFOLIO_FILE = os.path.join(ROOT, "data_hub", "portfolio.json")
+
+
+def pandas_reference(df, holdings, window=analytics.WINDOW):
+    """Full recomputation of the rolling correlation, betas and max drawdowns with pandas."""
+    tickers = analytics._tracked(df, holdings)
+    prices = df[tickers].ffill()
+    returns = prices.pct_change().where(df[tickers].notna() & prices.shift().notna()).dropna()
+    recent = returns.iloc[-window:]
+    cov = recent.cov()
+    beta = cov[analytics.BENCHMARK] / cov.loc[analytics.BENCHMARK, analytics.BENCHMARK]
+    max_dd = (1 - prices / prices.cummax()).max() * 100
+    return {"corr": recent.corr(), "beta": beta, "max_drawdown": max_dd}
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    if not (os.path.exists(HISTORY_FILE) and os.path.exists(PORTFOLIO_FILE)):
+        pytest.skip("no stock_history.json / portfolio.json")
+    df = price_store.read_history_frame(HISTORY_FILE)
+    with open(PORTFOLIO_FILE, 'r') as f:
+        holdings = json.load(f)
+    if analytics.BENCHMARK not in df.columns:
+        pytest.skip("history has no benchmark column")
+    return df, holdings
+
+
+@pytest.fixture(autouse=True)
+def scratch_dir(tmp_path, monkeypatch):
+    # save_state records its write in data_hub/manifest.json relative to the working directory
+    monkeypatch.chdir(tmp_path)
+
+
+def _assert_matches(state, df, holdings):
+    expected = pandas_reference(df, holdings)
+    corr = analytics.correlation(state)
+    np.testing.assert_allclose(corr.to_numpy(), expected["corr"].loc[corr.index, corr.columns].to_numpy(),
+                               rtol=1e-9, atol=1e-9)
+    table = analytics.table(state, holdings)
+    np.testing.assert_allclose(table['beta'].to_numpy(), expected["beta"].loc[table.index].to_numpy(),
+                               rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(table['max_drawdown'].to_numpy(),
+                               expected["max_drawdown"].loc[table.index].to_numpy(), rtol=1e-9, atol=1e-9)
+
+
+def test_streaming_state_matches_pandas(inputs, tmp_path):
+    df, holdings = inputs
+    path = str(tmp_path / "analytics_state.json")
+    state = analytics.sync(df, holdings, path=path)
+    _assert_matches(state, df, holdings)
+
+
+def test_incremental_updates_match_a_full_recompute(inputs, tmp_path):
+    df, holdings = inputs
+    path = str(tmp_path / "analytics_state.json")
+    for end in range(len(df) // 3, len(df) + 1, 37):
+        state = analytics.sync(df.iloc[:end], holdings, path=path)
+        _assert_matches(state, df.iloc[:end], holdings)
+    state = analytics.sync(df, holdings, path=path)
+    assert state["rows"] == len(df)
+    _assert_matches(state, df, holdings)
+
+
+def test_portfolio_drawdown_matches_the_value_series(inputs, tmp_path):
+    df, holdings = inputs
+    state = analytics.sync(df, holdings, path=str(tmp_path / "analytics_state.json"))
+    tickers = state["tickers"]
+    amounts = np.array([holdings[t]['amount'] if t in holdings else 0.0 for t in tickers])
+    values = np.nan_to_num(df[tickers].ffill().to_numpy()) @ amounts
+    peaks = np.maximum.accumulate(values)
+    summary = analytics.portfolio_summary(state, holdings)
+    np.testing.assert_allclose(summary["max_drawdown"], (1 - values / peaks).max() * 100, rtol=1e-9)
+    np.testing.assert_allclose(summary["drawdown"], (1 - values[-1] / peaks[-1]) * 100, rtol=1e-9)
@@ -0,0 +1,73 @@
+import asyncio
+import gzip
+import json
+import os
+import pytest
+import dashboard
+
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / dashboard.INDEX_FILE).write_text("<html>" + "<p>dashboard</p>" * 200 + "</html>", encoding="utf-8")
+    snapshots = tmp_path / dashboard.SNAPSHOT_DIR
+    os.makedirs(snapshots)
+    for name in dashboard.SNAPSHOTS:
+        doc = {"name": name, "rows": [{"ticker": "AAA", "price": 100.0 + i} for i in range(50)]}
+        (snapshots / f"{name}.json").write_text(json.dumps(doc), encoding="utf-8")
+    return tmp_path
+
+
+async def _raw(server, request):
+    """Send one request on its own connection and return (status, headers, body as received)."""
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    writer.write(request.encode("latin-1"))
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:])}
+    return int(lines[0].split()[1]), headers, body
+
+
+def _serve(root, client):
+    async def go():
+        async with dashboard.DashboardServer(port=0, root=str(root)) as server:
+            return await client(server)
+    return asyncio.run(go())
+
+
+def test_cold_then_warm(root):
+    result = _serve(root, lambda s: dashboard.measure(s.host, s.port))
+    cold, warm = result["cold"]["rows"], result["warm"]["rows"]
+    assert [r["path"] for r in cold] == ["/"] + [f"/api/{n}.json" for n in dashboard.SNAPSHOTS]
+    for r in cold:
+        assert r["status"] == 200
+        assert 0 < r["wire_bytes"] < r["bytes"]     # gzipped on the wire
+    assert os.path.getsize(root / dashboard.INDEX_FILE) == cold[0]["bytes"]
+    for r in warm:
+        assert r["status"] == 304 and r["wire_bytes"] == 0
+    assert result["warm"]["wire_bytes"] == 0
+
+
+def test_head_reports_the_get_length(root):
+    async def client(server):
+        request = "{} /api/summary.json HTTP/1.1\r\nHost: x\r\nAccept-Encoding: gzip\r\nConnection: close\r\n\r\n"
+        return await _raw(server, request.format("GET")), await _raw(server, request.format("HEAD"))
+    (get_status, get_headers, get_body), (status, headers, body) = _serve(root, client)
+    assert get_status == status == 200
+    assert headers["content-encoding"] == "gzip" and headers["etag"] == get_headers["etag"]
+    assert int(headers["content-length"]) == len(get_body) > 0
+    assert body == b""
+    with open(root / dashboard.SNAPSHOT_DIR / "summary.json", "rb") as f:
+        assert gzip.decompress(get_body) == f.read()
+
+
+def test_unknown_paths_and_methods(root):
+    async def client(server):
+        return [await _raw(server, f"{method} {path} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+                for method, path in (("GET", "/api/secret.json"), ("GET", "/../requests.jsonl"),
+                                     ("POST", "/"), ("DELETE", "/api/summary.json"))]
+    (s1, _, b1), (s2, _, _), (s3, h3, b3), (s4, _, _) = _serve(root, client)
+    assert s1 == s2 == 404 and b1 == b"not found"
+    assert s3 == s4 == 405 and h3["content-length"] == "0" and b3 == b""
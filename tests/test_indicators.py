@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pytest
+import indicators
+import price_store
+from conftest import ROOT
+
+HISTORY_FILE = os.path.join(ROOT, "data_hub", "stock_history.json")
+CHECKED = ["z_score", "ma_short", "ma_long", "rsi"]
+
+
+def pandas_reference(series):
+    """The full-history pandas computation analysis_pro used to run for every ticker."""
+    prices = series.dropna()
+    std = series.std()
+    z = (series.iloc[-1] - series.mean()) / std if std > 0 else 0
+    ma_short = prices.rolling(window=indicators.SHORT_WINDOW).mean().iloc[-1] \
+        if len(prices) >= indicators.SHORT_WINDOW else np.nan
+    ma_long = prices.rolling(window=min(len(prices), indicators.LONG_WINDOW)).mean().iloc[-1]
+    delta = series.diff()
+    gain = delta.where(delta > 0, 0).rolling(indicators.RSI_WINDOW).mean()
+    loss = -delta.where(delta < 0, 0).rolling(indicators.RSI_WINDOW).mean()
+    rs = gain / loss
+    rsi = 100 - (100 / (1 + rs.iloc[-1])) if not np.isnan(rs.iloc[-1]) else 50
+    return {"z_score": z, "ma_short": ma_short, "ma_long": ma_long, "rsi": rsi}
+
+
+@pytest.fixture(scope="module")
+def history():
+    if not os.path.exists(HISTORY_FILE):
+        pytest.skip("no stock_history.json")
+    return price_store.read_history_frame(HISTORY_FILE)
+
+
+def _assert_matches(table, prefix):
+    for ticker in table.index:
+        series = prefix[ticker]
+        if series.notna().sum() < 2:
+            continue
+        expected = pandas_reference(series)
+        for name in CHECKED:
+            np.testing.assert_allclose(table.at[ticker, name], expected[name], rtol=1e-9, atol=1e-9,
+                                       err_msg=f"{ticker} {name} after {len(prefix)} rows")
+
+
+def test_streaming_state_matches_pandas_at_every_prefix(history):
+    state = indicators.new_state()
+    tickers = [c for c in history.columns if c != 'ts']
+    for i in range(len(history)):
+        indicators.update(state, history.iloc[i:i + 1])
+        _assert_matches(indicators.state_table(state, tickers), history.iloc[:i + 1])
+
+
+def test_persisted_state_resumes(history, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "indicator_state.json")
+    half = len(history) // 2
+    indicators.sync(history.iloc[:half], path=path)
+    state = indicators.sync(history, path=path)
+    assert state["rows"] == len(history)
+    tickers = [c for c in history.columns if c != 'ts']
+    _assert_matches(indicators.state_table(state, tickers), history)
+
+
+def test_batch_table_matches_streaming_and_pandas(history):
+    state = indicators.new_state()
+    tickers = [c for c in history.columns if c != 'ts']
+    for i in range(len(history)):
+        indicators.update(state, history.iloc[i:i + 1])
+        prefix = history.iloc[:i + 1]
+        batch = indicators.compute_table(prefix)
+        streaming = indicators.state_table(state, tickers)
+        if i % 5 == 0 or i == len(history) - 1:
+            _assert_matches(batch, prefix)
+        for name in ["count"] + CHECKED:
+            np.testing.assert_allclose(batch.loc[tickers, name].to_numpy(dtype=float),
+                                       streaming.loc[tickers, name].to_numpy(dtype=float), rtol=1e-9, atol=1e-9,
+                                       err_msg=f"{name} after {i + 1} rows")
+        labels = ["reversion", "momentum", "rsi_zone"]
+        assert (indicators.classify(batch)[labels] == indicators.classify(streaming)[labels]).all().all()
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import pytest
+import live_sampler
+import price_store
+
+TICKERS = ["AAA", "BBB", "CCC"]
+
+
+@pytest.fixture(autouse=True)
+def _quiet_log(monkeypatch):
+    # Failed requests are logged; keep them out of data_hub/error_log.txt
+    monkeypatch.setattr(logging.root, "handlers", [])
+
+
+def _sample(server_opts, interval, store_dir, **run):
+    async def go():
+        async with live_sampler.FakeQuoteServer(TICKERS, seed=1, **server_opts) as server:
+            sampler = live_sampler.Sampler(live_sampler.HttpQuoteSource(server.host, server.port), TICKERS,
+                                           interval=interval, chunk_size=1, store_dir=store_dir)
+            return await sampler.run(**run), server.requests
+    return asyncio.run(go())
+
+
+def test_run_fake_reports_the_rows_it_stored(tmp_path):
+    report = asyncio.run(live_sampler.run_fake(TICKERS, duration=2.5, interval=0.1, store_dir=str(tmp_path),
+                                               latency=0.01, seed=1))
+    # Ticks 0.1 s apart share a one-second timestamp: every tick is either a row or merged into one
+    assert report["samples"] + report["merged"] == report["ticks"] >= 20
+    assert 2 <= report["samples"] <= 4
+    assert report["rows_written"] == report["samples"] == price_store.row_count(str(tmp_path))
+    assert report["requests"] == report["ticks"] * len(TICKERS)
+    assert report["errors"] == report["coalesced"] == report["backoff_skips"] == 0
+    assert 0 < report["latency_ms_p50"] <= report["latency_ms_p95"] <= report["latency_ms_max"]
+    assert report["samples_per_sec"] == pytest.approx(report["samples"] / report["elapsed"])
+
+
+def test_slow_requests_are_coalesced(tmp_path):
+    report, served = _sample({"latency": 0.3}, 0.05, str(tmp_path), max_ticks=12)
+    assert report["coalesced"] > 0
+    # A chunk is never requested again while its previous request is in flight
+    assert report["requests"] + report["coalesced"] == report["ticks"] * len(TICKERS)
+    assert served == report["requests"] < report["ticks"] * len(TICKERS)
+    assert report["latency_ms_p50"] >= 0.3 * 0.5 * 1000
+
+
+def test_failing_chunks_back_off(tmp_path):
+    report, served = _sample({"latency": 0.0, "error_rate": 1.0}, 0.05, str(tmp_path), duration=1.0)
+    # One failure puts each chunk into backoff (at least BACKOFF_BASE * 0.8 s), longer than the run
+    assert live_sampler.BACKOFF_BASE * 0.8 > 1.0
+    assert report["errors"] == report["requests"] == served == len(TICKERS)
+    assert report["backoff_skips"] + report["coalesced"] == (report["ticks"] - 1) * len(TICKERS)
+    assert report["backoff_skips"] > 0
+    assert report["samples"] == report["rows_written"] == 0
+    assert "latency_ms_p50" not in report
@@ -0,0 +1,53 @@
+import time
+from datetime import date, timedelta
+import market_cache
+
+TTL = 60
+OVERLAP = timedelta(days=market_cache.REFRESH_OVERLAP_DAYS)
+
+
+def _entry(covered_from, covered_to, age):
+    return covered_from, covered_to, time.time() - age
+
+
+def test_nothing_cached_fetches_the_request():
+    today = date.today()
+    assert market_cache._missing_ranges(None, today - timedelta(days=30), today, time.time(), TTL) == \
+        [(today - timedelta(days=30), today)]
+
+
+def test_fresh_coverage_fetches_nothing():
+    today = date.today()
+    entry = _entry(today - timedelta(days=400), today, age=0)
+    assert market_cache._missing_ranges(entry, today - timedelta(days=365), today, time.time(), TTL) == []
+
+
+def test_stale_tail_refetches_only_the_overlap():
+    today = date.today()
+    entry = _entry(today - timedelta(days=1830), today, age=TTL + 1)
+    ranges = market_cache._missing_ranges(entry, today - timedelta(days=1826), today, time.time(), TTL)
+    assert ranges == [(today - OVERLAP, today)]
+
+
+def test_head_gap_fetches_only_the_head():
+    today = date.today()
+    covered_from = today - timedelta(days=365)
+    entry = _entry(covered_from, today, age=0)
+    ranges = market_cache._missing_ranges(entry, today - timedelta(days=1826), today, time.time(), TTL)
+    assert ranges == [(today - timedelta(days=1826), covered_from - timedelta(days=1))]
+
+
+def test_head_gap_and_stale_tail_do_not_overlap():
+    today = date.today()
+    covered_from = today - timedelta(days=365)
+    entry = _entry(covered_from, today, age=TTL + 1)
+    ranges = market_cache._missing_ranges(entry, today - timedelta(days=1826), today, time.time(), TTL)
+    assert ranges == [(today - timedelta(days=1826), covered_from - timedelta(days=1)), (today - OVERLAP, today)]
+
+
+def test_request_after_coverage_keeps_it_contiguous():
+    today = date.today()
+    covered_to = today - timedelta(days=60)
+    entry = _entry(today - timedelta(days=400), covered_to, age=0)
+    ranges = market_cache._missing_ranges(entry, today - timedelta(days=10), today, time.time(), TTL)
+    assert ranges == [(covered_to + timedelta(days=1), today)]
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+import market_cache
+import market_data
+
+HEADER = "timestamp,ticker,price,dividend,pe_ratio,usd_ils\n"
+
+
+def _write_archive(directory, ticker, rows):
+    with open(directory / f"{ticker}_history.csv", 'w', encoding='utf-8') as f:
+        f.write(HEADER)
+        for ts, price, dividend, fx in rows:
+            f.write(f"{ts},{ticker},{price},{dividend},,{fx}\n")
+
+
+@pytest.fixture
+def local_source(tmp_path, monkeypatch):
+    source = tmp_path / "source"
+    source.mkdir()
+    _write_archive(source, "AAA", [("2026-03-02 00:00:00", 10.0, 0.0, 3.70),
+                                   ("2026-03-03 00:00:00", 11.0, 0.5, 3.71),
+                                   ("2026-03-04 00:00:00", 12.0, 0.0, 3.72)])
+    _write_archive(source, "BBB", [("2026-03-03 00:00:00", 20.0, 0.0, 3.71),
+                                   ("2026-03-04 00:00:00", 21.0, 0.0, 3.72)])
+    work = tmp_path / "work"
+    work.mkdir()
+    monkeypatch.chdir(work)
+    monkeypatch.setenv(market_data.BACKEND_ENV, f"local:{source}")
+    previous = market_data.set_backend(None)
+    market_cache.clear_memory()
+    yield source
+    market_data.set_backend(previous)
+    market_cache.clear_memory()
+
+
+def test_env_selects_the_local_backend(local_source):
+    backend = market_data.get_backend()
+    assert isinstance(backend, market_data.LocalBackend)
+    assert backend.root == str(local_source)
+
+
+def test_get_daily_reads_closes_dividends_and_fx(local_source):
+    symbols = ["AAA", "BBB", market_data.FX_TICKER]
+    closes, dividends = market_cache.get_daily(symbols, start="2026-03-02", end="2026-03-04")
+    days = pd.to_datetime(["2026-03-02", "2026-03-03", "2026-03-04"])
+    assert list(closes.columns) == symbols
+    assert closes.index.equals(pd.DatetimeIndex(days, name='Date'))
+    assert closes["AAA"].tolist() == [10.0, 11.0, 12.0]
+    assert pd.isna(closes.at[days[0], "BBB"]) and closes["BBB"].iloc[1:].tolist() == [20.0, 21.0]
+    assert dividends["AAA"].tolist() == [0.0, 0.5, 0.0]
+    assert dividends["BBB"].fillna(0.0).sum() == 0.0
+    assert closes[market_data.FX_TICKER].tolist() == [3.70, 3.71, 3.72]
+
+
+def test_second_request_is_served_from_the_cache(local_source):
+    market_cache.get_daily(["AAA"], start="2026-03-02", end="2026-03-04")
+    fetches = market_cache.stats["fetches"]
+    market_cache.clear_memory()
+    closes, _ = market_cache.get_daily(["AAA"], start="2026-03-02", end="2026-03-04")
+    assert market_cache.stats["fetches"] == fetches
+    assert closes["AAA"].tolist() == [10.0, 11.0, 12.0]
@@ -0,0 +1,52 @@
+import glob
+import json
+import os
+import pstats
+import subprocess
+import sys
+from conftest import ROOT
+
+WORK = """
+import metrics
+
+def before_first_span():
+    return sum(range(1000))
+
+{start}
+before_first_span()
+with metrics.span("outer", tickers=2) as s:
+    with metrics.span("inner") as inner:
+        inner.add(rows=3)
+    s.add(rows=5)
+"""
+
+
+def _run(cwd, start="", **env):
+    env = dict(os.environ, PYTHONPATH=ROOT, **env)
+    env.pop("SAPA_METRICS", None)
+    subprocess.run([sys.executable, "-c", WORK.format(start=start)], cwd=str(cwd), env=env, check=True)
+
+
+def test_importing_writes_nothing(tmp_path):
+    _run(tmp_path, SAPA_PROFILE="cprofile")
+    assert os.listdir(tmp_path) == []
+
+
+def test_start_run_appends_one_line_per_run(tmp_path):
+    _run(tmp_path, "metrics.start_run()")
+    _run(tmp_path, "metrics.start_run()")
+    with open(tmp_path / "data_hub" / "metrics.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 2
+    spans = {s["name"]: s for s in records[0]["spans"]}
+    assert spans["outer"]["rows"] == 5 and spans["outer"]["tickers"] == 2
+    assert spans["outer.inner"]["rows"] == 3
+    assert records[0]["duration_ms"] >= spans["outer"]["ms"]
+
+
+def test_profile_starts_with_the_run(tmp_path):
+    _run(tmp_path, "metrics.start_run(path='m.jsonl')", SAPA_PROFILE="cprofile")
+    assert (tmp_path / "m.jsonl").exists()
+    [profile] = glob.glob(str(tmp_path / "data_hub" / "profiles" / "*.prof"))
+    # Code that runs before the first span is in the profile
+    assert any(name == "before_first_span" for _, _, name in pstats.Stats(profile).stats)
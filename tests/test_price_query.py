@@ -0,0 +1,42 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import pytest
+import generate_report
+import price_query
+import price_store
+import valuation
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A price store under tmp_path/data_hub with uneven sampling, gaps and a ticker that starts late."""
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(3)
+    ts = pd.date_range("2024-03-01 09:00", periods=400, freq="37min")
+    ts = ts[rng.random(len(ts)) > 0.2]
+    df = pd.DataFrame({"ts": ts,
+                       "AAA": np.round(50 + rng.normal(0, 0.5, len(ts)).cumsum(), 2),
+                       "BBB": np.round(80 + rng.normal(0, 0.5, len(ts)).cumsum(), 2)})
+    df.loc[df.index[::5], "AAA"] = np.nan
+    df.loc[df.index[:40], "BBB"] = np.nan
+    price_store.append_frame(df, price_store.STORE_DIR)
+    frame = price_store.load_frame()
+    frame[["AAA", "BBB"]] = frame[["AAA", "BBB"]].ffill()
+    return frame
+
+
+def test_price_at_matches_the_frame_lookup(store):
+    tickers = ["AAA", "BBB"]
+    for when in list(store['ts'].iloc[41::17]) + [store['ts'].iloc[-1] - timedelta(days=1)]:
+        expected = valuation.value_at_or_before(store['ts'], store[tickers], when)
+        assert price_query.price_at(tickers, when) == pytest.approx(expected.to_dict())
+
+
+def test_report_lookups_match_the_frame_lookup(store):
+    tickers = ["AAA", "BBB"]
+    # Includes points before BBB's first price, where the report falls back to the frame
+    for when in list(store['ts'].iloc[::23]) + [store['ts'].iloc[0] - timedelta(days=1)]:
+        expected = valuation.value_at_or_before(store['ts'], store[tickers], when)
+        pd.testing.assert_series_equal(generate_report.prices_at(store, tickers, when), expected,
+                                       check_names=False)
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import price_store
+import retention
+
+NOW = pd.Timestamp("2024-06-30 12:00")
+
+
+@pytest.fixture(autouse=True)
+def _work_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def _samples(days=120, step="20min"):
+    ts = pd.date_range(NOW - pd.Timedelta(days=days), NOW, freq=step)
+    rng = np.random.default_rng(7)
+    data = {"ts": ts}
+    for t in ("AAA", "BBB"):
+        data[t] = np.round(100 + rng.normal(0, 1, len(ts)).cumsum(), 2)
+    df = pd.DataFrame(data)
+    df.loc[df.index[::11], "BBB"] = np.nan
+    return df
+
+
+def _tiers(tmp_path):
+    raw = str(tmp_path / "store")
+    return raw, os.path.join(raw, "hourly"), os.path.join(raw, "daily")
+
+
+def test_compaction_round_trip(tmp_path):
+    raw_dir, hourly_dir, daily_dir = _tiers(tmp_path)
+    source = _samples()
+    price_store.append_frame(source, raw_dir)
+
+    moved = retention.compact(now=NOW, store_dir=raw_dir, hourly_dir=hourly_dir, daily_dir=daily_dir)
+    assert moved["hourly"] > 0 and moved["daily"] > 0
+
+    raw = price_store.load_frame(raw_dir, tiers=False)
+    hourly = price_store.load_frame(hourly_dir, tiers=False)
+    daily = price_store.load_frame(daily_dir, tiers=False)
+    assert raw["ts"].min() >= (NOW - pd.Timedelta(days=retention.RAW_DAYS)).floor("h")
+    assert hourly["ts"].min() >= (NOW - pd.Timedelta(days=retention.HOURLY_DAYS)).floor("D")
+    assert daily["ts"].max() < hourly["ts"].min() and hourly["ts"].max() < raw["ts"].min()
+
+    # Rolling the tiers up to days gives the same bars as rolling up the untouched samples
+    recent = pd.concat([hourly, retention.to_ohlc(raw)], ignore_index=True)
+    stored = pd.concat([daily, retention.rollup(recent, "D")], ignore_index=True)
+    expected = retention.rollup(retention.to_ohlc(source), "D")
+    pd.testing.assert_frame_equal(stored.reset_index(drop=True), expected[stored.columns], check_dtype=False)
+
+    # A second run with nothing past the cutoffs moves nothing
+    again = retention.compact(now=NOW, store_dir=raw_dir, hourly_dir=hourly_dir, daily_dir=daily_dir)
+    assert again == {"hourly": 0, "daily": 0}
+
+
+def test_bars_are_stamped_at_their_last_sample(tmp_path):
+    source = _samples(days=3)
+    bars = retention.rollup(retention.to_ohlc(source), "h")
+    by_ts = source.set_index("ts")
+    for _, bar in bars.iterrows():
+        assert bar["ts"] in by_ts.index
+        assert bar["AAA.close"] == by_ts.loc[bar["ts"], "AAA"]
+        assert bar["ts"] == by_ts.index[by_ts.index.floor("h") == bar["ts"].floor("h")].max()
+
+
+def test_empty_rewrite_truncates_every_file(tmp_path):
+    raw_dir, _, _ = _tiers(tmp_path)
+    price_store.append_frame(_samples(days=1), raw_dir)
+    assert price_store.write_frame(_samples(days=0).iloc[:0], raw_dir) == 0
+
+    assert price_store.row_count(raw_dir) == 0
+    assert os.path.getsize(os.path.join(raw_dir, price_store.TS_NAME)) == 0
+    assert sorted(os.listdir(raw_dir)) == [price_store.META_NAME, price_store.TS_NAME]
+    assert price_store.load_frame(raw_dir, tiers=False).empty
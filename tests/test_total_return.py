@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+import price_store
+import total_return
+
+DAYS = pd.date_range("2025-03-03", periods=12, freq="D")
+
+
+def _series(prices, dividends):
+    """Total return series for archive rows (one per day) with the given prices and dividends."""
+    rows = pd.DataFrame({"timestamp": [d.strftime("%Y-%m-%d 23:00:00") for d in DAYS[:len(prices)]],
+                         "price": prices, "dividend": dividends, "usd_ils": 3.6})
+    return total_return.compute(rows)
+
+
+def _growth(ts, prices, series, adjusted_until):
+    df = pd.DataFrame({"ts": ts, "AAA": prices})
+    out = total_return.reinvested_prices(df, {"AAA": series}, adjusted_until)["AAA"]
+    return out.iloc[-1] / out.iloc[0]
+
+
+def test_dividend_in_the_adjusted_backfill_counts_once():
+    # Raw close 100 throughout, $2 ex-dividend on day 5: Yahoo's adjusted closes before it are 98
+    adjusted = [98.0] * 5 + [100.0] * 5
+    series = _series(adjusted + [100.0] * 2, [0.0] * 5 + [2.0] + [0.0] * 6)
+    ts = list(DAYS[:10]) + [DAYS[10] + pd.Timedelta(hours=10), DAYS[11] + pd.Timedelta(hours=10)]
+    prices = adjusted + [100.0, 100.0]
+
+    assert _growth(ts, prices, series, DAYS[9]) == pytest.approx(100 / 98)
+    # Without the boundary the adjusted rows get the dividend a second time
+    assert _growth(ts, prices, series, None) == pytest.approx(100 / 98 * 1.02)
+
+
+def test_dividend_after_the_backfill_is_reinvested():
+    # Raw quotes drop by the $2 dividend on its ex-date; reinvesting it makes the holder whole
+    raw = [100.0] * 7 + [98.0] * 5
+    series = _series(raw, [0.0] * 7 + [2.0] + [0.0] * 4)
+    ts = list(DAYS[:5]) + [d + pd.Timedelta(hours=10) for d in DAYS[5:]]
+
+    assert _growth(ts, raw, series, DAYS[4]) == pytest.approx(1.0)
+    assert series['reinvest'].iloc[-1] == pytest.approx(1 + 2 / 98)
+
+
+def test_migration_marks_the_backfilled_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ts = list(DAYS[:4]) + [DAYS[4] + pd.Timedelta(hours=9, minutes=31), DAYS[5]]
+    df = pd.DataFrame({"ts": ts, "AAA": np.arange(6.0) + 100})
+    json_file = str(tmp_path / "stock_history.json")
+    price_store.export_json(json_file, df=df)
+    store = str(tmp_path / "store")
+
+    assert price_store.migrate_legacy_json(json_file, store) == 6
+    assert price_store.adjusted_until(store) == DAYS[3]
+    # Compaction rewrites keep the marker
+    price_store.write_frame(price_store.load_frame(store, tiers=False).iloc[2:], store)
+    assert price_store.adjusted_until(store) == DAYS[3]
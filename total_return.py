@@ -0,0 +1,245 @@
+import io
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+import manifest
+import metrics
+import price_query
+
+# --- Dividend- and FX-aware total return ---
+# Built from the per-ticker archive CSVs (price, dividend, usd_ils per row). For each row:
+#   reinvest = cumprod(1 + dividend / price)          applied to the tracker's raw prices; its
+#                                                     backfilled rows are adjusted closes, so they
+#                                                     keep the factor of the last adjusted row
+#   tr_index = price / first price                    archive prices are Yahoo's dividend-adjusted
+#                                                     closes, so they already reinvest the dividends
+#   tr_ils   = tr_index * usd_ils                     the same investment measured in shekels
+# Rows holding the placeholder USD/ILS rate (price_query.PLACEHOLDER_USD_ILS) get the ILS=X close
+# of their day from the market data cache when a full recompute needs it, else the nearest real
+# archive rate. Results are cached per ticker (data_hub/total_return/<T>.csv). The archives are
+# append-only, so an update parses only the bytes added since the last run and continues the
+# cumulative products from the stored last row; a rewritten archive is recomputed from scratch.
+DATA_DIR = "data_hub"
+CACHE_DIR = os.path.join(DATA_DIR, "total_return")
+STATE_FILE = os.path.join(CACHE_DIR, "state.json")
+DEFAULT_USD_ILS = 3.65
+SERIES_VERSION = 2          # bump when the cached columns are computed differently
+SERIES_COLUMNS = ["timestamp", "price", "dividend", "usd_ils", "reinvest", "tr_index", "tr_ils"]
+
+_series = {}
+
+
+def _load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state):
+    manifest.write(STATE_FILE, json.dumps(state, indent=2, sort_keys=True))
+
+
+def _cache_path(ticker):
+    return os.path.join(CACHE_DIR, f"{ticker}.csv")
+
+
+def real_fx_history():
+    """Daily USD/ILS closes (ILS=X) through the market data cache."""
+    import market_cache
+    import market_data
+    return market_cache.get_daily([market_data.FX_TICKER], period="10y")[0][market_data.FX_TICKER].dropna()
+
+
+def _fill_fx(rows, seed, fx_history):
+    fx = rows['usd_ils'].astype(float)
+    if fx.isna().any() and fx_history is not None:
+        try:
+            history = fx_history()
+            if not history.empty:
+                days = pd.DatetimeIndex(pd.to_datetime(rows['timestamp'].str[:10]))
+                known = history.reindex(history.index.union(days.unique())).ffill().reindex(days).to_numpy()
+                fx = fx.fillna(pd.Series(known, index=fx.index))
+        except Exception as e:
+            logging.error(f"USD/ILS history unavailable, using the nearest archive rate: {e}")
+    return fx.ffill().fillna(seed.get("usd_ils", np.nan)).bfill().fillna(DEFAULT_USD_ILS).to_numpy()
+
+
+def compute(rows, seed=None, fx_history=None):
+    """Total return columns for archive rows, continuing from `seed` (the previous last row) if given.
+
+    fx_history: called (only if some rows lack a real rate) for a daily USD/ILS series to fill them."""
+    seed = seed or {}
+    price = rows['price'].to_numpy(dtype=float)
+    dividend = np.nan_to_num(rows['dividend'].to_numpy(dtype=float))
+    dates = rows['timestamp'].str[:10].to_numpy()
+
+    # The daily archive update re-records the day's dividend on every run that day; count it once
+    prev_dates = np.concatenate([[seed.get("date")], dates[:-1]])
+    prev_divs = np.concatenate([[seed.get("raw_dividend", 0.0)], dividend[:-1]])
+    paid = np.where((dates == prev_dates) & (dividend == prev_divs), 0.0, dividend)
+
+    prev_price = np.concatenate([[seed.get("price", np.nan)], price[:-1]])
+    growth = price / prev_price
+    if "price" not in seed:
+        growth[0] = 1.0
+    fx = _fill_fx(rows, seed, fx_history)
+
+    tr_index = seed.get("tr_index", 1.0) * np.cumprod(growth)
+    return pd.DataFrame({
+        "timestamp": rows['timestamp'].to_numpy(),
+        "price": price,
+        "dividend": paid,
+        "usd_ils": fx,
+        "reinvest": seed.get("reinvest", 1.0) * np.cumprod(1 + paid / price),
+        "tr_index": tr_index,
+        "tr_ils": tr_index * fx,
+    }, columns=SERIES_COLUMNS)
+
+
+def _read_rows(path, offset, header):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    if not data.strip():
+        return None, offset
+    # Only complete lines; a row still being written is picked up next time
+    end = data.rfind(b"\n") + 1
+    if end == 0:
+        return None, offset
+    rows = pd.read_csv(io.BytesIO(data[:end]), header=None, names=header.strip().split(","))
+    rows = price_query.mask_placeholder_fx(rows[rows['price'].notna()].reset_index(drop=True))
+    return rows, offset + end
+
+
+def update(ticker, archive_dir=price_query.ARCHIVE_DIR, state=None, fx_history=real_fx_history):
+    """Bring one ticker's cached series up to date with its archive. Returns the full series (or None)."""
+    path = os.path.join(archive_dir, f"{ticker}_history.csv")
+    if not os.path.exists(path):
+        return None
+    save = state is None
+    state = _load_state() if state is None else state
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline().decode('utf-8')
+
+    entry = state.get(ticker)
+    if entry is not None:
+        valid = (entry.get("version") == SERIES_VERSION and entry["header"] == header and entry["offset"] <= size
+                 and os.path.exists(_cache_path(ticker)))
+        if valid:
+            with open(path, 'rb') as f:
+                f.seek(entry["offset"] - len(entry["last_line"].encode('utf-8')))
+                valid = f.readline().decode('utf-8') == entry["last_line"]
+        if not valid:
+            entry = None
+
+    cached = _series.get(ticker)
+    if entry is not None and entry["offset"] == size:
+        if cached is None:
+            cached = pd.read_csv(_cache_path(ticker), float_precision='round_trip')
+            _series[ticker] = cached
+        return cached
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    offset = entry["offset"] if entry is not None else len(header.encode('utf-8'))
+    rows, new_offset = _read_rows(path, offset, header)
+    if rows is None or rows.empty:
+        return _series.get(ticker) if entry is not None else None
+
+    tail = compute(rows, entry["seed"] if entry is not None else None, fx_history)
+    if entry is not None:
+        tail.to_csv(_cache_path(ticker), mode='a', header=False, index=False)
+        if cached is None:
+            cached = pd.read_csv(_cache_path(ticker), float_precision='round_trip')
+        else:
+            cached = pd.concat([cached, tail], ignore_index=True)
+    else:
+        tail.to_csv(_cache_path(ticker), index=False)
+        cached = tail
+    _series[ticker] = cached
+
+    with open(path, 'rb') as f:
+        f.seek(new_offset - min(new_offset, 4096))
+        last_line = f.read(new_offset - f.tell()).rstrip(b"\n").rsplit(b"\n", 1)[-1] + b"\n"
+    last = tail.iloc[-1]
+    state[ticker] = {
+        "version": SERIES_VERSION,
+        "header": header,
+        "offset": new_offset,
+        "last_line": last_line.decode('utf-8'),
+        "seed": {"date": last['timestamp'][:10], "raw_dividend": float(rows['dividend'].fillna(0.0).iloc[-1]),
+                 "price": float(last['price']), "usd_ils": float(last['usd_ils']),
+                 "reinvest": float(last['reinvest']), "tr_index": float(last['tr_index'])},
+    }
+    if save:
+        _save_state(state)
+    return cached
+
+
+def load(tickers, archive_dir=price_query.ARCHIVE_DIR, fx_history=real_fx_history):
+    """{ticker: series} for every ticker that has an archive, updated incrementally."""
+    state = _load_state()
+    history = _memoized(fx_history)
+    with metrics.span("total_return.load", tickers=len(tickers)) as s:
+        out = {t: update(t, archive_dir, state, history) for t in tickers}
+        s.add(rows=sum(len(v) for v in out.values() if v is not None))
+    if os.path.isdir(CACHE_DIR):
+        _save_state(state)
+    return {t: s for t, s in out.items() if s is not None}
+
+
+def _memoized(fn):
+    # One USD/ILS history lookup shared by all the tickers of a load()
+    if fn is None:
+        return None
+    cache = []
+
+    def call():
+        if not cache:
+            try:
+                cache.append(fn())
+            except Exception as e:
+                logging.error(f"USD/ILS history unavailable, using the nearest archive rate: {e}")
+                cache.append(pd.Series(dtype=float))
+        return cache[0]
+    return call
+
+
+def _asof(series, column, ts):
+    """`column` of `series` at the last archive row at or before each of `ts` (NaN before the first)."""
+    keys = pd.to_datetime(series['timestamp']).to_numpy()
+    pos = np.searchsorted(keys, np.asarray(ts, dtype='datetime64[ns]'), side='right') - 1
+    values = series[column].to_numpy(dtype=float)
+    return np.where(pos >= 0, values[np.clip(pos, 0, None)], np.nan)
+
+
+def fx_rates(ts, series):
+    """Historical USD/ILS at each timestamp, from the archive rows (all tickers share the same rate)."""
+    ref = max(series.values(), key=lambda s: s['timestamp'].iloc[-1])
+    rates = pd.Series(_asof(ref, 'usd_ils', ts))
+    return rates.bfill().fillna(DEFAULT_USD_ILS).to_numpy()
+
+
+def reinvested_prices(df, series, adjusted_until=None):
+    """Prices in `df` scaled by the dividends reinvested since the first row of `df`.
+
+    df: 'ts' column plus one price column per ticker; tickers without an archive are unchanged.
+    adjusted_until: rows up to this timestamp already include their dividends (adjusted closes)."""
+    out = df.copy()
+    for t, s in series.items():
+        if t not in out.columns:
+            continue
+        factor = pd.Series(_asof(s, 'reinvest', df['ts'].to_numpy())).ffill().bfill().fillna(1.0).to_numpy()
+        if adjusted_until is not None:
+            # The factor only grows, so this holds it at its adjusted_until value for the adjusted rows
+            held = _asof(s, 'reinvest', [pd.Timestamp(adjusted_until).to_datetime64()])[0]
+            if not np.isnan(held):
+                factor = np.maximum(factor, held)
+        out[t] = out[t].to_numpy(dtype=float) * factor / factor[0]
+    return out
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+# --- Vectorized portfolio valuation ---
+# A "portfolio" is the portfolio.json structure: {ticker: {"amount": ..., "avg_price": ...}}.
+# Several named portfolios are valued at once as (timestamps x tickers) @ (tickers x portfolios).
+
+
+def holdings_matrix(portfolios, tickers, field='amount'):
+    """(tickers x portfolios) matrix of `field` values; tickers a portfolio doesn't hold are 0."""
+    names = list(portfolios)
+    matrix = np.zeros((len(tickers), len(names)))
+    pos = {t: i for i, t in enumerate(tickers)}
+    for j, name in enumerate(names):
+        for t, h in portfolios[name].items():
+            if t in pos:
+                matrix[pos[t], j] = h[field]
+    return matrix, names
+
+
+def portfolio_values(prices, portfolios):
+    """Value of every portfolio at every timestamp.
+
+    prices: wide frame (one column per ticker, any extra columns are ignored).
+    Missing prices contribute 0, like the old per-row sum over notnull values."""
+    tickers = sorted({t for p in portfolios.values() for t in p if t in prices.columns})
+    amounts, names = holdings_matrix(portfolios, tickers)
+    matrix = np.nan_to_num(prices[tickers].to_numpy(dtype=float), nan=0.0)
+    return pd.DataFrame(matrix @ amounts, index=prices.index, columns=names)
+
+
+def cost_basis(portfolios):
+    """Total invested (sum of amount * avg_price) per portfolio."""
+    return pd.Series({name: sum(h['amount'] * h['avg_price'] for h in p.values())
+                      for name, p in portfolios.items()}, dtype=float)
+
+
+def value_at_or_before(ts, values, when):
+    """Row of `values` at the last timestamp <= `when` (first row if there is none). ts must be sorted."""
+    pos = np.searchsorted(ts.to_numpy(), np.datetime64(when), side='right') - 1
+    return values.iloc[max(pos, 0)]
+
+
+def summarize(df, portfolios, lookback=pd.Timedelta(days=1)):
+    """Current value, cost basis, P&L and change over `lookback` for each portfolio.
+
+    df: frame with a sorted 'ts' column and one price column per ticker (already forward-filled)."""
+    values = portfolio_values(df, portfolios)
+    current = values.iloc[-1]
+    invested = cost_basis(portfolios).reindex(values.columns)
+    previous = value_at_or_before(df['ts'], values, df['ts'].iloc[-1] - lookback)
+    return pd.DataFrame({
+        "current_value": current,
+        "invested": invested,
+        "pnl": current - invested,
+        "pnl_pct": (current - invested) / invested * 100,
+        "previous_value": previous,
+        "change": current - previous,
+        "change_pct": (current / previous - 1) * 100,
+    }), values
+
+
+def positions(last_prices, holdings):
+    """Per-ticker P&L for one portfolio given a Series of latest prices."""
+    tickers = [t for t in holdings if t in last_prices.index]
+    amount = np.array([holdings[t]['amount'] for t in tickers], dtype=float)
+    avg_price = np.array([holdings[t]['avg_price'] for t in tickers], dtype=float)
+    price = last_prices.reindex(tickers).to_numpy(dtype=float)
+    return pd.DataFrame({
+        "amount": amount,
+        "avg_price": avg_price,
+        "price": price,
+        "value": price * amount,
+        "gain_pct": (price / avg_price - 1) * 100,
+        "gain": (price - avg_price) * amount,
+    }, index=pd.Index(tickers, name='ticker'))